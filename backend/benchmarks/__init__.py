@@ -0,0 +1,9 @@
+"""
+APIのベンチマーク
+合成データを投入したデータベースに対して、アプリをプロセス内（ASGI）またはuvicorn経由で呼び出し、
+シナリオごとのスループットとレイテンシ（p50/p95/p99）をJSONで出力します。
+
+    cd backend
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks --words 100000 --output results.json
+"""
@@ -0,0 +1,218 @@
+"""
+ベンチマークの実行（backendディレクトリで python -m benchmarks）
+
+    # SQLite、10万語、プロセス内で実行して結果を保存
+    python -m benchmarks --words 100000 --output results/base.json
+
+    # uvicorn（2ワーカー）経由で実行し、基準の結果と比較（20%以上の劣化で終了コード1）
+    python -m benchmarks --words 100000 --mode uvicorn --workers 2 --compare results/base.json
+
+    # ローカルのPostgreSQLを使う（空のデータベースなら投入する）
+    python -m benchmarks --database-url postgresql://localhost/vocadeck_bench
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = BENCHMARK_DIR.parent
+
+# uvicornの起動を待つ最大秒数
+SERVER_START_TIMEOUT = 60
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="APIのベンチマーク")
+    parser.add_argument("--words", type=int, default=10000, help="投入する単語数（1000〜1000000）")
+    parser.add_argument("--notebooks", type=int, default=10, help="単語を分配する単語帳の数")
+    parser.add_argument("--seed", type=int, default=0, help="データと負荷の乱数のシード")
+    parser.add_argument("--database-url", help="使用するデータベース（省略時はdata/以下のSQLite）")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--workers", type=int, default=1, help="uvicornのワーカー数")
+    parser.add_argument("--requests", type=int, default=500, help="シナリオごとのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=16, help="同時実行数")
+    parser.add_argument("--warmup", type=int, default=10, help="計測前に送るリクエスト数")
+    parser.add_argument("--scenarios", help="実行するシナリオ（カンマ区切り、省略時はすべて）")
+    parser.add_argument("--output", help="結果のJSONの出力先（省略時は標準出力）")
+    parser.add_argument("--compare", help="比較する基準の結果のJSON")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="劣化とみなす割合（0.2で20%%）")
+    return parser.parse_args(argv)
+
+
+def prepare_database(args) -> str:
+    """
+    データベースを用意してURLを返す
+    SQLiteは投入済みのファイルをdata/以下にキャッシュし、実行ごとに作業用のコピーを使う
+    """
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+        from benchmarks import seed
+        if not seed.is_seeded(args.words):
+            seed.seed(args.words, args.notebooks, args.seed)
+        return args.database_url
+
+    data_dir = BENCHMARK_DIR / "data"
+    data_dir.mkdir(exist_ok=True)
+    seeded_path = data_dir / f"seed_{args.words}_{args.notebooks}_{args.seed}.db"
+    if not seeded_path.exists():
+        # 別プロセスで投入する（このプロセスのエンジンは作業用のコピーに接続するため）
+        print(f"{args.words}語のデータを投入しています...", file=sys.stderr)
+        building_path = seeded_path.with_suffix(".building")
+        subprocess.run(
+            [sys.executable, "-c", f"from benchmarks.seed import seed; seed({args.words}, {args.notebooks}, {args.seed})"],
+            cwd=BACKEND_DIR,
+            env={**os.environ, "DATABASE_URL": f"sqlite:///{building_path}", "SQLITE_JOURNAL_MODE": "DELETE"},
+            check=True,
+        )
+        building_path.rename(seeded_path)
+
+    work_path = data_dir / "work.db"
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{work_path}{suffix}").unlink(missing_ok=True)
+    shutil.copyfile(seeded_path, work_path)
+    url = f"sqlite:///{work_path}"
+    os.environ["DATABASE_URL"] = url
+    # 投入後に追加されたマイグレーションを作業用のコピーに適用する
+    from benchmarks.seed import prepare_schema
+    prepare_schema()
+    return url
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_for_server(client, process):
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("uvicornが終了しました")
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("uvicornが起動しませんでした")
+
+
+async def run(args, database_url: str):
+    import httpx
+    from benchmarks.runner import run_scenario
+    from benchmarks.scenarios import SCENARIOS
+    from benchmarks.seed import load_context
+
+    selected = SCENARIOS
+    if args.scenarios:
+        names = [name.strip() for name in args.scenarios.split(",")]
+        unknown = set(names) - {scenario.name for scenario in SCENARIOS}
+        if unknown:
+            raise SystemExit(f"不明なシナリオです: {', '.join(sorted(unknown))}")
+        selected = [scenario for scenario in SCENARIOS if scenario.name in names]
+
+    process = None
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    if args.mode == "inprocess":
+        # ASGITransportはlifespanを実行しないため、マイグレーションはprepare_databaseで適用済み
+        from main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=120)
+    else:
+        port = _free_port()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+            env={**os.environ, "DATABASE_URL": database_url},
+        )
+        client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=120)
+
+    context = load_context(args.seed)
+    results = {}
+    try:
+        if process is not None:
+            await _wait_for_server(client, process)
+        for scenario in selected:
+            print(f"{scenario.name} を実行しています...", file=sys.stderr)
+            results[scenario.name] = await run_scenario(
+                client, scenario, context,
+                requests=scenario.requests or args.requests,
+                concurrency=scenario.concurrency or args.concurrency,
+                warmup=min(args.warmup, scenario.requests or args.warmup),
+                seed=args.seed,
+            )
+    finally:
+        await client.aclose()
+        if process is not None:
+            process.terminate()
+            process.wait()
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    database_url = prepare_database(args)
+    scenarios = asyncio.run(run(args, database_url))
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "database": database_url.split(":", 1)[0],
+            "mode": args.mode,
+            "workers": args.workers if args.mode == "uvicorn" else None,
+            "words": args.words,
+            "notebooks": args.notebooks,
+            "seed": args.seed,
+        },
+        "scenarios": scenarios,
+    }
+    # キーを並べ替えて出力し、コミット間でdiffを取れるようにする
+    output = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    else:
+        print(output)
+
+    for name, result in scenarios.items():
+        print(
+            f"{name:16s} {result['throughput_rps']:9.1f} req/s  p50 {result['p50_ms']:8.2f}ms  "
+            f"p95 {result['p95_ms']:8.2f}ms  p99 {result['p99_ms']:8.2f}ms  errors {result['errors']}",
+            file=sys.stderr,
+        )
+
+    if args.compare:
+        from benchmarks.runner import compare
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        lines, regressions = compare(baseline, report, args.max_regression)
+        print("\n".join(lines), file=sys.stderr)
+        if regressions:
+            print(f"性能が劣化しました: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
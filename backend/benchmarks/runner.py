@@ -0,0 +1,83 @@
+"""
+シナリオの実行と結果の集計・比較
+"""
+import asyncio
+import math
+import random
+import time
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    """最近傍法によるパーセンタイル（ソート済みのリストを渡す）"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+async def run_scenario(client, scenario, context, requests: int, concurrency: int, warmup: int, seed: int):
+    """scenarioをrequests回（同時実行数concurrency）実行し、スループットとレイテンシを返す"""
+    rng = random.Random(f"{seed}:{scenario.name}")
+    for _ in range(warmup):
+        await scenario.request(client, context, rng)
+
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await scenario.request(client, context, rng)
+                failed = response.status_code >= 400
+            except Exception:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += int(failed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    to_ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": to_ms(sum(latencies) / len(latencies)) if latencies else 0.0,
+        "p50_ms": to_ms(percentile(latencies, 0.50)),
+        "p95_ms": to_ms(percentile(latencies, 0.95)),
+        "p99_ms": to_ms(percentile(latencies, 0.99)),
+        "max_ms": to_ms(latencies[-1]) if latencies else 0.0,
+    }
+
+
+def compare(baseline: dict, current: dict, max_regression: float):
+    """
+    基準の結果と比較し、(表示用の行, 劣化したシナリオ名のリスト) を返す
+    p95が(1 + max_regression)倍を超えるか、スループットが(1 - max_regression)倍を下回ると劣化とみなす
+    """
+    lines = []
+    regressions = []
+    for key in ("database", "mode", "workers", "words", "notebooks"):
+        if baseline.get("meta", {}).get(key) != current["meta"].get(key):
+            lines.append(f"注意: 実行条件が異なります（{key}: {baseline.get('meta', {}).get(key)} -> {current['meta'].get(key)}）")
+    for name, result in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            lines.append(f"{name:16s} (基準なし)")
+            continue
+        p95_ratio = result["p95_ms"] / base["p95_ms"] if base["p95_ms"] else 1.0
+        rps_ratio = result["throughput_rps"] / base["throughput_rps"] if base["throughput_rps"] else 1.0
+        regressed = p95_ratio > 1 + max_regression or rps_ratio < 1 - max_regression
+        if regressed:
+            regressions.append(name)
+        lines.append(
+            f"{name:16s} p95 {base['p95_ms']:9.2f} -> {result['p95_ms']:9.2f} ms ({p95_ratio:5.2f}x)  "
+            f"rps {base['throughput_rps']:9.1f} -> {result['throughput_rps']:9.1f} ({rps_ratio:5.2f}x)"
+            + ("  劣化" if regressed else "")
+        )
+    return lines, regressions
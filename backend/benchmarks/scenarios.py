@@ -0,0 +1,73 @@
+"""
+ベンチマークのシナリオ
+各シナリオは (httpxのクライアント, コンテキスト, 乱数) を受け取り、1リクエストを送るコルーチンです。
+"""
+import random
+
+
+class Scenario:
+    def __init__(self, name: str, request, requests: int = None, concurrency: int = None):
+        self.name = name
+        self.request = request
+        # 省略した場合はコマンドライン引数の値を使う（重い処理は件数を少なくする）
+        self.requests = requests
+        self.concurrency = concurrency
+
+
+async def list_words(client, context, rng: random.Random):
+    notebook_id = rng.choice(context["notebook_ids"])
+    after_id = rng.randint(context["min_word_id"], context["max_word_id"])
+    return await client.get("/api/words", params={"notebook_id": notebook_id, "after_id": after_id, "limit": 100})
+
+
+async def search(client, context, rng: random.Random):
+    return await client.get("/api/words/search", params={"q": rng.choice(context["queries"])})
+
+
+async def search_short(client, context, rng: random.Random):
+    return await client.get("/api/words/search", params={"q": rng.choice(context["short_queries"])})
+
+
+async def search_japanese(client, context, rng: random.Random):
+    return await client.get("/api/words/search", params={"q": rng.choice(context["japanese_queries"])})
+
+
+async def progress(client, context, rng: random.Random):
+    word_id = rng.randint(context["min_word_id"], context["max_word_id"])
+    return await client.put(f"/api/words/{word_id}/progress", json={"correct": rng.random() < 0.7})
+
+
+async def progress_batch(client, context, rng: random.Random):
+    events = [
+        {"word_id": rng.randint(context["min_word_id"], context["max_word_id"]), "correct": rng.random() < 0.7}
+        for _ in range(50)
+    ]
+    return await client.post("/api/words/progress/batch", json={"events": events})
+
+
+async def import_words(client, context, rng: random.Random):
+    text = "\n".join(f"- bench{rng.randrange(10 ** 9)}: インポート{i}" for i in range(1000))
+    return await client.post("/api/words/import", json={"notebook_id": context["import_notebook_id"], "text": text})
+
+
+async def reset_progress(client, context, rng: random.Random):
+    notebook_id = rng.choice(context["notebook_ids"])
+    return await client.post(f"/api/notebooks/{notebook_id}/reset-progress")
+
+
+async def daily_stats(client, context, rng: random.Random):
+    return await client.get("/api/stats/daily", params={"days": 90})
+
+
+# 読み取りのシナリオを先に実行する（書き込みの影響を受けないように）
+SCENARIOS = [
+    Scenario("list_words", list_words),
+    Scenario("search", search),
+    Scenario("search_short", search_short),
+    Scenario("search_japanese", search_japanese),
+    Scenario("daily_stats", daily_stats),
+    Scenario("progress", progress),
+    Scenario("progress_batch", progress_batch, requests=100),
+    Scenario("import", import_words, requests=20, concurrency=2),
+    Scenario("reset_progress", reset_progress, requests=20, concurrency=2),
+]
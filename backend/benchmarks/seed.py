@@ -0,0 +1,152 @@
+"""
+ベンチマーク用の合成データの投入
+乱数のシードが同じなら同じデータになります。
+データベースのURLは config.settings.DATABASE_URL を使うため、インポート前に環境変数で指定してください。
+"""
+import random
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+
+import migrate
+from database import get_engine
+from models import DailyStats, Notebook, Word
+from notebook_settings import default_settings
+from notebook_stats import recompute_stats
+
+# 1回のINSERTでまとめる件数
+SEED_BATCH_SIZE = 10000
+
+# 日々の統計を作る日数
+SEED_DAILY_STATS_DAYS = 365
+
+# インポートのシナリオで使う単語帳の名前（他のシナリオの単語数に影響させないため分ける）
+IMPORT_NOTEBOOK_NAME = "bench-import"
+
+SYLLABLES = ["ka", "ki", "ku", "ke", "ko", "sa", "shi", "su", "ta", "chi", "na", "ni", "ma", "ri", "ro", "an", "el", "or", "ion", "ent", "str", "pre", "con"]
+KANA = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわん"
+
+
+def _random_word(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def _random_meaning(rng: random.Random) -> str:
+    return "".join(rng.choice(KANA) for _ in range(rng.randint(3, 8)))
+
+
+def prepare_schema():
+    """デプロイ時と同じようにマイグレーションでテーブル・インデックスを作成"""
+    migrate.upgrade(get_engine())
+
+
+def is_seeded(words: int) -> bool:
+    """指定した件数の単語が投入済みかどうか"""
+    prepare_schema()
+    with Session(get_engine()) as db:
+        return db.execute(select(func.count()).select_from(Word)).scalar_one() >= words
+
+
+def seed(words: int, notebooks: int = 10, seed: int = 0):
+    """単語帳・単語（一部は学習済み）・日々の統計を投入する"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    prepare_schema()
+
+    with Session(get_engine()) as db:
+        notebook_ids = []
+        for i in range(notebooks):
+            notebook = Notebook(name=f"bench-{i + 1}", settings=default_settings())
+            db.add(notebook)
+            db.flush()
+            notebook_ids.append(notebook.id)
+        db.add(Notebook(name=IMPORT_NOTEBOOK_NAME, settings=default_settings()))
+        db.commit()
+
+        batch = []
+        for i in range(words):
+            row = {
+                "word": _random_word(rng),
+                "meaning": _random_meaning(rng),
+                "notebook_id": notebook_ids[i % notebooks],
+                "correct_count": 0,
+                "wrong_count": 0,
+                "mastered": False,
+                "due_at": now,
+            }
+            # 3割の単語は学習済みにする
+            if rng.random() < 0.3:
+                row.update(
+                    correct_count=rng.randint(0, 20),
+                    wrong_count=rng.randint(0, 10),
+                    mastered=rng.random() < 0.3,
+                    last_studied=now - timedelta(days=rng.randint(0, 60)),
+                    due_at=now + timedelta(days=rng.randint(-30, 30)),
+                    interval_days=float(rng.randint(1, 30)),
+                    repetitions=rng.randint(1, 6),
+                )
+            batch.append(row)
+            if len(batch) >= SEED_BATCH_SIZE:
+                db.execute(insert(Word), batch)
+                db.commit()
+                batch.clear()
+        if batch:
+            db.execute(insert(Word), batch)
+
+        today = date.today()
+        daily = []
+        for offset in range(SEED_DAILY_STATS_DAYS):
+            correct, wrong = rng.randint(0, 200), rng.randint(0, 80)
+            daily.append({
+                "date": today - timedelta(days=offset),
+                "study_time_seconds": rng.randint(0, 3600),
+                "words_studied": correct + wrong,
+                "correct_count": correct,
+                "wrong_count": wrong,
+                "accuracy_rate": correct / (correct + wrong) * 100 if correct + wrong else 0.0,
+            })
+        db.execute(insert(DailyStats), daily)
+
+        recompute_stats(db)
+        db.commit()
+
+
+def _substrings(rng: random.Random, texts, min_length: int, max_length: int):
+    """各文字列から長さmin_length〜max_lengthの部分文字列を1つずつ取り出す"""
+    result = []
+    for text in texts:
+        length = min(len(text), rng.randint(min_length, max_length))
+        start = rng.randint(0, len(text) - length)
+        result.append(text[start:start + length])
+    return result
+
+
+def load_context(seed: int = 0, query_count: int = 200):
+    """
+    シナリオで使う単語帳ID・単語IDの範囲・検索語を取得
+    検索語は単語の一部（3〜5文字）、短い検索語（単語の1〜2文字）、日本語（意味の1〜4文字）の3種類
+    """
+    rng = random.Random(seed)
+    with Session(get_engine()) as db:
+        notebook_ids = list(
+            db.execute(select(Notebook.id).where(Notebook.name != IMPORT_NOTEBOOK_NAME).order_by(Notebook.id)).scalars()
+        )
+        import_notebook_id = db.execute(
+            select(Notebook.id).where(Notebook.name == IMPORT_NOTEBOOK_NAME)
+        ).scalars().first()
+        min_id, max_id = db.execute(select(func.min(Word.id), func.max(Word.id))).one()
+        sample_ids = [rng.randint(min_id, max_id) for _ in range(query_count)]
+        samples = db.execute(select(Word.word, Word.meaning).where(Word.id.in_(sample_ids))).all()
+
+    words = [word for word, _ in samples]
+    meanings = [meaning for _, meaning in samples]
+    return {
+        "notebook_ids": notebook_ids,
+        "import_notebook_id": import_notebook_id,
+        "min_word_id": min_id,
+        "max_word_id": max_id,
+        "queries": _substrings(rng, words, 3, 5),
+        "short_queries": _substrings(rng, words, 1, 2),
+        "japanese_queries": _substrings(rng, meanings, 1, 4),
+    }
@@ -0,0 +1,252 @@
+"""
+レスポンスキャッシュ
+単語帳・設定などの読み取り結果をJSONのバイト列としてキャッシュし、ETagによる304応答にも対応します。
+書き込み側はinvalidate_on_commitでキーを登録しておき、コミット後に無効化します。
+
+無効化のたびにキーの世代（generation）を1つ進め、保存は読み取り開始時と世代が同じ場合だけ行います。
+コミット前に読み取ったリクエストが、無効化の後に古い内容を保存してTTLの間返し続けることを防ぎます。
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config import settings
+
+
+class CachedResponse:
+    def __init__(self, body: bytes, etag: str):
+        self.body = body
+        self.etag = etag
+
+    @classmethod
+    def from_data(cls, data):
+        body = json.dumps(jsonable_encoder(data), ensure_ascii=False, separators=(",", ":")).encode()
+        return cls(body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"')
+
+
+class MemoryCacheBackend:
+    """プロセス内のLRUキャッシュ"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def generation(self, key: str) -> int:
+        with self._lock:
+            return self._generations.get(key, 0)
+
+    def set(self, key: str, value, ttl: float, generation: int = 0):
+        """世代がgenerationのままの場合だけ保存"""
+        with self._lock:
+            if self._generations.get(key, 0) != generation:
+                return
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """同一ホストの複数ワーカーで共有するSQLiteファイルのキャッシュ"""
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, body BLOB NOT NULL, etag TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache_generations ("
+            "key TEXT PRIMARY KEY, generation INTEGER NOT NULL)"
+        )
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag FROM response_cache WHERE key = ? AND expires_at >= ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE response_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return CachedResponse(row[0], row[1])
+
+    def generation(self, key: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT generation FROM response_cache_generations WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row is not None else 0
+
+    def set(self, key: str, value, ttl: float, generation: int = 0):
+        """世代がgenerationのままの場合だけ保存（他のワーカーの無効化とも1文で比較する）"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, body, etag, expires_at, accessed_at) "
+                "SELECT ?, ?, ?, ?, ? WHERE COALESCE("
+                "(SELECT generation FROM response_cache_generations WHERE key = ?), 0) = ?",
+                (key, value.body, value.etag, now + ttl, now, key, generation),
+            )
+            # 上限を超えた分を最終アクセスが古い順に削除
+            self._conn.execute(
+                "DELETE FROM response_cache WHERE key IN ("
+                "SELECT key FROM response_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def delete(self, *keys: str):
+        with self._lock:
+            # 先に世代を進めるので、削除との間に保存しようとしたリクエストも世代の比較で弾かれる
+            self._conn.executemany(
+                "INSERT INTO response_cache_generations (key, generation) VALUES (?, 1) "
+                "ON CONFLICT (key) DO UPDATE SET generation = generation + 1",
+                [(key,) for key in keys],
+            )
+            self._conn.executemany("DELETE FROM response_cache WHERE key = ?", [(key,) for key in keys])
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name: str, amount: int = 1):
+        # 同期エンドポイントはスレッドプールで並行に動くため、カウンタの加算はロックする
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def respond(self, request: Request, key: str, build: Callable[[], object]) -> Response:
+        """キャッシュがあればそれを、なければbuild()の結果をJSONで返す（If-None-Match一致時は304）"""
+        cached = self.backend.get(key)
+        if cached is None:
+            self._count("misses")
+            # build()で読み取る前の世代。読み取り中に無効化されたら保存しない
+            generation = self.backend.generation(key)
+            cached = CachedResponse.from_data(build())
+            self.backend.set(key, cached, self.ttl, generation)
+        else:
+            self._count("hits")
+
+        headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), cached.etag):
+            self._count("not_modified")
+            return Response(status_code=304, headers=headers)
+        return Response(content=cached.body, media_type="application/json", headers=headers)
+
+    def invalidate(self, *keys: str):
+        self._count("invalidations", len(keys))
+        self.backend.delete(*keys)
+
+    def stats(self):
+        with self._lock:
+            hits, misses, not_modified, invalidations = self.hits, self.misses, self.not_modified, self.invalidations
+        lookups = hits + misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": (hits / lookups) if lookups else 0.0,
+            "not_modified": not_modified,
+            "invalidations": invalidations,
+        }
+
+
+def _create_backend():
+    if settings.CACHE_BACKEND == "sqlite":
+        return SQLiteCacheBackend(settings.CACHE_SQLITE_PATH, settings.CACHE_MAX_ENTRIES)
+    return MemoryCacheBackend(settings.CACHE_MAX_ENTRIES)
+
+
+response_cache = ResponseCache(_create_backend(), settings.CACHE_TTL_SECONDS)
+
+
+# キャッシュキー
+NOTEBOOKS_KEY = "notebooks"
+
+
+def notebook_key(notebook_id: int) -> str:
+    return f"notebook:{notebook_id}"
+
+
+def notebook_settings_key(notebook_id: int) -> str:
+    return f"notebook-settings:{notebook_id}"
+
+
+def invalidate_on_commit(db: Session, *keys: str):
+    """コミット成功後に無効化するキーを登録（ロールバック時は破棄）"""
+    db.info.setdefault("cache_invalidations", set()).update(keys)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session):
+    keys = session.info.pop("cache_invalidations", None)
+    if keys:
+        response_cache.invalidate(*keys)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session):
+    session.info.pop("cache_invalidations", None)
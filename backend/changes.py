@@ -0,0 +1,158 @@
+"""
+単語帳ごとの変更バージョン（差分同期）
+単語を変更するトランザクションは、最初に単語帳のversionを1つ進めて（単語帳の行がロックされる）、
+変更した単語のversionにその値を設定します。単語帳から削除・移動した単語はword_tombstonesに
+そのときのバージョンを残すため、GET /api/notebooks/{id}/changes?since=<version> では
+sinceより後に変更された単語と削除された単語のIDだけを返せます。
+
+単語帳のバージョンは単語の行を読む前に、単語帳のid順に進める（ロックの順序を揃えてデッドロックを防ぐ）。
+単語IDしか分からない場合は bump_word_versions で、単語の単語帳をサブクエリで求めて進める。
+削除中（deleted_at が設定済み）の単語帳のバージョンは進めないため、その単語帳の単語は変更できません。
+バージョンを進めたトランザクションがコミットするまで次のトランザクションは待つため、
+コミット済みのバージョン以下の変更はすべて読み出せる状態になっています。
+"""
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import DateTime, case, literal, or_, select, update
+from sqlalchemy.orm import Session
+
+from database import dialect_insert
+from models import Notebook, Word, WordTombstone
+
+
+def bump_versions(db: Session, notebook_ids: Iterable[int], *conditions) -> Dict[int, int]:
+    """
+    単語帳のバージョンを1つずつ進め、{notebook_id: 新しいバージョン} を返す
+    存在しない・削除中の単語帳とconditions（単語帳の追加の条件）に一致しない単語帳は含まない
+    """
+    notebooks = Notebook.__table__
+    conditions = (notebooks.c.deleted_at.is_(None), *conditions)
+    returning = db.get_bind().dialect.update_returning
+    versions = {}
+    for notebook_id in sorted(set(notebook_ids)):
+        stmt = (
+            update(notebooks)
+            .where(notebooks.c.id == notebook_id, *conditions)
+            .values(version=notebooks.c.version + 1)
+        )
+        if returning:
+            version = db.execute(stmt.returning(notebooks.c.version)).scalar()
+        elif db.execute(stmt).rowcount:
+            version = db.execute(select(notebooks.c.version).where(notebooks.c.id == notebook_id)).scalar()
+        else:
+            version = None
+        if version is not None:
+            versions[notebook_id] = version
+    return versions
+
+
+def bump_version(db: Session, notebook_id: int, *conditions) -> Optional[int]:
+    """単語帳のバージョンを1つ進める（存在しない・削除中・conditionsに一致しない単語帳はNone）"""
+    return bump_versions(db, [notebook_id], *conditions).get(notebook_id)
+
+
+def bump_word_versions(db: Session, word_ids: Iterable[int], notebook_ids: Iterable[int] = ()) -> Dict[int, int]:
+    """
+    単語が属する単語帳（とnotebook_idsの単語帳）のバージョンを、単語を読み込まずに進める
+    {notebook_id: 新しいバージョン} を返す（存在しない単語・単語帳と削除中の単語帳は無視）
+    単語帳の行はid順にロックしてから更新する（FOR UPDATEはSQLiteでは出力されない）
+    """
+    notebooks = Notebook.__table__
+    words = Word.__table__
+    word_ids = list(set(word_ids))
+    notebook_ids = list(set(notebook_ids))
+    if not word_ids and not notebook_ids:
+        return {}
+    word_notebooks = select(words.c.notebook_id).where(words.c.id.in_(word_ids))
+    if not db.get_bind().dialect.update_returning:
+        return bump_versions(db, [*db.execute(word_notebooks).scalars(), *notebook_ids])
+    targets = (
+        select(notebooks.c.id)
+        .where(
+            or_(notebooks.c.id.in_(word_notebooks), notebooks.c.id.in_(notebook_ids)),
+            notebooks.c.deleted_at.is_(None),
+        )
+        .order_by(notebooks.c.id)
+        .with_for_update()
+    )
+    stmt = (
+        update(notebooks)
+        .where(notebooks.c.id.in_(targets))
+        .values(version=notebooks.c.version + 1)
+        .returning(notebooks.c.id, notebooks.c.version)
+    )
+    return dict(db.execute(stmt).all())
+
+
+def version_for(versions: Dict[int, int]):
+    """複数の単語帳の単語をまとめて更新するときの、単語ごとのバージョンの式"""
+    return case(versions, value=Word.__table__.c.notebook_id)
+
+
+def _tombstone_upsert(db: Session):
+    stmt = dialect_insert(db, WordTombstone)
+    tombstones = WordTombstone.__table__.c
+    return stmt, {
+        "index_elements": [tombstones.notebook_id, tombstones.word_id],
+        "set_": {"version": stmt.excluded.version, "deleted_at": stmt.excluded.deleted_at},
+    }
+
+
+def add_tombstones(db: Session, notebook_id: int, word_ids: Iterable[int], version: int):
+    """削除した単語を記録（同じ単語が以前に削除されていればバージョンを更新）"""
+    rows = [
+        {"notebook_id": notebook_id, "word_id": word_id, "version": version, "deleted_at": datetime.now()}
+        for word_id in word_ids
+    ]
+    if rows:
+        stmt, conflict = _tombstone_upsert(db)
+        db.execute(stmt.on_conflict_do_update(**conflict), rows)
+
+
+def add_tombstones_where(db: Session, versions: Dict[int, int], *conditions):
+    """条件に一致する単語を、それぞれの単語帳のバージョンで削除済みとして記録（単語を読み込まずに1文で行う）"""
+    if not versions:
+        return
+    words = Word.__table__.c
+    stmt, conflict = _tombstone_upsert(db)
+    stmt = stmt.from_select(
+        ["notebook_id", "word_id", "version", "deleted_at"],
+        select(
+            words.notebook_id, words.id, version_for(versions), literal(datetime.now(), DateTime)
+        ).where(*conditions),
+    )
+    db.execute(stmt.on_conflict_do_update(**conflict))
+
+
+def load_changes(db: Session, notebook_id: int, since: int, version: int) -> dict:
+    """
+    単語帳のsinceより後、version以下の変更
+    sinceが0以下または現在のバージョンより大きい場合（初回・別のデータベースのバージョン）は全件を返す
+    """
+    changes = {"notebook_id": notebook_id, "version": version, "full": since <= 0 or since > version}
+    words = select(Word).where(Word.notebook_id == notebook_id, Word.version <= version)
+    if changes["full"]:
+        return {**changes, "words": db.execute(words.order_by(Word.id)).scalars().all(), "deleted": []}
+    if since == version:
+        return {**changes, "words": [], "deleted": []}
+
+    changes["words"] = db.execute(
+        words.where(Word.version > since).order_by(Word.version, Word.id)
+    ).scalars().all()
+    # 削除後に戻された（移動で戻ってきた）単語は、変更された単語として返す
+    changed_ids = {word.id for word in changes["words"]}
+    changes["deleted"] = [
+        word_id
+        for word_id in db.execute(
+            select(WordTombstone.word_id)
+            .where(
+                WordTombstone.notebook_id == notebook_id,
+                WordTombstone.version > since,
+                WordTombstone.version <= version,
+            )
+            .order_by(WordTombstone.version, WordTombstone.word_id)
+        ).scalars()
+        if word_id not in changed_ids
+    ]
+    return changes
@@ -18,6 +18,52 @@ class Settings:
     # 本番環境かどうか
     ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
     
+    # 起動時にマイグレーションを実行するかどうか
+    # 本番環境ではデプロイ時（Procfileのrelease）に python migrate.py で1回だけ実行するため、デフォルトで無効
+    AUTO_MIGRATE = os.getenv(
+        "AUTO_MIGRATE", "false" if ENVIRONMENT == "production" else "true"
+    ).lower() in ("1", "true", "yes")
+    
+    # コネクションプール設定（同期・非同期のエンジンそれぞれに適用）
+    # DB_POOL_RECYCLE: 接続を作り直すまでの秒数（-1で無効）
+    # DB_POOL_PRE_PING: 接続を貸し出す前に疎通確認する（切断された接続を使わない）
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+    
+    # SQLiteの接続ごとに設定するPRAGMA
+    # WALモードでは読み取りと書き込みが互いをブロックしない
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    # 負の値はKiB単位（-65536で64MiB）
+    SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+    
+    # この時間（ミリ秒）以上かかったSQLをパラメータ付きでログに出す（0で無効）
+    SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+    
+    # ログ設定
+    # LOG_LEVEL: DEBUG / INFO / WARNING / ERROR
+    # LOG_DEBUG_SAMPLE_RATE: DEBUGレベルのログを出力する割合（0〜1）
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+    
+    # 回答の履歴（review_log）を日ごとの集計（review_daily）にまとめるまでの日数
+    REVIEW_LOG_RETENTION_DAYS = int(os.getenv("REVIEW_LOG_RETENTION_DAYS", "30"))
+    
+    # バックグラウンドで単語帳を削除するときに1回のトランザクションで削除する単語数
+    NOTEBOOK_DELETE_CHUNK_SIZE = int(os.getenv("NOTEBOOK_DELETE_CHUNK_SIZE", "5000"))
+    
+    # レスポンスキャッシュ設定
+    # CACHE_BACKEND: memory（プロセス内）または sqlite（同一ホストの複数ワーカーで共有）
+    CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+    CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+    CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+    CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "./cache.db")
+    
     @classmethod
     def is_production(cls):
         return cls.ENVIRONMENT == "production"
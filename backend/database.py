@@ -1,6 +1,13 @@
-from sqlalchemy import create_engine
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from config import settings
 
 # 設定からデータベースURLを取得
@@ -11,19 +18,280 @@ connect_args = {}
 if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
     connect_args = {"check_same_thread": False}
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args=connect_args
-)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class PoolMetrics:
+    """コネクションプールの貸し出し回数・待ち時間などを記録する"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += int(timed_out)
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self, pool):
+        with self._lock:
+            result = {
+                "pool": type(pool).__name__,
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": self.wait_seconds_total,
+                "wait_seconds_max": self.wait_seconds_max,
+                "wait_seconds_avg": (self.wait_seconds_total / self.checkouts) if self.checkouts else 0.0,
+            }
+        if isinstance(pool, QueuePool):
+            result.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=pool.overflow(),
+            )
+        return result
+
+
+class _MeteredPoolMixin:
+    """プールから接続を取り出すまでの待ち時間を計測する"""
+
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except TimeoutError:
+            self.metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+
+class MeteredQueuePool(_MeteredPoolMixin, QueuePool):
+    pass
+
+
+class MeteredAsyncQueuePool(_MeteredPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _pool_args(url: str, poolclass):
+    """設定に応じたプールの引数（インメモリのSQLiteはSQLAlchemyのデフォルトのまま）"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "poolclass": poolclass,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def _write_pool_args(url: str, poolclass):
+    """
+    書き込み用のプールの引数（SQLiteのファイルのみ。それ以外はNoneで、読み取りと同じエンジンを使う）
+    SQLiteは同時に1つしか書き込めないため、書き込み用の接続を1つにしてプールの待ち行列で順番に書き込む。
+    busy_timeoutのポーリングで待つと、待っている接続が多いほど後から来た接続に追い越されて待ち時間が延びる
+    """
+    args = _pool_args(url, poolclass)
+    if make_url(url).get_backend_name() != "sqlite" or not args:
+        return None
+    return {**args, "pool_size": 1, "max_overflow": 0}
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout = {settings.SQLITE_BUSY_TIMEOUT_MS:d}")
+        cursor.execute(f"PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size = {settings.SQLITE_MMAP_SIZE:d}")
+        cursor.execute(f"PRAGMA cache_size = {settings.SQLITE_CACHE_SIZE:d}")
+        # 外部キー制約（単語帳の削除時のON DELETE CASCADE）はSQLiteでは接続ごとに有効にする必要がある
+        cursor.execute("PRAGMA foreign_keys = ON")
+    finally:
+        cursor.close()
+    # ドライバ（sqlite3 / aiosqlite）にBEGINを発行させず、_begin_sqlite_transactionで発行する
+    dbapi_connection.isolation_level = None
+
+
+# 書き込み用のセッションの実行オプション（SQLiteではトランザクションをBEGIN IMMEDIATEで始める）
+WRITE_EXECUTION_OPTIONS = {"sqlite_begin": "IMMEDIATE"}
+
+
+def _begin_sqlite_transaction(connection):
+    """
+    トランザクションを開始する（書き込み用の接続ではBEGIN IMMEDIATE）
+    BEGIN（DEFERRED）で読み取ってから書き込むと、他の接続が先に書き込んでいた場合は
+    ロックの昇格がbusy_timeoutを待たずに「database is locked」で失敗するため、書き込みは最初にロックを取る
+    """
+    mode = connection.get_execution_options().get("sqlite_begin", "DEFERRED")
+    connection.exec_driver_sql(f"BEGIN {mode}")
+
+
+def _instrument(sync_engine, metrics: PoolMetrics):
+    """接続の作成時にPRAGMAを設定し、プールのイベントを記録する"""
+    if sync_engine.dialect.name == "sqlite":
+        event.listen(sync_engine, "connect", _set_sqlite_pragmas)
+        event.listen(sync_engine, "begin", _begin_sqlite_transaction)
+    event.listen(sync_engine, "connect", lambda *args: metrics.count("connects"))
+    event.listen(sync_engine, "invalidate", lambda *args: metrics.count("invalidations"))
+    if isinstance(sync_engine.pool, _MeteredPoolMixin):
+        sync_engine.pool.metrics = metrics
+
+
+pool_metrics = PoolMetrics()
+async_pool_metrics = PoolMetrics()
+write_pool_metrics = PoolMetrics()
+async_write_pool_metrics = PoolMetrics()
+
+# 非同期ドライバ（SQLiteはaiosqlite、PostgreSQLはasyncpg）
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+def to_async_url(url: str):
+    """同期ドライバのURLを非同期ドライバのURLに変換"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"非同期接続に対応していないデータベースです: {backend}")
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+# エンジンは最初に使われたときに作成する（インポートだけでは接続・ドライバの読み込みをしない）
+_engine = None
+_async_engine = None
+_write_engine = None
+_async_write_engine = None
+_engine_lock = threading.Lock()
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+WriteSessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+# コミット後に属性を再読み込みしない（非同期では遅延ロードできないため）
+AsyncSessionLocal = async_sessionmaker(class_=AsyncSession, autoflush=False, expire_on_commit=False)
+AsyncWriteSessionLocal = async_sessionmaker(class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+def get_engine():
+    """同期エンジンを返す（初回に作成）"""
+    global _engine, _write_engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine(
+                    SQLALCHEMY_DATABASE_URL,
+                    connect_args=connect_args,
+                    **_pool_args(SQLALCHEMY_DATABASE_URL, MeteredQueuePool)
+                )
+                _instrument(engine, pool_metrics)
+                write_engine = engine
+                write_args = _write_pool_args(SQLALCHEMY_DATABASE_URL, MeteredQueuePool)
+                if write_args is not None:
+                    write_engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args, **write_args)
+                    _instrument(write_engine, write_pool_metrics)
+                    _write_engine = write_engine
+                SessionLocal.configure(bind=engine)
+                WriteSessionLocal.configure(bind=write_engine.execution_options(**WRITE_EXECUTION_OPTIONS))
+                _engine = engine
+    return _engine
+
+def get_async_engine():
+    """非同期エンジンを返す（初回に作成）"""
+    global _async_engine, _async_write_engine
+    if _async_engine is None:
+        with _engine_lock:
+            if _async_engine is None:
+                # aiosqliteはファイルのデータベースでもデフォルトでは接続をプールしないため、プールを指定する
+                engine = create_async_engine(
+                    to_async_url(SQLALCHEMY_DATABASE_URL),
+                    **_pool_args(SQLALCHEMY_DATABASE_URL, MeteredAsyncQueuePool)
+                )
+                _instrument(engine.sync_engine, async_pool_metrics)
+                write_engine = engine
+                write_args = _write_pool_args(SQLALCHEMY_DATABASE_URL, MeteredAsyncQueuePool)
+                if write_args is not None:
+                    write_engine = create_async_engine(to_async_url(SQLALCHEMY_DATABASE_URL), **write_args)
+                    _instrument(write_engine.sync_engine, async_write_pool_metrics)
+                    _async_write_engine = write_engine
+                AsyncSessionLocal.configure(bind=engine)
+                AsyncWriteSessionLocal.configure(bind=write_engine.execution_options(**WRITE_EXECUTION_OPTIONS))
+                _async_engine = engine
+    return _async_engine
+
+async def dispose_engines():
+    """作成済みのエンジンの接続をすべて閉じる（アプリの終了時）"""
+    for engine in (_async_engine, _async_write_engine):
+        if engine is not None:
+            await engine.dispose()
+    for engine in (_engine, _write_engine):
+        if engine is not None:
+            engine.dispose()
+
+def pool_status():
+    """作成済みのエンジンごとのプールの状態と計測値"""
+    status = {}
+    if _engine is not None:
+        status["sync"] = pool_metrics.snapshot(_engine.pool)
+    if _async_engine is not None:
+        status["async"] = async_pool_metrics.snapshot(_async_engine.sync_engine.pool)
+    if _write_engine is not None:
+        status["sync_write"] = write_pool_metrics.snapshot(_write_engine.pool)
+    if _async_write_engine is not None:
+        status["async_write"] = async_write_pool_metrics.snapshot(_async_write_engine.sync_engine.pool)
+    return status
 
 Base = declarative_base()
 
+def dialect_insert(db, model):
+    """
+    ON CONFLICT（upsert）に対応したINSERT文を返す
+    SQLiteとPostgreSQLのみ対応
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
 def get_db():
+    get_engine()
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+def get_write_db():
+    """書き込むエンドポイント用のセッション"""
+    get_engine()
+    db = WriteSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    get_async_engine()
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_write_db():
+    """書き込むエンドポイント用の非同期セッション"""
+    get_async_engine()
+    async with AsyncWriteSessionLocal() as db:
+        yield db
+
@@ -0,0 +1,198 @@
+"""
+デッキ（学習する単語の並び）
+単語帳の設定（exclude_mastered・default_order・default_direction）をサーバー側で適用し、
+学習する単語だけをカーソルで1ページずつ返します。
+
+- 順番どおり（sequential）: 単語のid順（(notebook_id, id) インデックスの範囲スキャン）
+- ランダム（random）: shuffle_key（単語を追加したときに決めた乱数）の範囲を、1つに数語が入る程度の
+  バケツに分け、シードから決めた順番でバケツを読む。バケツ内は (shuffle_key, id) 順で、ページ内の順番も
+  シードで並べ替えるため、シードが違えば並び順全体が変わる（同じ並びになるのはバケツ内の数語だけ）。
+  ORDER BY random() のように単語帳の全単語を並べ替えず、(notebook_id, shuffle_key, id) インデックスの
+  範囲をまとめて読む
+- 未習得のみ（exclude_mastered）: mastered = false の部分インデックスを使う
+
+カーソルは最後に返した単語の位置なので、ページの間に単語が追加・削除されても同じ単語を2回返さない。
+"""
+import base64
+import json
+import random
+from typing import Optional
+
+from sqlalchemy import and_, false, select, union_all
+from sqlalchemy.orm import Session
+
+from models import SHUFFLE_KEY_RANGE, NotebookStats, Word
+
+DECK_DEFAULT_LIMIT = 50
+DECK_MAX_LIMIT = 500
+
+# ランダム順で1つのバケツに入る単語数の目安と、バケツの数の上限（2のDECK_MAX_BUCKET_BITS乗）
+DECK_BUCKET_WORDS = 8
+DECK_MAX_BUCKET_BITS = 20
+SHUFFLE_KEY_BITS = SHUFFLE_KEY_RANGE.bit_length() - 1
+
+
+def clamp_limit(limit: int) -> int:
+    return max(1, min(limit, DECK_MAX_LIMIT))
+
+
+def new_seed() -> int:
+    return random.randrange(SHUFFLE_KEY_RANGE)
+
+
+def encode_cursor(order: str, word: Word, seed: Optional[int] = None, bits: int = 0, bucket_position: int = 0) -> str:
+    """最後に返した単語の位置をURLセーフな不透明カーソルに変換"""
+    if order == "sequential":
+        position = [order, word.id]
+    else:
+        position = [order, seed, bits, bucket_position, word.shuffle_key, word.id]
+    raw = json.dumps(position, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """
+    カーソルを (order, seed, 位置) に戻す（不正な場合はValueError）
+    位置は順番どおりならid、ランダムなら (バケツの数のbits, バケツの位置, shuffle_key, id)
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if position[0] == "sequential" and len(position) == 2:
+            return "sequential", None, int(position[1])
+        if position[0] == "random" and len(position) == 6:
+            bits, bucket_position = int(position[2]), int(position[3])
+            if 0 <= bits <= DECK_MAX_BUCKET_BITS and 0 <= bucket_position < 1 << bits:
+                return "random", int(position[1]), (bits, bucket_position, int(position[4]), int(position[5]))
+    except (ValueError, TypeError, IndexError, KeyError) as e:
+        raise ValueError("invalid cursor") from e
+    raise ValueError("invalid cursor")
+
+
+def _deck_query(notebook_id: int, exclude_mastered: bool):
+    query = select(Word).where(Word.notebook_id == notebook_id)
+    if exclude_mastered:
+        # 部分インデックスの条件（mastered = false）と同じ式にする
+        query = query.where(Word.mastered == false())
+    return query
+
+
+def _sequential_page(db: Session, query, after: Optional[int], limit: int):
+    if after is not None:
+        query = query.where(Word.id > after)
+    return db.execute(query.order_by(Word.id).limit(limit)).scalars().all()
+
+
+def _bucket_bits(db: Session, notebook_id: int, exclude_mastered: bool) -> int:
+    """単語数（集計）から、1つのバケツにDECK_BUCKET_WORDS語程度が入るバケツの数（2のbits乗）を決める"""
+    stats = db.execute(
+        select(NotebookStats.word_count, NotebookStats.mastered_count).where(NotebookStats.notebook_id == notebook_id)
+    ).first()
+    count = 0
+    if stats is not None:
+        count = stats.word_count - (stats.mastered_count if exclude_mastered else 0)
+    return min(DECK_MAX_BUCKET_BITS, (max(count, 0) // DECK_BUCKET_WORDS).bit_length())
+
+
+def _bucket_order(seed: int, bits: int):
+    """
+    バケツの位置からバケツの番号を返す関数（シードごとの 0〜2**bits-1 の並べ替え）
+    奇数の乗算・加算とxorshiftはいずれも2**bitsを法とする全単射なので、全バケツを1回ずつ読む
+    """
+    rng = random.Random(seed)
+    mask = (1 << bits) - 1
+    rounds = [(rng.getrandbits(bits) | 1, rng.getrandbits(bits)) for _ in range(2)]
+    shift = max(1, bits // 2)
+
+    def bucket_at(position: int) -> int:
+        value = position
+        for multiplier, offset in rounds:
+            value = (value * multiplier + offset) & mask
+            value ^= value >> shift
+        return value
+
+    return bucket_at
+
+
+def _random_page(db: Session, query, seed: int, bits: int, after, limit: int):
+    """
+    バケツを位置の順に、バケツ内は (shuffle_key, id) 順に最大limit件を (バケツの位置, 単語) で返す
+    afterは最後に返した単語の (バケツの位置, shuffle_key, id)
+    複数のバケツの範囲をUNION ALLで1回のクエリにまとめる（ORでまとめると、統計がない場合に
+    SQLiteが単語帳の全単語を読む実行計画を選ぶため、範囲ごとのSELECTにする）
+    """
+    bucket_at = _bucket_order(seed, bits)
+    shift = SHUFFLE_KEY_BITS - bits
+    bucket_count = 1 << bits
+    # 1.5ページ分程度のバケツをまとめて読む（空のバケツや未習得のみで少ない場合は続けて読む）
+    per_query = 3 * limit // (2 * DECK_BUCKET_WORDS) + 1
+    start = after[0] if after is not None else 0
+    words = []
+    while len(words) < limit and start < bucket_count:
+        positions = {}
+        conditions = []
+        for position in range(start, min(bucket_count, start + per_query)):
+            bucket = bucket_at(position)
+            positions[bucket] = position
+            low, high = bucket << shift, ((bucket + 1) << shift) - 1
+            if after is not None and position == after[0]:
+                # 最後に返した単語より後（それぞれがインデックスの範囲検索になるように2つに分ける）
+                _, key, word_id = after
+                conditions.append(Word.shuffle_key.between(key + 1, high))
+                conditions.append(and_(Word.shuffle_key == key, Word.id > word_id))
+            else:
+                conditions.append(Word.shuffle_key.between(low, high))
+        stmt = select(Word).from_statement(union_all(*(query.where(condition) for condition in conditions)))
+        rows = [(positions[word.shuffle_key >> shift], word) for word in db.execute(stmt).scalars()]
+        rows.sort(key=lambda row: (row[0], row[1].shuffle_key, row[1].id))
+        words += rows[:limit - len(words)]
+        start += per_query
+    return words
+
+
+def build_deck(
+    db: Session,
+    notebook_id: int,
+    order: str,
+    exclude_mastered: bool,
+    limit: int = DECK_DEFAULT_LIMIT,
+    seed: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> dict:
+    """
+    デッキの1ページ分の単語と次のページのカーソル（最後のページはNone）
+    カーソルを渡した場合は、カーソルの並び順とシードで続きを返す（不正な場合はValueError）
+    """
+    after = None
+    if cursor:
+        order, cursor_seed, after = decode_cursor(cursor)
+        seed = cursor_seed if order == "random" else None
+    elif order == "random" and seed is None:
+        seed = new_seed()
+    elif order != "random":
+        seed = None
+
+    query = _deck_query(notebook_id, exclude_mastered)
+    # 次のページの有無を判定するため1件多く取得
+    if order == "random":
+        # バケツの数は最初のページで決めてカーソルに残す（ページの間に単語数が変わっても同じ並び順にする）
+        if after is not None:
+            bits, after = after[0], after[1:]
+        else:
+            bits = _bucket_bits(db, notebook_id, exclude_mastered)
+        rows = _random_page(db, query, seed, bits, after, limit + 1)
+        words = [word for _, word in rows]
+    else:
+        words = _sequential_page(db, query, after, limit + 1)
+
+    page = words[:limit]
+    next_cursor = None
+    if len(words) > limit:
+        if order == "random":
+            next_cursor = encode_cursor(order, page[-1], seed, bits, rows[limit - 1][0])
+        else:
+            next_cursor = encode_cursor(order, page[-1])
+    if order == "random":
+        # ページ内の順番は、同じシードとカーソルなら同じになるようにする
+        random.Random(f"{seed}:{cursor or ''}").shuffle(page)
+    return {"order": order, "seed": seed, "cards": page, "next_cursor": next_cursor}
@@ -0,0 +1,237 @@
+"""
+単語のインポート処理
+Markdown形式（"- word: meaning" または "* word: meaning"）のテキストを1行ずつパースし、
+一定件数ごとにまとめてINSERTします。テキスト全体をメモリに載せずに処理できます。
+既に登録されている単語は、正規化した単語（word_key）の一意インデックスでバッチごとに判定します
+（1行ずつ問い合わせない）。
+"""
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, or_, select
+from sqlalchemy.orm import Session
+
+from changes import bump_version
+from database import dialect_insert
+from models import Word
+from notebook_stats import apply_stats_delta
+
+# 対応形式: "- word: meaning" または "* word: meaning"
+LINE_PATTERN = re.compile(r'^[-*]\s*(.+?)\s*:\s*(.+)$')
+
+# 1回のINSERTでまとめる件数
+IMPORT_BATCH_SIZE = 1000
+
+# レスポンスに含めるスキップ行・追加単語のサンプル件数
+SAMPLE_LIMIT = 100
+
+# 進捗を保持するインポートの最大数（古いものから破棄）
+PROGRESS_HISTORY_LIMIT = 100
+
+# 単語帳に同じ単語（word_keyが同じ単語）がある場合の扱い
+# skip: 追加しない / update: 意味などを上書きする / duplicate: 重複して追加する（追加した行にはword_keyを付けない）
+IMPORT_MODES = ("skip", "update", "duplicate")
+
+
+def word_key(text: str) -> str:
+    """重複判定用に正規化した単語（NFKC正規化、大文字・小文字を区別しない、連続する空白を1つにする）"""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def parse_line(line: str):
+    """1行をパースして (単語, 意味, スキップ理由) を返す"""
+    match = LINE_PATTERN.match(line)
+    if match is None:
+        return None, None, "フォーマットが不正"
+    word_text = match.group(1).strip()
+    meaning_text = match.group(2).strip()
+    if not word_text or not meaning_text:
+        return None, None, "空の単語または意味"
+    return word_text, meaning_text, None
+
+
+class ImportResult:
+    def __init__(self):
+        self.processed_lines = 0
+        self.added_count = 0
+        self.updated_count = 0
+        # 単語帳に既にあるため（またはファイル内で重複しているため）追加しなかった件数
+        self.duplicate_count = 0
+        self.skipped_count = 0
+        self.added_sample = []
+        self.skipped_sample = []
+
+    def add_batch(self, added: List[dict], updated_count: int, duplicate_count: int):
+        self.added_count += len(added)
+        self.updated_count += updated_count
+        self.duplicate_count += duplicate_count
+        for values in added[:SAMPLE_LIMIT - len(self.added_sample)]:
+            self.added_sample.append({"word": values["word"], "meaning": values["meaning"]})
+
+    def to_dict(self):
+        return {
+            "processed_lines": self.processed_lines,
+            "added_count": self.added_count,
+            "updated_count": self.updated_count,
+            "duplicate_count": self.duplicate_count,
+            "skipped_count": self.skipped_count,
+            "skipped_lines": self.skipped_sample,
+        }
+
+
+def insert_words(db: Session, notebook_id: int, rows: List[dict], mode: str = "skip") -> Tuple[List[dict], int, int]:
+    """
+    単語をまとめて追加する（1バッチにつき既存の単語の取得1回と INSERT ... ON CONFLICT 1文）
+    rowsは追加する列の辞書（すべて同じキー）。バッチ内の重複はskipでは最初、updateでは最後の行を使う
+    (追加した行, 更新した件数, 重複として追加・更新しなかった件数) を返す（コミットは呼び出し側で行う）
+    """
+    # 単語帳の行をロックしてから既存の単語を調べる（同じ単語帳への書き込みはここで直列化される）
+    version = bump_version(db, notebook_id)
+    if version is None:
+        # インポート中に単語帳が削除された
+        raise LookupError("単語帳が見つかりません")
+    keyed = {}
+    extra = []
+    duplicate_count = 0
+    for values in rows:
+        key = word_key(values["word"])
+        if key in keyed:
+            if mode == "duplicate":
+                extra.append({**values, "version": version, "word_key": None})
+                continue
+            duplicate_count += 1
+            if mode == "skip":
+                continue
+        keyed[key] = {**values, "version": version, "word_key": key}
+
+    words = Word.__table__.c
+    columns = [name for name in rows[0] if name not in ("notebook_id", "word_key")] if rows else []
+    existing = {}
+    if keyed:
+        existing = {
+            row["word_key"]: row
+            for row in db.execute(
+                select(words.word_key, *(words[name] for name in columns))
+                .where(words.notebook_id == notebook_id, words.word_key.in_(list(keyed)))
+            ).mappings()
+        }
+
+    added = [values for key, values in keyed.items() if key not in existing]
+    changed = []
+    if mode == "duplicate":
+        # 既にある単語は重複として追加する（一意インデックスの対象外にする）
+        added.extend({**values, "word_key": None} for key, values in keyed.items() if key in existing)
+        added.extend(extra)
+        stmt = insert(Word)
+    elif mode == "update":
+        changed = [
+            values for key, values in keyed.items()
+            if key in existing and any(values[name] != existing[key][name] for name in columns)
+        ]
+        duplicate_count += len(keyed) - len(added) - len(changed)
+        stmt = dialect_insert(db, Word)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[words.notebook_id, words.word_key],
+            # word_lowerはINSERTの値（モデルのデフォルト）を使う
+            set_={name: stmt.excluded[name] for name in (*columns, "version", "word_lower")},
+            where=or_(*(words[name].is_distinct_from(stmt.excluded[name]) for name in columns)),
+        )
+    else:
+        duplicate_count += len(keyed) - len(added)
+        stmt = dialect_insert(db, Word).on_conflict_do_nothing(
+            index_elements=[words.notebook_id, words.word_key],
+        )
+
+    if added or changed:
+        db.execute(stmt, added + changed)
+
+    # 集計の差分（更新した単語は、更新前との差分）
+    delta = {"word_count": len(added), "mastered_count": 0, "correct_total": 0, "wrong_total": 0, "last_studied": None}
+    pairs = [(values, {}) for values in added] + [(values, existing[values["word_key"]]) for values in changed]
+    for values, before in pairs:
+        delta["mastered_count"] += int(bool(values.get("mastered"))) - int(bool(before.get("mastered")))
+        delta["correct_total"] += (values.get("correct_count") or 0) - (before.get("correct_count") or 0)
+        delta["wrong_total"] += (values.get("wrong_count") or 0) - (before.get("wrong_count") or 0)
+        if values.get("last_studied") and (delta["last_studied"] is None or values["last_studied"] > delta["last_studied"]):
+            delta["last_studied"] = values["last_studied"]
+    apply_stats_delta(db, notebook_id, **delta)
+    return added, len(changed), duplicate_count
+
+
+def import_lines(
+    db: Session,
+    notebook_id: int,
+    lines: Iterable[str],
+    batch_size: int = IMPORT_BATCH_SIZE,
+    commit_each_batch: bool = False,
+    on_progress: Optional[Callable[[ImportResult], None]] = None,
+    mode: str = "skip",
+) -> ImportResult:
+    """
+    行のイテレータを順にパースしてbatch_size件ごとにINSERTする
+    commit_each_batch=Trueの場合はバッチごとにコミットする（長時間ロックを保持しない）
+    modeは単語帳に同じ単語がある場合の扱い（IMPORT_MODES）
+    """
+    result = ImportResult()
+    batch = []
+
+    def flush():
+        if batch:
+            result.add_batch(*insert_words(db, notebook_id, batch, mode))
+            batch.clear()
+        if commit_each_batch:
+            db.commit()
+        if on_progress is not None:
+            on_progress(result)
+
+    for line_num, line in enumerate(lines, 1):
+        result.processed_lines = line_num
+        line = line.strip()
+        if not line:
+            continue
+
+        word_text, meaning_text, reason = parse_line(line)
+        if reason is not None:
+            result.skipped_count += 1
+            if len(result.skipped_sample) < SAMPLE_LIMIT:
+                result.skipped_sample.append({"line": line_num, "text": line, "reason": reason})
+            continue
+
+        batch.append({"word": word_text, "meaning": meaning_text, "notebook_id": notebook_id})
+        if len(batch) >= batch_size:
+            flush()
+
+    flush()
+    return result
+
+
+# インポートの進捗（import_idごと、このプロセス内でのみ共有）
+_progress = OrderedDict()
+_progress_lock = threading.Lock()
+
+
+def set_progress(import_id: str, status: str, result: Optional[ImportResult] = None, error: Optional[str] = None):
+    progress = {"import_id": import_id, "status": status}
+    if result is not None:
+        progress.update(
+            processed_lines=result.processed_lines,
+            added_count=result.added_count,
+            updated_count=result.updated_count,
+            duplicate_count=result.duplicate_count,
+            skipped_count=result.skipped_count,
+        )
+    if error is not None:
+        progress["error"] = error
+    with _progress_lock:
+        _progress[import_id] = progress
+        _progress.move_to_end(import_id)
+        while len(_progress) > PROGRESS_HISTORY_LIMIT:
+            _progress.popitem(last=False)
+
+
+def get_progress(import_id: str):
+    with _progress_lock:
+        return _progress.get(import_id)
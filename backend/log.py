@@ -0,0 +1,179 @@
+"""
+構造化ログ
+JSON形式（1行1レコード）でログを出力します。リクエストの処理スレッドではキューに積むだけで、
+標準出力への書き込みは別スレッド（QueueListener）で行います。
+DEBUGレベルのログは LOG_DEBUG_SAMPLE_RATE の割合だけ出力し、各レコードにはリクエストIDを付けます。
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from config import settings
+
+# アプリのロガーの親（get_loggerで作るロガーはすべてこの下）
+ROOT_LOGGER_NAME = "vocadeck"
+
+# キューに積めるレコード数（あふれた分は捨てて数える）
+LOG_QUEUE_SIZE = 10000
+
+# X-Request-IDとして受け付ける値（長すぎる値や制御文字はログに入れない）
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+# LogRecordの標準の属性（これ以外の属性はextraとしてJSONに含める）
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+# 処理中のリクエストのID
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            entry["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """DEBUGレベルのレコードをrateの割合だけ通す"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or self.rate >= 1.0 or random.random() < self.rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """キューが一杯のときは待たずにレコードを捨てる"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 呼び出し元のスレッド（コンテキスト）でリクエストIDとメッセージを確定させる
+        record = logging.makeLogRecord(vars(record))
+        record.request_id = request_id_var.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging():
+    """アプリのロガーを設定（何度呼んでも1回だけ設定する）"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(SamplingFilter(settings.LOG_DEBUG_SAMPLE_RATE))
+
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    root.setLevel(settings.LOG_LEVEL)
+    root.addHandler(handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(handler.queue, output)
+    _listener.start()
+    # 終了時にキューに残ったレコードを書き出す
+    atexit.register(_listener.stop)
+
+
+access_logger = get_logger("access")
+
+
+class RequestIdMiddleware:
+    """
+    リクエストIDを割り当てるASGIミドルウェア
+    X-Request-IDヘッダーがあればその値を使い、なければ生成する。レスポンスのヘッダーにも返す
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if REQUEST_ID_PATTERN.match(candidate):
+                    request_id = candidate
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        status = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            access_logger.exception(
+                "リクエストの処理中にエラーが発生しました",
+                extra={"method": scope["method"], "path": scope["path"]},
+            )
+            raise
+        finally:
+            # DEBUGが無効な場合はレコードを作らない
+            if access_logger.isEnabledFor(logging.DEBUG):
+                access_logger.debug(
+                    "リクエスト完了",
+                    extra={
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "status": status,
+                        "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+                    },
+                )
+            request_id_var.reset(token)
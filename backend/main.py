@@ -1,45 +1,83 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, FastAPI, Depends, HTTPException, File, Form, Request, Response, UploadFile
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List, Optional, Dict, Any
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import bindparam, case, delete, func, insert, select, update
+from typing import List, Optional, Dict, Any, Literal
+from pydantic import BaseModel, ValidationError, field_validator
 from datetime import datetime, date, timedelta
-import json
+from contextlib import asynccontextmanager
+import io
+import uuid
 
-from database import get_db, engine
-from models import Base, Word, StudySession, DailyStats, Notebook
+from cache import (
+    response_cache, invalidate_on_commit, etag_matches,
+    NOTEBOOKS_KEY, notebook_key, notebook_settings_key,
+)
+from database import SessionLocal, get_db, get_async_db, get_async_write_db, get_write_db, get_engine, dialect_insert, dispose_engines, pool_status
+from models import Word, StudySession, DailyStats, Notebook, NotebookStats, lower_word
+from changes import add_tombstones, add_tombstones_where, bump_version, bump_versions, bump_word_versions, load_changes, version_for
 from config import settings
-
-# データベーステーブルを作成
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI()
-
-# CORS設定（フロントエンドからのアクセスを許可）
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "https://vocadeck.vercel.app",  # Vercel本番環境
-        "http://localhost:3000",  # 開発用
-    ],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+from deck import DECK_DEFAULT_LIMIT, build_deck, clamp_limit as clamp_deck_limit
+from importer import import_lines, set_progress, get_progress, word_key
+from log import RequestIdMiddleware, get_logger, setup_logging
+from metrics import MetricsMiddleware, registry as metrics_registry
+import migrate
+from notebook_purge import purge_notebook
+from notebook_settings import NotebookSettings, load_settings, merge_settings
+from notebook_stats import apply_stats_delta, reset_stats, recompute_stats, stats_to_dict
+from review_log import record_reviews, review_row, rollup_reviews
+from review_stats import build_history, history_key
+from scheduler import initial_state, schedule
+from search import (
+    search_words as run_search, count_matches,
+    clamp_limit, encode_cursor, decode_cursor, SEARCH_DEFAULT_LIMIT, SEARCH_COUNT_CAP,
 )
+import transfer
+
+setup_logging()
+logger = get_logger("app")
+
+router = APIRouter()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 本番環境ではデプロイ時に python migrate.py で実行するため、ワーカーの起動ごとには行わない
+    if settings.AUTO_MIGRATE:
+        await run_in_threadpool(migrate.upgrade, get_engine())
+    logger.info("起動しました", extra={"frontend_url": settings.FRONTEND_URL, "auto_migrate": settings.AUTO_MIGRATE})
+    yield
+    await dispose_engines()
+
+
+def create_app() -> FastAPI:
+    """アプリケーションを作成（データベースへの接続はリクエストやマイグレーションで初めて使うときに行う）"""
+    app = FastAPI(lifespan=lifespan)
 
-# 起動時にエンドポイントをログ出力
-@app.on_event("startup")
-async def startup_event():
-    print("\n" + "="*50)
-    print("CORS設定:")
-    print(f"  FRONTEND_URL: {settings.FRONTEND_URL}")
-    print("="*50)
-    print("登録されているエンドポイント:")
-    for route in app.routes:
-        if hasattr(route, 'path') and hasattr(route, 'methods'):
-            print(f"  {list(route.methods)} {route.path}")
-    print("="*50 + "\n")
+    # CORS設定（フロントエンドからのアクセスを許可）
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=[
+            "https://vocadeck.vercel.app",  # Vercel本番環境
+            "http://localhost:3000",  # 開発用
+        ],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # ルートごとのレイテンシ・SQLクエリ数などを記録（GET /metrics で出力）
+    app.add_middleware(MetricsMiddleware)
+    # リクエストIDを割り当て、ログとレスポンスのX-Request-IDに付ける
+    app.add_middleware(RequestIdMiddleware)
+
+    app.include_router(router)
+    return app
 
 # Pydanticモデル（リクエスト/レスポンス用）
 class NotebookCreate(BaseModel):
@@ -48,11 +86,21 @@ class NotebookCreate(BaseModel):
 class NotebookSettingsUpdate(BaseModel):
     settings: Dict[str, Any]
 
+class NotebookStatsResponse(BaseModel):
+    notebook_id: int
+    word_count: int
+    mastered_count: int
+    correct_total: int
+    wrong_total: int
+    accuracy_rate: float
+    last_studied: Optional[datetime] = None
+
 class NotebookResponse(BaseModel):
     id: int
     name: str
     created_at: datetime
     settings: Optional[Dict[str, Any]] = None
+    stats: Optional[NotebookStatsResponse] = None
 
     class Config:
         from_attributes = True
@@ -71,17 +119,105 @@ class WordResponse(BaseModel):
     wrong_count: int = 0
     last_studied: Optional[datetime] = None
     mastered: bool = False
+    interval_days: Optional[float] = None
+    due_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
+class NotebookChangesResponse(BaseModel):
+    notebook_id: int
+    version: int
+    # Trueの場合、wordsは単語帳の全単語（クライアントの単語を置き換える）
+    full: bool
+    words: List[WordResponse]
+    deleted: List[int]
+
+class DeckResponse(BaseModel):
+    notebook_id: int
+    order: Literal["sequential", "random"]
+    direction: Literal["word-to-meaning", "meaning-to-word"]
+    exclude_mastered: bool
+    # ランダム順のシード（次のページはnext_cursorに含まれる）
+    seed: Optional[int] = None
+    # デッキの単語数（単語帳の集計から求める）
+    total: Optional[int] = None
+    cards: List[WordResponse]
+    next_cursor: Optional[str] = None
+
 class ProgressUpdate(BaseModel):
     correct: bool
     mastered: Optional[bool] = None
+    # 回答の履歴（review_log）に記録する
+    session_id: Optional[int] = None
+    latency_ms: Optional[int] = None
+
+class ProgressEvent(BaseModel):
+    word_id: int
+    correct: bool
+    mastered: Optional[bool] = None
+    timestamp: Optional[datetime] = None
+    latency_ms: Optional[int] = None
+
+    # タイムゾーン付きの時刻（toISOString()の"...Z"など）はローカル時刻に変換し、DBの列と同じくタイムゾーンなしにする
+    @field_validator("timestamp")
+    @classmethod
+    def to_local_naive(cls, value: Optional[datetime]) -> Optional[datetime]:
+        if value is not None and value.tzinfo is not None:
+            return value.astimezone().replace(tzinfo=None)
+        return value
+
+class ProgressBatch(BaseModel):
+    # 指定するとセッションの正解数・不正解数・学習単語数にも加算する
+    session_id: Optional[int] = None
+    events: List[ProgressEvent]
+
+# 単語帳に同じ単語がある場合の扱い（importer.IMPORT_MODES）
+ImportMode = Literal["skip", "update", "duplicate"]
 
 class WordImport(BaseModel):
     notebook_id: int
     text: str
+    mode: ImportMode = "skip"
+
+class WordBatchOperation(BaseModel):
+    # create: 単語を追加 / update: wordとmeaningのうち指定したものを変更 / delete: 単語を削除
+    op: Literal["create", "update", "delete"]
+    # update・deleteの対象
+    id: Optional[int] = None
+    word: Optional[str] = None
+    meaning: Optional[str] = None
+
+class WordBatch(BaseModel):
+    # 操作の対象はすべてこの単語帳の単語（createもこの単語帳に追加する）
+    notebook_id: int
+    operations: List[WordBatchOperation]
+
+class WordBatchResult(BaseModel):
+    index: int
+    op: str
+    ok: bool
+    id: Optional[int] = None
+    # create・updateの結果（同じバッチで削除した場合はなし）
+    word: Optional[WordResponse] = None
+    error: Optional[str] = None
+
+class WordBatchResponse(BaseModel):
+    notebook_id: int
+    # 適用後の単語帳のバージョン（差分同期のsinceに使える）
+    version: int
+    results: List[WordBatchResult]
+
+class WordBulkUpdate(BaseModel):
+    # reset: 進捗をリセット / master・unmaster: マスター状態を変更 / move: 別の単語帳へ移動
+    action: Literal["reset", "master", "unmaster", "move"]
+    # 対象の絞り込み（notebook_idかword_idsのどちらかは必須）
+    notebook_id: Optional[int] = None
+    word_ids: Optional[List[int]] = None
+    mastered: Optional[bool] = None
+    wrong_only: bool = False
+    # moveの移動先
+    target_notebook_id: Optional[int] = None
 
 class SessionCreate(BaseModel):
     start_time: Optional[datetime] = None
@@ -117,358 +253,1149 @@ class DailyStatsResponse(BaseModel):
     class Config:
         from_attributes = True
 
-# 単語帳一覧取得
-@app.get("/api/notebooks", response_model=List[NotebookResponse])
-def get_notebooks(db: Session = Depends(get_db)):
-    notebooks = db.query(Notebook).order_by(Notebook.created_at.desc()).all()
-    # settingsをJSON文字列から辞書に変換
-    result = []
-    for notebook in notebooks:
-        notebook_dict = {
-            "id": notebook.id,
-            "name": notebook.name,
-            "created_at": notebook.created_at,
-            "settings": None
-        }
-        if notebook.settings:
-            if isinstance(notebook.settings, str):
-                try:
-                    notebook_dict["settings"] = json.loads(notebook.settings)
-                except (json.JSONDecodeError, TypeError):
-                    notebook_dict["settings"] = None
-            else:
-                notebook_dict["settings"] = notebook.settings
-        result.append(notebook_dict)
-    return result
+# 単語帳のレスポンスを作成（設定の正規化はすべてここを通す）
+def notebook_response(notebook: Notebook, stats: Optional[Dict[str, Any]] = None) -> NotebookResponse:
+    return NotebookResponse(
+        id=notebook.id,
+        name=notebook.name,
+        created_at=notebook.created_at,
+        settings=load_settings(notebook.settings),
+        stats=stats,
+    )
+
+# 単語帳一覧取得（キャッシュ、ETag対応）
+# 集計は回答のたびに変わるためキャッシュする一覧には含めない。include_stats=trueの場合はキャッシュを使わずに集計を含めて返す
+@router.get("/api/notebooks", response_model=List[NotebookResponse])
+def get_notebooks(request: Request, include_stats: bool = False, db: Session = Depends(get_db)):
+    if include_stats:
+        return _list_notebooks_with_stats(db)
+    return response_cache.respond(request, NOTEBOOKS_KEY, lambda: _list_notebooks(db))
+
+def _list_notebooks(db: Session):
+    notebooks = (
+        db.query(Notebook)
+        .filter(Notebook.deleted_at.is_(None))
+        .order_by(Notebook.created_at.desc())
+        .all()
+    )
+    return [notebook_response(notebook) for notebook in notebooks]
+
+def _list_notebooks_with_stats(db: Session):
+    # 集計テーブルを結合して、単語を走査せずに単語数などを返す
+    notebooks = (
+        db.query(Notebook, NotebookStats)
+        .outerjoin(NotebookStats, NotebookStats.notebook_id == Notebook.id)
+        .filter(Notebook.deleted_at.is_(None))
+        .order_by(Notebook.created_at.desc())
+        .all()
+    )
+    return [notebook_response(notebook, stats_to_dict(notebook.id, stats)) for notebook, stats in notebooks]
 
 # 単語帳作成
-@app.post("/api/notebooks", response_model=NotebookResponse)
-def create_notebook(notebook: NotebookCreate, db: Session = Depends(get_db)):
-    db_notebook = Notebook(name=notebook.name)
+@router.post("/api/notebooks", response_model=NotebookResponse)
+def create_notebook(notebook: NotebookCreate, db: Session = Depends(get_write_db)):
+    db_notebook = Notebook(name=notebook.name, stats=NotebookStats())
     db.add(db_notebook)
+    invalidate_on_commit(db, NOTEBOOKS_KEY)
     db.commit()
     db.refresh(db_notebook)
     
-    # settingsをJSON文字列から辞書に変換
-    notebook_dict = {
-        "id": db_notebook.id,
-        "name": db_notebook.name,
-        "created_at": db_notebook.created_at,
-        "settings": None
-    }
-    if db_notebook.settings:
-        if isinstance(db_notebook.settings, str):
-            try:
-                notebook_dict["settings"] = json.loads(db_notebook.settings)
-            except (json.JSONDecodeError, TypeError):
-                notebook_dict["settings"] = None
-        else:
-            notebook_dict["settings"] = db_notebook.settings
-    return notebook_dict
-
-# 単語帳設定取得（クエリパラメータ版）
-@app.get("/api/notebook-settings")
-def get_notebook_settings(notebook_id: int, db: Session = Depends(get_db)):
-    print(f"[DEBUG] get_notebook_settings called with notebook_id={notebook_id}")
-    return {
-        "test": "query_param_version",
-        "notebook_id": notebook_id,
-        "exclude_mastered": False,
-        "default_direction": "word-to-meaning",
-        "default_order": "sequential",
-        "card_colors": {
-            "front": "blue",
-            "back": "light-blue"
-        }
-    }
+    return notebook_response(db_notebook)
 
-# 単語帳設定更新（クエリパラメータ版）
-@app.put("/api/notebook-settings")
-def update_notebook_settings(notebook_id: int, settings_update: NotebookSettingsUpdate, db: Session = Depends(get_db)):
-    notebook = db.query(Notebook).filter(Notebook.id == notebook_id).first()
+# 単語帳設定取得（クエリパラメータ版、キャッシュ、ETag対応）
+@router.get("/api/notebook-settings")
+def get_notebook_settings(notebook_id: int, request: Request, db: Session = Depends(get_db)):
+    return response_cache.respond(
+        request, notebook_settings_key(notebook_id), lambda: _load_notebook_settings(db, notebook_id)
+    )
+
+def _load_notebook_settings(db: Session, notebook_id: int):
+    notebook_settings = (
+        db.query(Notebook.settings).filter(Notebook.id == notebook_id, Notebook.deleted_at.is_(None)).first()
+    )
+    if notebook_settings is None:
+        raise HTTPException(status_code=404, detail="単語帳が見つかりません")
+    return load_settings(notebook_settings[0])
+
+def _save_notebook_settings(db: Session, notebook_id: int, build):
+    """現在の設定からbuildで新しい設定を作って保存する（検証エラーは422）"""
+    notebook = db.query(Notebook).filter(Notebook.id == notebook_id, Notebook.deleted_at.is_(None)).first()
     if notebook is None:
         raise HTTPException(status_code=404, detail="単語帳が見つかりません")
-    
     try:
-        # SQLiteではJSON型はTEXT型として保存されるため、文字列として保存する
-        # SQLAlchemyのJSON型は自動的にシリアライズ/デシリアライズされるが、
-        # SQLiteの場合は明示的にjson.dumps()を使用する方が安全
-        notebook.settings = json.dumps(settings_update.settings, ensure_ascii=False)
-        db.commit()
-        db.refresh(notebook)
-        
-        # レスポンス用にパース
-        if isinstance(notebook.settings, str):
-            try:
-                return json.loads(notebook.settings)
-            except (json.JSONDecodeError, TypeError):
-                return settings_update.settings
-        return notebook.settings if notebook.settings is not None else settings_update.settings
-    except Exception as e:
-        db.rollback()
-        import traceback
-        error_detail = traceback.format_exc()
-        print(f"設定保存エラー: {error_detail}")
-        raise HTTPException(status_code=500, detail=f"設定の保存に失敗しました: {str(e)}")
+        new_settings = build(load_settings(notebook.settings))
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=jsonable_encoder(e.errors(include_url=False)))
+    # JSON型の列に辞書のまま代入する（文字列にエンコードしない）
+    notebook.settings = new_settings
+    invalidate_on_commit(db, NOTEBOOKS_KEY, notebook_key(notebook_id), notebook_settings_key(notebook_id))
+    db.commit()
+    return new_settings
+
+# 単語帳設定更新（クエリパラメータ版、設定全体を置き換える）
+@router.put("/api/notebook-settings")
+def update_notebook_settings(notebook_id: int, settings_update: NotebookSettingsUpdate, db: Session = Depends(get_write_db)):
+    return _save_notebook_settings(
+        db, notebook_id, lambda current: NotebookSettings.model_validate(settings_update.settings).model_dump()
+    )
+
+# 単語帳設定の部分更新（指定した項目だけを変更する）
+@router.patch("/api/notebook-settings")
+def patch_notebook_settings(notebook_id: int, settings_update: NotebookSettingsUpdate, db: Session = Depends(get_write_db)):
+    return _save_notebook_settings(
+        db, notebook_id, lambda current: merge_settings(current, settings_update.settings)
+    )
+
+# 進捗リセット時に設定する値（間隔反復のスケジュールも初期状態に戻す）
+def progress_reset_values():
+    return {
+        Word.correct_count: 0,
+        Word.wrong_count: 0,
+        Word.mastered: False,
+        Word.last_studied: None,
+        **{getattr(Word, key): value for key, value in initial_state(datetime.now()).items()},
+    }
 
 # 単語帳内の全単語の正解・不正解数をリセット
-@app.post("/api/notebooks/{notebook_id}/reset-progress")
-def reset_notebook_progress(notebook_id: int, db: Session = Depends(get_db)):
-    notebook = db.query(Notebook).filter(Notebook.id == notebook_id).first()
-    if notebook is None:
+@router.post("/api/notebooks/{notebook_id}/reset-progress")
+def reset_notebook_progress(notebook_id: int, db: Session = Depends(get_write_db)):
+    # 単語帳のバージョンを先に進める（存在しない・削除中の単語帳はここで404）
+    version = bump_version(db, notebook_id)
+    if version is None:
         raise HTTPException(status_code=404, detail="単語帳が見つかりません")
+    notebook = db.get(Notebook, notebook_id)
     
-    words = db.query(Word).filter(Word.notebook_id == notebook_id).all()
-    for word in words:
-        word.correct_count = 0
-        word.wrong_count = 0
-        word.mastered = False
-        word.last_studied = None
-    
+    # 単語をロードせず、1回のUPDATE文でリセットする
+    db.query(Word).filter(Word.notebook_id == notebook_id).update(
+        {**progress_reset_values(), Word.version: version}, synchronize_session=False
+    )
+    reset_stats(db, notebook_id)
     db.commit()
     return {"message": f"単語帳「{notebook.name}」の全単語の進捗をリセットしました"}
 
-# 単語帳取得（ID指定）
-@app.get("/api/notebooks/{notebook_id}", response_model=NotebookResponse)
-def get_notebook(notebook_id: int, db: Session = Depends(get_db)):
-    print(f"[DEBUG] get_notebook called with notebook_id={notebook_id}")
-    notebook = db.query(Notebook).filter(Notebook.id == notebook_id).first()
+# 単語帳の集計取得（単語数・マスター数・正解数・不正解数・最終学習日時）
+@router.get("/api/notebooks/{notebook_id}/stats", response_model=NotebookStatsResponse)
+def get_notebook_stats(notebook_id: int, db: Session = Depends(get_db)):
+    row = (
+        db.query(Notebook.id, NotebookStats)
+        .outerjoin(NotebookStats, NotebookStats.notebook_id == Notebook.id)
+        .filter(Notebook.id == notebook_id, Notebook.deleted_at.is_(None))
+        .first()
+    )
+    if row is None:
+        raise HTTPException(status_code=404, detail="単語帳が見つかりません")
+    return stats_to_dict(notebook_id, row[1])
+
+# 単語帳取得（ID指定、キャッシュ、ETag対応）
+@router.get("/api/notebooks/{notebook_id}", response_model=NotebookResponse)
+def get_notebook(notebook_id: int, request: Request, db: Session = Depends(get_db)):
+    return response_cache.respond(request, notebook_key(notebook_id), lambda: _load_notebook(db, notebook_id))
+
+def _load_notebook(db: Session, notebook_id: int):
+    notebook = db.query(Notebook).filter(Notebook.id == notebook_id, Notebook.deleted_at.is_(None)).first()
     if notebook is None:
         raise HTTPException(status_code=404, detail="単語帳が見つかりません")
     
-    # settingsをJSON文字列から辞書に変換
-    notebook_dict = {
-        "id": notebook.id,
-        "name": notebook.name,
-        "created_at": notebook.created_at,
-        "settings": None
-    }
-    if notebook.settings:
-        if isinstance(notebook.settings, str):
-            try:
-                notebook_dict["settings"] = json.loads(notebook.settings)
-            except (json.JSONDecodeError, TypeError):
-                notebook_dict["settings"] = None
-        else:
-            notebook_dict["settings"] = notebook.settings
-    return notebook_dict
+    return notebook_response(notebook)
 
 # 単語帳更新
-@app.put("/api/notebooks/{notebook_id}", response_model=NotebookResponse)
-def update_notebook(notebook_id: int, notebook: NotebookCreate, db: Session = Depends(get_db)):
-    db_notebook = db.query(Notebook).filter(Notebook.id == notebook_id).first()
+@router.put("/api/notebooks/{notebook_id}", response_model=NotebookResponse)
+def update_notebook(notebook_id: int, notebook: NotebookCreate, db: Session = Depends(get_write_db)):
+    db_notebook = db.query(Notebook).filter(Notebook.id == notebook_id, Notebook.deleted_at.is_(None)).first()
     if db_notebook is None:
         raise HTTPException(status_code=404, detail="単語帳が見つかりません")
     db_notebook.name = notebook.name
+    invalidate_on_commit(db, NOTEBOOKS_KEY, notebook_key(notebook_id))
     db.commit()
     db.refresh(db_notebook)
     
-    # settingsをJSON文字列から辞書に変換
-    notebook_dict = {
-        "id": db_notebook.id,
-        "name": db_notebook.name,
-        "created_at": db_notebook.created_at,
-        "settings": None
-    }
-    if db_notebook.settings:
-        if isinstance(db_notebook.settings, str):
-            try:
-                notebook_dict["settings"] = json.loads(db_notebook.settings)
-            except (json.JSONDecodeError, TypeError):
-                notebook_dict["settings"] = None
-        else:
-            notebook_dict["settings"] = db_notebook.settings
-    return notebook_dict
-
-# 単語帳削除
-@app.delete("/api/notebooks/{notebook_id}")
-def delete_notebook(notebook_id: int, db: Session = Depends(get_db)):
-    db_notebook = db.query(Notebook).filter(Notebook.id == notebook_id).first()
+    return notebook_response(db_notebook)
+
+# 単語帳削除（単語などの子の行はデータベースのON DELETE CASCADEで削除する）
+# background=trueの場合は一覧などから先に隠し、単語を一定件数ずつバックグラウンドで削除する（202を返す）
+@router.delete("/api/notebooks/{notebook_id}")
+def delete_notebook(
+    notebook_id: int,
+    background_tasks: BackgroundTasks,
+    background: bool = False,
+    db: Session = Depends(get_write_db)
+):
+    db_notebook = db.query(Notebook).filter(Notebook.id == notebook_id, Notebook.deleted_at.is_(None)).first()
     if db_notebook is None:
         raise HTTPException(status_code=404, detail="単語帳が見つかりません")
+    invalidate_on_commit(db, NOTEBOOKS_KEY, notebook_key(notebook_id), notebook_settings_key(notebook_id))
+    if background:
+        db_notebook.deleted_at = datetime.now()
+        db.commit()
+        background_tasks.add_task(purge_notebook, notebook_id)
+        return JSONResponse(status_code=202, content={"message": "単語帳の削除を開始しました"})
     db.delete(db_notebook)
     db.commit()
     return {"message": "単語帳が削除されました"}
 
-# 単語一覧取得（単語帳IDでフィルタリング）
-@app.get("/api/words", response_model=List[WordResponse])
-def get_words(notebook_id: Optional[int] = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    query = db.query(Word)
+# fieldsで指定できる単語の列
+WORD_FIELDS = {
+    "id": Word.id,
+    "word": Word.word,
+    "meaning": Word.meaning,
+    "notebook_id": Word.notebook_id,
+    "correct_count": Word.correct_count,
+    "wrong_count": Word.wrong_count,
+    "last_studied": Word.last_studied,
+    "mastered": Word.mastered,
+    "interval_days": Word.interval_days,
+    "due_at": Word.due_at,
+}
+
+WORDS_MAX_LIMIT = 1000
+
+# 単語一覧取得（単語帳IDでフィルタリング、1回に最大WORDS_MAX_LIMIT件）
+# after_idを指定するとそのIDより後ろの単語を返す（キーセットページネーション、skipは無視）
+# fieldsを指定すると指定した列のみを返す（例: fields=id,word）
+@router.get("/api/words", response_model=List[WordResponse])
+async def get_words(
+    notebook_id: Optional[int] = None,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    if fields:
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in names if name not in WORD_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"不明なフィールドです: {', '.join(unknown)}")
+        # idはページングのカーソルとして常に含める
+        if "id" not in names:
+            names.insert(0, "id")
+        query = select(*(WORD_FIELDS[name] for name in names))
+    else:
+        query = select(Word)
+    # 削除中の単語帳の単語は返さない
+    query = query.join(Notebook, (Notebook.id == Word.notebook_id) & Notebook.deleted_at.is_(None))
+    
     if notebook_id is not None:
-        query = query.filter(Word.notebook_id == notebook_id)
-    words = query.offset(skip).limit(limit).all()
-    return words
+        query = query.where(Word.notebook_id == notebook_id)
+    if after_id is not None:
+        query = query.where(Word.id > after_id)
+    else:
+        query = query.offset(skip)
+    query = query.order_by(Word.id).limit(max(1, min(limit, WORDS_MAX_LIMIT)))
+    
+    if fields:
+        # ORMオブジェクトを経由せず、指定列の行をそのまま返す
+        rows = (await db.execute(query)).mappings().all()
+        return JSONResponse(jsonable_encoder([dict(row) for row in rows]))
+    return (await db.execute(query)).scalars().all()
+
+# 単語帳の差分同期（sinceより後に変更された単語と、削除・移動された単語のID）
+# ETagは単語帳のバージョンで、変更がなければ単語帳の行を1件読むだけで304を返す
+@router.get("/api/notebooks/{notebook_id}/changes", response_model=NotebookChangesResponse)
+async def get_notebook_changes(
+    notebook_id: int,
+    request: Request,
+    response: Response,
+    since: int = 0,
+    db: AsyncSession = Depends(get_async_db)
+):
+    version = (await db.execute(
+        select(Notebook.version).where(Notebook.id == notebook_id, Notebook.deleted_at.is_(None))
+    )).scalar()
+    if version is None:
+        raise HTTPException(status_code=404, detail="単語帳が見つかりません")
+    
+    headers = {"ETag": f'"v{version}"', "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return await db.run_sync(load_changes, notebook_id, since, version)
 
-# 全単語帳を横断して単語を検索
-@app.get("/api/words/search")
-def search_words(q: str = "", db: Session = Depends(get_db)):
+# 単語帳の設定（未習得のみ・出題順・出題方向）を適用したデッキを1ページずつ取得
+# クエリで指定した項目は設定より優先する。ランダム順はseedが同じなら同じ順番になる
+@router.get("/api/notebooks/{notebook_id}/deck", response_model=DeckResponse)
+async def get_notebook_deck(
+    notebook_id: int,
+    order: Optional[Literal["sequential", "random"]] = None,
+    direction: Optional[Literal["word-to-meaning", "meaning-to-word"]] = None,
+    exclude_mastered: Optional[bool] = None,
+    seed: Optional[int] = None,
+    limit: int = DECK_DEFAULT_LIMIT,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    row = (await db.execute(
+        select(Notebook.settings, NotebookStats.word_count, NotebookStats.mastered_count)
+        .outerjoin(NotebookStats, NotebookStats.notebook_id == Notebook.id)
+        .where(Notebook.id == notebook_id, Notebook.deleted_at.is_(None))
+    )).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="単語帳が見つかりません")
+    
+    notebook_settings = load_settings(row.settings)
+    if exclude_mastered is None:
+        exclude_mastered = notebook_settings["exclude_mastered"]
+    try:
+        deck = await db.run_sync(
+            build_deck,
+            notebook_id,
+            order or notebook_settings["default_order"],
+            exclude_mastered,
+            clamp_deck_limit(limit),
+            seed,
+            cursor,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="カーソルが不正です")
+    
+    total = None
+    if row.word_count is not None:
+        total = row.word_count - row.mastered_count if exclude_mastered else row.word_count
+    return {
+        **deck,
+        "notebook_id": notebook_id,
+        "direction": direction or notebook_settings["default_direction"],
+        "exclude_mastered": exclude_mastered,
+        "total": total,
+    }
+
+def _search_result(word: Word, notebook_name: str):
+    return {
+        "id": word.id,
+        "word": word.word,
+        "meaning": word.meaning,
+        "correct_count": word.correct_count,
+        "wrong_count": word.wrong_count,
+        "mastered": word.mastered,
+        "notebook_id": word.notebook_id,
+        "notebook_name": notebook_name
+    }
+
+# 全単語帳を横断して単語を検索（関連度上位のみ、最大SEARCH_MAX_LIMIT件）
+@router.get("/api/words/search")
+async def search_words(q: str = "", limit: int = SEARCH_DEFAULT_LIMIT, db: AsyncSession = Depends(get_async_db)):
     if not q or len(q.strip()) == 0:
         return []
     
-    # 単語と意味の両方を検索（大文字小文字を区別しない）
+    # 単語と意味の両方を検索（大文字小文字を区別しない、前方一致を先に返す）
     # 単語帳名も含めて返す
-    query = db.query(Word, Notebook.name).join(Notebook).filter(
-        (Word.word.ilike(f"%{q}%")) | (Word.meaning.ilike(f"%{q}%"))
-    ).all()
-    
-    results = [
-        {
-            "id": word.id,
-            "word": word.word,
-            "meaning": word.meaning,
-            "correct_count": word.correct_count,
-            "wrong_count": word.wrong_count,
-            "mastered": word.mastered,
-            "notebook_id": word.notebook_id,
-            "notebook_name": notebook_name
-        }
-        for word, notebook_name in query
-    ]
-    return results
+    rows = await db.run_sync(run_search, q.strip(), clamp_limit(limit))
+    return [_search_result(word, notebook_name) for word, notebook_name, _, _ in rows]
+
+# 全単語帳を横断して単語を検索（カーソルによるページネーション版）
+@router.get("/api/words/search/page")
+async def search_words_page(
+    q: str = "",
+    limit: int = SEARCH_DEFAULT_LIMIT,
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="カーソルが不正です")
+    
+    # 総件数は最初のページだけで数える（2ページ目以降は最初のページの値を使う）
+    include_total = include_total and after is None
+    result = {"items": [], "next_cursor": None}
+    if include_total:
+        result["total"] = 0
+        result["total_is_estimate"] = False
+    if not q or len(q.strip()) == 0:
+        return result
+    
+    q = q.strip()
+    limit = clamp_limit(limit)
+    # 次ページの有無を判定するため1件多く取得
+    rows = await db.run_sync(run_search, q, limit + 1, after)
+    page = rows[:limit]
+    result["items"] = [_search_result(word, notebook_name) for word, notebook_name, _, _ in page]
+    if len(rows) > len(page):
+        last_word, _, last_tier, last_key = page[-1]
+        result["next_cursor"] = encode_cursor(last_tier, last_key, last_word.id)
+    
+    if include_total:
+        # SEARCH_COUNT_CAP件で打ち切り、それ以上は推定値として返す
+        total = await db.run_sync(count_matches, q)
+        result["total"] = total
+        result["total_is_estimate"] = total >= SEARCH_COUNT_CAP
+    return result
 
 # 単語取得（ID指定）
-@app.get("/api/words/{word_id}", response_model=WordResponse)
+@router.get("/api/words/{word_id}", response_model=WordResponse)
 def get_word(word_id: int, db: Session = Depends(get_db)):
-    word = db.query(Word).filter(Word.id == word_id).first()
+    word = (
+        db.query(Word)
+        .join(Notebook, (Notebook.id == Word.notebook_id) & Notebook.deleted_at.is_(None))
+        .filter(Word.id == word_id)
+        .first()
+    )
     if word is None:
         raise HTTPException(status_code=404, detail="単語が見つかりません")
     return word
 
+# 単語帳内で使われていなければ正規化した単語を返す（手動の追加・編集では重複を許し、重複した単語にはキーを付けない）
+def available_word_key(db: Session, notebook_id: int, text: str, word_id: Optional[int] = None):
+    key = word_key(text)
+    query = select(Word.id).where(Word.notebook_id == notebook_id, Word.word_key == key)
+    if word_id is not None:
+        query = query.where(Word.id != word_id)
+    return None if db.execute(query).first() is not None else key
+
+# 移動する単語のうち、移動先の単語帳（または同時に移動する単語）と正規化した単語が重なるもののキーを外す
+def release_word_keys_for_move(db: Session, conditions: list, target_notebook_id: int, single_source: bool):
+    moving = [*conditions, Word.notebook_id != target_notebook_id, Word.word_key.is_not(None)]
+    target = aliased(Word)
+    db.query(Word).filter(
+        *moving,
+        Word.word_key.in_(select(target.word_key).where(target.notebook_id == target_notebook_id))
+    ).update({Word.word_key: None}, synchronize_session=False)
+    if single_source:
+        # 同じ単語帳の単語どうしはキーが重ならない
+        return
+    seen = set()
+    duplicate_ids = []
+    for word_id, key in db.execute(select(Word.id, Word.word_key).where(*moving).order_by(Word.id)):
+        if key in seen:
+            duplicate_ids.append(word_id)
+        seen.add(key)
+    if duplicate_ids:
+        db.query(Word).filter(Word.id.in_(duplicate_ids)).update({Word.word_key: None}, synchronize_session=False)
+
+# 削除・移動・単語の変更で外れたキー（{単語帳ID: キーの集合}）を、単語帳に残っている同じ単語のうち最も古いものに付け直す
+# キーのない単語は重複して追加した単語だけなので、単語帳ごとにその行だけを読んでPythonで正規化する
+def reassign_word_keys(db: Session, freed: Dict[int, set]):
+    db.flush()
+    words_table = Word.__table__
+    assignments = []
+    for notebook_id, keys in freed.items():
+        keys = set(keys) - {None}
+        if keys:
+            # 同じ処理で追加・変更された単語が使っているキーはそのままにする
+            keys -= set(db.scalars(
+                select(words_table.c.word_key)
+                .where(words_table.c.notebook_id == notebook_id, words_table.c.word_key.in_(keys))
+            ))
+        if not keys:
+            continue
+        for word_id, text in db.execute(
+            select(words_table.c.id, words_table.c.word)
+            .where(words_table.c.notebook_id == notebook_id, words_table.c.word_key.is_(None))
+            .order_by(words_table.c.id)
+        ):
+            key = word_key(text)
+            if key in keys:
+                assignments.append({"b_id": word_id, "b_word_key": key})
+                keys.discard(key)
+                if not keys:
+                    break
+    if assignments:
+        db.execute(
+            update(words_table).where(words_table.c.id == bindparam("b_id")).values(word_key=bindparam("b_word_key")),
+            assignments
+        )
+
 # 単語追加
-@app.post("/api/words", response_model=WordResponse)
-def create_word(word: WordCreate, db: Session = Depends(get_db)):
-    # 単語帳の存在確認
-    notebook = db.query(Notebook).filter(Notebook.id == word.notebook_id).first()
-    if notebook is None:
+@router.post("/api/words", response_model=WordResponse)
+def create_word(word: WordCreate, db: Session = Depends(get_write_db)):
+    # 単語帳のバージョンを進める（存在しない・削除中の単語帳はここで404）
+    version = bump_version(db, word.notebook_id)
+    if version is None:
         raise HTTPException(status_code=404, detail="単語帳が見つかりません")
     
-    db_word = Word(word=word.word, meaning=word.meaning, notebook_id=word.notebook_id)
+    db_word = Word(
+        word=word.word,
+        word_key=available_word_key(db, word.notebook_id, word.word),
+        meaning=word.meaning,
+        notebook_id=word.notebook_id,
+        version=version
+    )
     db.add(db_word)
+    apply_stats_delta(db, word.notebook_id, word_count=1)
     db.commit()
     db.refresh(db_word)
     return db_word
 
 # 単語を一括インポート（Markdown形式）
-@app.post("/api/words/import")
-def import_words(import_data: WordImport, db: Session = Depends(get_db)):
-    import re
-    
+# added_words・skipped_linesは先頭100件のみ返す（件数はadded_count・skipped_countを参照）
+@router.post("/api/words/import")
+def import_words(import_data: WordImport, db: Session = Depends(get_write_db)):
     # 単語帳の存在確認
-    notebook = db.query(Notebook).filter(Notebook.id == import_data.notebook_id).first()
+    notebook = (
+        db.query(Notebook).filter(Notebook.id == import_data.notebook_id, Notebook.deleted_at.is_(None)).first()
+    )
     if notebook is None:
         raise HTTPException(status_code=404, detail="単語帳が見つかりません")
     
-    # Markdown形式をパース
-    # 対応形式: "- word: meaning" または "* word: meaning"
-    pattern = r'^[-*]\s*(.+?)\s*:\s*(.+)$'
-    
-    lines = import_data.text.strip().split('\n')
-    added_words = []
-    skipped_lines = []
-    
-    for line_num, line in enumerate(lines, 1):
-        line = line.strip()
-        if not line:
-            continue
-            
-        match = re.match(pattern, line)
-        if match:
-            word_text = match.group(1).strip()
-            meaning_text = match.group(2).strip()
-            
-            if word_text and meaning_text:
-                db_word = Word(
-                    word=word_text,
-                    meaning=meaning_text,
-                    notebook_id=import_data.notebook_id
-                )
-                db.add(db_word)
-                added_words.append({"word": word_text, "meaning": meaning_text})
-            else:
-                skipped_lines.append({"line": line_num, "text": line, "reason": "空の単語または意味"})
-        else:
-            skipped_lines.append({"line": line_num, "text": line, "reason": "フォーマットが不正"})
-    
+    result = import_lines(db, import_data.notebook_id, io.StringIO(import_data.text), mode=import_data.mode)
     db.commit()
     
     return {
         "success": True,
-        "added_count": len(added_words),
-        "skipped_count": len(skipped_lines),
-        "added_words": added_words,
-        "skipped_lines": skipped_lines
+        "added_count": result.added_count,
+        "updated_count": result.updated_count,
+        "duplicate_count": result.duplicate_count,
+        "skipped_count": result.skipped_count,
+        "added_words": result.added_sample,
+        "skipped_lines": result.skipped_sample
     }
 
-# 単語更新
-@app.put("/api/words/{word_id}", response_model=WordResponse)
-def update_word(word_id: int, word: WordCreate, db: Session = Depends(get_db)):
-    db_word = db.query(Word).filter(Word.id == word_id).first()
+# 単語を一括インポート（ファイルアップロード版）
+# ファイルを1行ずつ読みながらバッチ単位でINSERT・コミットするため、大きなファイルでもメモリを消費しない
+# import_idを指定すると、処理中の進捗を GET /api/words/import/progress/{import_id} で取得できる
+@router.post("/api/words/import/stream")
+def import_words_stream(
+    notebook_id: int = Form(...),
+    file: UploadFile = File(...),
+    import_id: Optional[str] = Form(None),
+    mode: ImportMode = Form("skip"),
+    db: Session = Depends(get_write_db)
+):
+    # 単語帳の存在確認
+    notebook = db.query(Notebook).filter(Notebook.id == notebook_id, Notebook.deleted_at.is_(None)).first()
+    if notebook is None:
+        raise HTTPException(status_code=404, detail="単語帳が見つかりません")
+    
+    import_id = import_id or uuid.uuid4().hex
+    set_progress(import_id, "running")
+    lines = io.TextIOWrapper(file.file, encoding="utf-8-sig", errors="replace")
+    try:
+        result = import_lines(
+            db, notebook_id, lines,
+            commit_each_batch=True,
+            on_progress=lambda progress: set_progress(import_id, "running", progress),
+            mode=mode
+        )
+    except Exception as e:
+        db.rollback()
+        logger.exception("インポートに失敗しました", extra={"import_id": import_id, "notebook_id": notebook_id})
+        set_progress(import_id, "failed", error=str(e))
+        raise HTTPException(status_code=500, detail=f"インポートに失敗しました: {str(e)}")
+    finally:
+        # UploadFile側でクローズするため、ラッパーからは切り離す
+        lines.detach()
+    
+    set_progress(import_id, "completed", result)
+    return {"success": True, "import_id": import_id, **result.to_dict()}
+
+# 単語帳のエクスポート（CSV / JSONL / Parquet）
+# 一定件数ずつ読み出しながら返すため、単語帳の大きさにかかわらずメモリを消費しない
+@router.get("/api/notebooks/{notebook_id}/export")
+def export_notebook(notebook_id: int, format: Literal["csv", "jsonl", "parquet"] = "csv"):
+    if format == "parquet" and not transfer.parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet形式にはpyarrowのインストールが必要です")
+    # 存在確認の接続はすぐに返し、ストリーミング中はエクスポート用の接続だけを使う
+    get_engine()
+    with SessionLocal() as db:
+        if db.query(Notebook.id).filter(Notebook.id == notebook_id, Notebook.deleted_at.is_(None)).first() is None:
+            raise HTTPException(status_code=404, detail="単語帳が見つかりません")
+
+    media_type, extension = transfer.FORMATS[format]
+    return StreamingResponse(
+        transfer.export_notebook(notebook_id, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="notebook_{notebook_id}{extension}"'},
+    )
+
+# 単語帳へのインポート（エクスポートと同じ形式のファイルをアップロード）
+# バッチ単位でINSERT・コミットし、進捗は GET /api/words/import/progress/{import_id} で取得できる
+@router.post("/api/notebooks/{notebook_id}/import")
+def import_notebook(
+    notebook_id: int,
+    format: Literal["csv", "jsonl", "parquet"] = "csv",
+    mode: ImportMode = "skip",
+    file: UploadFile = File(...),
+    import_id: Optional[str] = Form(None),
+    db: Session = Depends(get_write_db)
+):
+    if format == "parquet" and not transfer.parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet形式にはpyarrowのインストールが必要です")
+    if db.query(Notebook.id).filter(Notebook.id == notebook_id, Notebook.deleted_at.is_(None)).first() is None:
+        raise HTTPException(status_code=404, detail="単語帳が見つかりません")
+
+    import_id = import_id or uuid.uuid4().hex
+    set_progress(import_id, "running")
+    try:
+        result = transfer.import_records(
+            db, notebook_id, transfer.READERS[format](file.file),
+            commit_each_batch=True,
+            on_progress=lambda progress: set_progress(import_id, "running", progress),
+            mode=mode
+        )
+    except Exception as e:
+        db.rollback()
+        logger.exception("インポートに失敗しました", extra={"import_id": import_id, "notebook_id": notebook_id})
+        set_progress(import_id, "failed", error=str(e))
+        raise HTTPException(status_code=500, detail=f"インポートに失敗しました: {str(e)}")
+
+    set_progress(import_id, "completed", result)
+    return {"success": True, "import_id": import_id, **result.to_dict()}
+
+# インポートの進捗取得
+@router.get("/api/words/import/progress/{import_id}")
+def get_import_progress(import_id: str):
+    progress = get_progress(import_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="インポートが見つかりません")
+    return progress
+
+# 一括更新で指定できる単語IDの上限
+BULK_UPDATE_MAX_IDS = 10000
+
+# 単語の一括更新（フィルタまたはID指定、1回のUPDATE文で実行）
+@router.post("/api/words/bulk-update")
+def bulk_update_words(bulk: WordBulkUpdate, db: Session = Depends(get_write_db)):
+    if bulk.notebook_id is None and not bulk.word_ids:
+        raise HTTPException(status_code=400, detail="notebook_idまたはword_idsを指定してください")
+    if bulk.word_ids and len(bulk.word_ids) > BULK_UPDATE_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"word_idsは{BULK_UPDATE_MAX_IDS}件以内で指定してください")
+    
+    if bulk.action == "reset":
+        values = progress_reset_values()
+    elif bulk.action == "master":
+        values = {Word.mastered: True}
+    elif bulk.action == "unmaster":
+        values = {Word.mastered: False}
+    else:
+        if bulk.target_notebook_id is None:
+            raise HTTPException(status_code=400, detail="移動先の単語帳を指定してください")
+        values = {Word.notebook_id: bulk.target_notebook_id}
+    
+    conditions = []
+    if bulk.notebook_id is not None:
+        conditions.append(Word.notebook_id == bulk.notebook_id)
+    if bulk.word_ids:
+        conditions.append(Word.id.in_(bulk.word_ids))
+    if bulk.mastered is not None:
+        conditions.append(Word.mastered == bulk.mastered)
+    if bulk.wrong_only:
+        conditions.append(Word.wrong_count > 0)
+    
+    # 単語の行を読む前に単語帳のバージョンを進める（その間に別の単語帳へ移動された単語は対象外）
+    target_ids = [bulk.target_notebook_id] if bulk.action == "move" else []
+    if bulk.notebook_id is not None:
+        versions = bump_versions(db, [bulk.notebook_id, *target_ids])
+    else:
+        versions = bump_word_versions(db, bulk.word_ids, target_ids)
+    if bulk.action == "move" and bulk.target_notebook_id not in versions:
+        raise HTTPException(status_code=404, detail="移動先の単語帳が見つかりません")
+    # 影響を受ける単語帳の集計は更新後に作り直す
+    affected_notebook_ids = set(versions)
+    conditions.append(Word.notebook_id.in_(list(versions)))
+    freed_keys = {}
+    if bulk.action == "move":
+        # 移動元の単語帳で外れるキー（移動後に残っている同じ単語に付け直す）
+        for notebook_id, key in db.execute(
+            select(Word.notebook_id, Word.word_key)
+            .where(*conditions, Word.notebook_id != bulk.target_notebook_id, Word.word_key.is_not(None))
+        ):
+            freed_keys.setdefault(notebook_id, set()).add(key)
+        # 移動元の単語帳では削除として記録し、移動先のバージョンで移動する
+        release_word_keys_for_move(db, conditions, bulk.target_notebook_id, bulk.notebook_id is not None)
+        add_tombstones_where(db, versions, Word.notebook_id != bulk.target_notebook_id, *conditions)
+        values[Word.version] = versions[bulk.target_notebook_id]
+    else:
+        values[Word.version] = version_for(versions)
+    
+    updated_count = db.query(Word).filter(*conditions).update(values, synchronize_session=False)
+    if freed_keys:
+        reassign_word_keys(db, freed_keys)
+    if updated_count:
+        recompute_stats(db, affected_notebook_ids)
+    db.commit()
+    return {"updated_count": updated_count}
+
+def _bump_and_load_word(db: Session, word_id: int):
+    """単語の単語帳のバージョンを進めてから単語を読み込む（その間に別の単語帳へ移動された場合も404）"""
+    versions = bump_word_versions(db, [word_id])
+    db_word = db.query(Word).filter(Word.id == word_id, Word.notebook_id.in_(list(versions))).first()
     if db_word is None:
         raise HTTPException(status_code=404, detail="単語が見つかりません")
+    return db_word, versions[db_word.notebook_id]
+
+# 単語更新
+@router.put("/api/words/{word_id}", response_model=WordResponse)
+def update_word(word_id: int, word: WordCreate, db: Session = Depends(get_write_db)):
+    db_word, version = _bump_and_load_word(db, word_id)
+    db_word.version = version
+    previous_key = db_word.word_key
+    db_word.word_key = available_word_key(db, db_word.notebook_id, word.word, word_id)
     db_word.word = word.word
     db_word.meaning = word.meaning
+    if previous_key is not None and previous_key != db_word.word_key:
+        reassign_word_keys(db, {db_word.notebook_id: {previous_key}})
     db.commit()
     db.refresh(db_word)
     return db_word
 
 # 単語削除
-@app.delete("/api/words/{word_id}")
-def delete_word(word_id: int, db: Session = Depends(get_db)):
-    db_word = db.query(Word).filter(Word.id == word_id).first()
-    if db_word is None:
-        raise HTTPException(status_code=404, detail="単語が見つかりません")
+@router.delete("/api/words/{word_id}")
+def delete_word(word_id: int, db: Session = Depends(get_write_db)):
+    db_word, version = _bump_and_load_word(db, word_id)
     db.delete(db_word)
+    add_tombstones(db, db_word.notebook_id, [word_id], version)
+    apply_stats_delta(
+        db, db_word.notebook_id,
+        word_count=-1,
+        mastered_count=-1 if db_word.mastered else 0,
+        correct_total=-(db_word.correct_count or 0),
+        wrong_total=-(db_word.wrong_count or 0)
+    )
+    if db_word.word_key is not None:
+        reassign_word_keys(db, {db_word.notebook_id: {db_word.word_key}})
     db.commit()
     return {"message": "単語が削除されました"}
 
+# 一括操作で指定できる操作数の上限
+WORD_BATCH_MAX_OPERATIONS = 1000
+
+# 単語の追加・更新・削除をまとめて適用（単語帳の確認は1回、1トランザクション、操作ごとの結果を返す）
+# 不正な操作（対象の単語が単語帳にないなど）は適用せず、その操作の結果をok=falseで返す
+@router.post("/api/words/batch", response_model=WordBatchResponse)
+def apply_word_batch(batch: WordBatch, db: Session = Depends(get_write_db)):
+    if len(batch.operations) > WORD_BATCH_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"operationsは{WORD_BATCH_MAX_OPERATIONS}件以内で指定してください")
+    notebook_id = batch.notebook_id
+    # 単語の行を読む前に単語帳のバージョンを進める（存在しない・削除中の単語帳はここで404）
+    version = bump_version(db, notebook_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="単語帳が見つかりません")
+    
+    # 対象の単語と、使われている正規化した単語を1回ずつ読み込む
+    words_table = Word.__table__
+    target_ids = {operation.id for operation in batch.operations if operation.id is not None}
+    current = {}
+    if target_ids:
+        current = {
+            row.id: row
+            for row in db.execute(
+                select(
+                    words_table.c.id, words_table.c.word, words_table.c.meaning, words_table.c.word_key,
+                    words_table.c.mastered, words_table.c.correct_count, words_table.c.wrong_count
+                ).where(words_table.c.id.in_(target_ids), words_table.c.notebook_id == notebook_id)
+            )
+        }
+    candidate_keys = {word_key(operation.word) for operation in batch.operations if operation.word is not None}
+    taken = {}
+    if candidate_keys:
+        taken = dict(db.execute(
+            select(words_table.c.word_key, words_table.c.id)
+            .where(words_table.c.notebook_id == notebook_id, words_table.c.word_key.in_(candidate_keys))
+        ).all())
+    
+    # 操作を順に検証し、単語ごとの最終的な状態にまとめる（キーは空いていれば付ける）
+    results = []
+    creates = []
+    updates = {}
+    deleted = set()
+    for index, operation in enumerate(batch.operations):
+        result = WordBatchResult(index=index, op=operation.op, ok=False, id=operation.id)
+        results.append(result)
+        if operation.op == "create":
+            if operation.word is None or operation.meaning is None:
+                result.error = "wordとmeaningを指定してください"
+                continue
+            key = word_key(operation.word)
+            if key in taken:
+                key = None
+            else:
+                taken[key] = ("create", index)
+            creates.append((result, {
+                "word": operation.word, "word_key": key, "meaning": operation.meaning,
+                "notebook_id": notebook_id, "version": version,
+            }))
+            result.ok = True
+            continue
+        
+        if operation.id is None:
+            result.error = "idを指定してください"
+            continue
+        if operation.id not in current or operation.id in deleted:
+            result.error = "単語が見つかりません"
+            continue
+        values = updates.get(operation.id) or {
+            "word": current[operation.id].word,
+            "meaning": current[operation.id].meaning,
+            "word_key": current[operation.id].word_key,
+        }
+        if operation.op == "delete":
+            if values["word_key"] is not None and taken.get(values["word_key"]) == operation.id:
+                del taken[values["word_key"]]
+            updates.pop(operation.id, None)
+            deleted.add(operation.id)
+            result.ok = True
+            continue
+        
+        if operation.word is None and operation.meaning is None:
+            result.error = "wordまたはmeaningを指定してください"
+            continue
+        if operation.word is not None and operation.word != values["word"]:
+            key = word_key(operation.word)
+            if key != values["word_key"]:
+                if values["word_key"] is not None and taken.get(values["word_key"]) == operation.id:
+                    del taken[values["word_key"]]
+                if key in taken:
+                    key = None
+                else:
+                    taken[key] = operation.id
+            values = {**values, "word": operation.word, "word_key": key}
+        if operation.meaning is not None:
+            values = {**values, "meaning": operation.meaning}
+        updates[operation.id] = values
+        result.ok = True
+    
+    # 削除・更新・追加の順に、それぞれ1文で適用する（キーを空けてから使う）
+    if deleted:
+        db.execute(delete(words_table).where(words_table.c.id.in_(deleted)))
+        add_tombstones(db, notebook_id, deleted, version)
+    if updates:
+        rekeyed = [word_id for word_id, values in updates.items() if values["word_key"] != current[word_id].word_key]
+        if rekeyed:
+            # 単語どうしでキーを入れ替える場合に一意インデックスに違反しないよう、先に外す
+            db.execute(update(words_table).where(words_table.c.id.in_(rekeyed)).values(word_key=None))
+        db.execute(
+            update(words_table)
+            .where(words_table.c.id == bindparam("b_id"))
+            .values(
+                word=bindparam("b_word"),
+                word_lower=bindparam("b_word_lower"),
+                meaning=bindparam("b_meaning"),
+                word_key=bindparam("b_word_key"),
+                version=version,
+            ),
+            [
+                {
+                    "b_id": word_id, "b_word_lower": lower_word(values["word"]),
+                    **{f"b_{key}": value for key, value in values.items()}
+                }
+                for word_id, values in updates.items()
+            ]
+        )
+    created = []
+    if creates:
+        created = db.scalars(
+            insert(Word).returning(Word, sort_by_parameter_order=True),
+            [values for _, values in creates]
+        ).all()
+    # 削除・変更で外れたキーを、残っている同じ単語に付け直す（追加した単語が使ったキーは除く）
+    freed_keys = {current[word_id].word_key for word_id in deleted}
+    freed_keys.update(
+        current[word_id].word_key for word_id, values in updates.items()
+        if values["word_key"] != current[word_id].word_key
+    )
+    reassign_word_keys(db, {notebook_id: freed_keys})
+    updated = {}
+    if updates:
+        updated = {word.id: word for word in db.scalars(select(Word).where(Word.id.in_(updates.keys())))}
+    
+    apply_stats_delta(
+        db, notebook_id,
+        word_count=len(created) - len(deleted),
+        mastered_count=-sum(1 for word_id in deleted if current[word_id].mastered),
+        correct_total=-sum(current[word_id].correct_count or 0 for word_id in deleted),
+        wrong_total=-sum(current[word_id].wrong_count or 0 for word_id in deleted)
+    )
+    
+    for (result, _), word in zip(creates, created):
+        result.id = word.id
+        result.word = WordResponse.model_validate(word)
+    for result in results:
+        if result.ok and result.op == "update" and result.id in updated:
+            result.word = WordResponse.model_validate(updated[result.id])
+    # コミット後の再読み込みを避けるため、先にレスポンスを作る
+    response = WordBatchResponse(notebook_id=notebook_id, version=version, results=results)
+    db.commit()
+    return response
+
 # 学習進捗更新
-@app.put("/api/words/{word_id}/progress", response_model=WordResponse)
-def update_progress(word_id: int, progress: ProgressUpdate, db: Session = Depends(get_db)):
-    db_word = db.query(Word).filter(Word.id == word_id).first()
-    if db_word is None:
+@router.put("/api/words/{word_id}/progress", response_model=WordResponse)
+async def update_progress(word_id: int, progress: ProgressUpdate, db: AsyncSession = Depends(get_async_write_db)):
+    # 処理本体は同期セッションで書き、run_syncでイベントループをブロックせずに実行する
+    return await db.run_sync(apply_progress, word_id, progress)
+
+def apply_progress(db: Session, word_id: int, progress: ProgressUpdate):
+    # 読み込んでから加算するのではなく、サーバー側で加算する（同時リクエストでも数え漏れがない）
+    now = datetime.now()
+    # 単語を読む前に、単語の単語帳のバージョンを進める（その間に別の単語帳へ移動された場合は見つからない扱い）
+    versions = bump_word_versions(db, [word_id])
+    if not versions:
         raise HTTPException(status_code=404, detail="単語が見つかりません")
-    
+    [(notebook_id, version)] = versions.items()
+    values = {"last_studied": now, "version": version}
     if progress.correct:
-        db_word.correct_count += 1
+        values["correct_count"] = Word.correct_count + 1
     else:
-        db_word.wrong_count += 1
+        values["wrong_count"] = Word.wrong_count + 1
+    
+    stmt = update(Word).where(Word.id == word_id, Word.notebook_id == notebook_id).values(**values)
+    if db.get_bind().dialect.update_returning:
+        db_word = db.scalars(
+            stmt.returning(Word),
+            execution_options={"synchronize_session": False}
+        ).first()
+    else:
+        db.execute(stmt, execution_options={"synchronize_session": False})
+        db_word = db.query(Word).filter(Word.id == word_id, Word.notebook_id == notebook_id).first()
+    if db_word is None:
+        raise HTTPException(status_code=404, detail="単語が見つかりません")
     
-    db_word.last_studied = datetime.now()
+    # 更新で行がロックされた後に、次回の出題日時とマスター状態を更新する
+    next_values = schedule(db_word.ease, db_word.interval_days, db_word.repetitions, progress.correct, now)
+    mastered_delta = 0
+    if progress.mastered is not None and progress.mastered != bool(db_word.mastered):
+        next_values["mastered"] = progress.mastered
+        mastered_delta = 1 if progress.mastered else -1
+    db.execute(
+        update(Word).where(Word.id == word_id).values(**next_values),
+        execution_options={"synchronize_session": False}
+    )
+    for key, value in next_values.items():
+        set_committed_value(db_word, key, value)
     
-    if progress.mastered is not None:
-        db_word.mastered = progress.mastered
+    apply_stats_delta(
+        db, db_word.notebook_id,
+        mastered_count=mastered_delta,
+        correct_total=1 if progress.correct else 0,
+        wrong_total=0 if progress.correct else 1,
+        last_studied=now
+    )
+    record_reviews(db, [review_row(
+        word_id, db_word.notebook_id, progress.correct, now,
+        session_id=progress.session_id, latency_ms=progress.latency_ms
+    )])
     
+    # コミット後の再読み込みを避けるため、先にレスポンスを作る
+    response = WordResponse.model_validate(db_word)
     db.commit()
-    db.refresh(db_word)
-    return db_word
+    return response
+
+# 一括送信できる回答イベントの上限
+PROGRESS_BATCH_MAX_EVENTS = 5000
+
+# 学習進捗の一括更新（回答イベントを順に適用、1トランザクション）
+@router.post("/api/words/progress/batch")
+async def update_progress_batch(batch: ProgressBatch, db: AsyncSession = Depends(get_async_write_db)):
+    return await db.run_sync(apply_progress_batch, batch)
+
+def apply_progress_batch(db: Session, batch: ProgressBatch):
+    if len(batch.events) > PROGRESS_BATCH_MAX_EVENTS:
+        raise HTTPException(status_code=400, detail=f"eventsは{PROGRESS_BATCH_MAX_EVENTS}件以内で指定してください")
+    
+    # 単語を読む前に、単語の単語帳のバージョンを進める
+    event_word_ids = {event.word_id for event in batch.events}
+    versions = bump_word_versions(db, event_word_ids)
+    
+    db_session = None
+    if batch.session_id is not None:
+        db_session = db.query(StudySession).filter(StudySession.id == batch.session_id).first()
+        if db_session is None:
+            raise HTTPException(status_code=404, detail="セッションが見つかりません")
+    
+    # 存在しない単語（バージョンを進めた後に別の単語帳へ移動された単語を含む）のイベントは適用せず、レスポンスで返す
+    word_notebooks = {}
+    if versions:
+        word_notebooks = dict(db.execute(
+            select(Word.id, Word.notebook_id).where(Word.id.in_(event_word_ids), Word.notebook_id.in_(list(versions)))
+        ).all())
+    existing_ids = set(word_notebooks)
+    unknown_ids = sorted(event_word_ids - existing_ids)
+    
+    # 単語ごと・日付ごとに集計（マスター状態は最後に指定された値を使う）
+    now = datetime.now()
+    per_word = {}
+    per_day = {}
+    for event in batch.events:
+        if event.word_id not in existing_ids:
+            continue
+        studied_at = event.timestamp or now
+        word = per_word.setdefault(event.word_id, {"correct": 0, "wrong": 0, "last_studied": studied_at, "mastered": None})
+        day = per_day.setdefault(studied_at.date(), {"correct": 0, "wrong": 0, "word_ids": set()})
+        key = "correct" if event.correct else "wrong"
+        word[key] += 1
+        day[key] += 1
+        day["word_ids"].add(event.word_id)
+        word["last_studied"] = max(word["last_studied"], studied_at)
+        if event.mastered is not None:
+            word["mastered"] = event.mastered
+    
+    if per_word:
+        # 読み込まずにサーバー側で加算する
+        words_table = Word.__table__
+        stmt = (
+            update(words_table)
+            .where(words_table.c.id == bindparam("b_id"))
+            .values(
+                correct_count=words_table.c.correct_count + bindparam("b_correct"),
+                wrong_count=words_table.c.wrong_count + bindparam("b_wrong"),
+                last_studied=bindparam("b_last_studied"),
+            )
+        )
+        db.execute(stmt, [
+            {
+                "b_id": word_id,
+                "b_correct": values["correct"],
+                "b_wrong": values["wrong"],
+                "b_last_studied": values["last_studied"],
+            }
+            for word_id, values in per_word.items()
+        ])
+        
+        # 更新で行がロックされた後に、イベント順に次回の出題日時を計算する
+        states = {
+            row.id: row
+            for row in db.execute(
+                select(
+                    Word.id, Word.notebook_id, Word.mastered,
+                    Word.ease, Word.interval_days, Word.repetitions
+                ).where(Word.id.in_(per_word.keys()))
+            )
+        }
+        schedules = {}
+        for event in batch.events:
+            if event.word_id not in per_word:
+                continue
+            current = schedules.get(event.word_id) or states[event.word_id]._asdict()
+            schedules[event.word_id] = schedule(
+                current["ease"], current["interval_days"], current["repetitions"],
+                event.correct, event.timestamp or now
+            )
+        
+        # 単語帳ごとの集計の差分
+        notebook_deltas = {}
+        for word_id, values in per_word.items():
+            state = states[word_id]
+            mastered = bool(state.mastered) if values["mastered"] is None else values["mastered"]
+            schedules[word_id]["mastered"] = mastered
+            delta = notebook_deltas.setdefault(
+                state.notebook_id,
+                {"mastered_count": 0, "correct_total": 0, "wrong_total": 0, "last_studied": values["last_studied"]}
+            )
+            delta["mastered_count"] += int(mastered) - int(bool(state.mastered))
+            delta["correct_total"] += values["correct"]
+            delta["wrong_total"] += values["wrong"]
+            delta["last_studied"] = max(delta["last_studied"], values["last_studied"])
+        
+        db.execute(
+            update(words_table)
+            .where(words_table.c.id == bindparam("b_id"))
+            .values(
+                ease=bindparam("b_ease"),
+                interval_days=bindparam("b_interval_days"),
+                repetitions=bindparam("b_repetitions"),
+                due_at=bindparam("b_due_at"),
+                mastered=bindparam("b_mastered"),
+                version=bindparam("b_version"),
+            ),
+            [
+                {
+                    "b_id": word_id,
+                    "b_version": versions.get(word_notebooks[word_id]),
+                    **{f"b_{key}": value for key, value in next_values.items()},
+                }
+                for word_id, next_values in schedules.items()
+            ]
+        )
+        for notebook_id, delta in notebook_deltas.items():
+            apply_stats_delta(db, notebook_id, **delta)
+        
+        # 回答の履歴（イベントごとに1行、まとめてINSERT）
+        record_reviews(db, (
+            review_row(
+                event.word_id, states[event.word_id].notebook_id, event.correct, event.timestamp or now,
+                session_id=batch.session_id, latency_ms=event.latency_ms
+            )
+            for event in batch.events
+            if event.word_id in per_word
+        ))
+    
+    correct_total = sum(values["correct"] for values in per_word.values())
+    wrong_total = sum(values["wrong"] for values in per_word.values())
+    if db_session is not None:
+        db_session.correct_count = StudySession.correct_count + correct_total
+        db_session.wrong_count = StudySession.wrong_count + wrong_total
+        db_session.words_studied = StudySession.words_studied + len(per_word)
+    
+    for day, values in per_day.items():
+        add_daily_stats(
+            db, day,
+            words_studied=len(values["word_ids"]),
+            correct_count=values["correct"],
+            wrong_count=values["wrong"]
+        )
+    
+    db.commit()
+    return {
+        "applied_count": correct_total + wrong_total,
+        "updated_words": len(per_word),
+        "unknown_word_ids": unknown_ids
+    }
+
+# 出題予定の単語取得で指定できる件数の上限
+DUE_WORDS_MAX_LIMIT = 200
+
+# 出題予定の単語を期限順に取得（間隔反復）
+@router.get("/api/notebooks/{notebook_id}/due", response_model=List[WordResponse])
+def get_due_words(notebook_id: int, limit: int = 20, db: Session = Depends(get_db)):
+    notebook = db.query(Notebook.id).filter(Notebook.id == notebook_id, Notebook.deleted_at.is_(None)).first()
+    if notebook is None:
+        raise HTTPException(status_code=404, detail="単語帳が見つかりません")
+    
+    # (notebook_id, due_at) インデックスの範囲スキャンで先頭から取得
+    limit = max(1, min(limit, DUE_WORDS_MAX_LIMIT))
+    query = (
+        select(Word)
+        .where(Word.notebook_id == notebook_id, Word.due_at <= datetime.now())
+        .order_by(Word.due_at)
+        .limit(limit)
+    )
+    return db.execute(query).scalars().all()
 
 # 間違えた単語のみを取得（単語帳IDでフィルタリング）
-@app.get("/api/words/wrong-only", response_model=List[WordResponse])
+@router.get("/api/words/wrong-only", response_model=List[WordResponse])
 def get_wrong_words(notebook_id: Optional[int] = None, db: Session = Depends(get_db)):
-    query = db.query(Word).filter(Word.wrong_count > 0)
+    query = (
+        db.query(Word)
+        .join(Notebook, (Notebook.id == Word.notebook_id) & Notebook.deleted_at.is_(None))
+        .filter(Word.wrong_count > 0)
+    )
     if notebook_id is not None:
         query = query.filter(Word.notebook_id == notebook_id)
     words = query.all()
     return words
 
 # セッション作成
-@app.post("/api/sessions", response_model=SessionResponse)
-def create_session(session: SessionCreate, db: Session = Depends(get_db)):
+@router.post("/api/sessions", response_model=SessionResponse)
+async def create_session(session: SessionCreate, db: AsyncSession = Depends(get_async_write_db)):
     db_session = StudySession(
         start_time=session.start_time or datetime.now()
     )
     db.add(db_session)
-    db.commit()
-    db.refresh(db_session)
+    await db.commit()
+    await db.refresh(db_session)
     return db_session
 
 # セッション更新
-@app.put("/api/sessions/{session_id}", response_model=SessionResponse)
-def update_session(session_id: int, session_update: SessionUpdate, db: Session = Depends(get_db)):
+@router.put("/api/sessions/{session_id}", response_model=SessionResponse)
+async def update_session(session_id: int, session_update: SessionUpdate, db: AsyncSession = Depends(get_async_write_db)):
+    return await db.run_sync(apply_session_update, session_id, session_update)
+
+def apply_session_update(db: Session, session_id: int, session_update: SessionUpdate):
     db_session = db.query(StudySession).filter(StudySession.id == session_id).first()
     if db_session is None:
         raise HTTPException(status_code=404, detail="セッションが見つかりません")
     
+    # 日々の統計には前回の値からの差分だけを加算する
+    # （回答の一括送信で既に加算済みの分や、同じ値での再送信を二重に数えないため）
+    previous = {
+        "correct_count": db_session.correct_count or 0,
+        "wrong_count": db_session.wrong_count or 0,
+        "words_studied": db_session.words_studied or 0,
+        "duration_seconds": db_session.duration_seconds or 0,
+    }
+    
     if session_update.end_time is not None:
         db_session.end_time = session_update.end_time
     if session_update.correct_count is not None:
@@ -480,55 +1407,106 @@ def update_session(session_id: int, session_update: SessionUpdate, db: Session =
     if session_update.duration_seconds is not None:
         db_session.duration_seconds = session_update.duration_seconds
     
-    db.commit()
-    db.refresh(db_session)
-    
     # 日々の統計を更新
-    update_daily_stats(db, db_session)
-    
-    return db_session
-
-# 日々の統計を更新
-def update_daily_stats(db: Session, session: StudySession):
-    today = date.today()
-    daily_stat = db.query(DailyStats).filter(DailyStats.date == today).first()
-    
-    if daily_stat is None:
-        total_attempts = session.correct_count + session.wrong_count
-        accuracy = (session.correct_count / total_attempts * 100) if total_attempts > 0 else 0.0
-        daily_stat = DailyStats(
-            date=today,
-            study_time_seconds=session.duration_seconds or 0,
-            words_studied=session.words_studied,
-            correct_count=session.correct_count,
-            wrong_count=session.wrong_count,
-            accuracy_rate=accuracy
-        )
-        db.add(daily_stat)
-    else:
-        daily_stat.study_time_seconds += session.duration_seconds or 0
-        daily_stat.words_studied += session.words_studied
-        daily_stat.correct_count += session.correct_count
-        daily_stat.wrong_count += session.wrong_count
-        total_attempts = daily_stat.correct_count + daily_stat.wrong_count
-        daily_stat.accuracy_rate = (daily_stat.correct_count / total_attempts * 100) if total_attempts > 0 else 0.0
+    add_daily_stats(
+        db, date.today(),
+        study_time_seconds=max((db_session.duration_seconds or 0) - previous["duration_seconds"], 0),
+        words_studied=max((db_session.words_studied or 0) - previous["words_studied"], 0),
+        correct_count=max((db_session.correct_count or 0) - previous["correct_count"], 0),
+        wrong_count=max((db_session.wrong_count or 0) - previous["wrong_count"], 0)
+    )
     
     db.commit()
+    db.refresh(db_session)
+    return SessionResponse.model_validate(db_session)
+
+# 日々の統計に加算（コミットは呼び出し側で行う）
+# 同じ日付の行がなければ作成し、あればサーバー側で加算する（INSERT ... ON CONFLICT DO UPDATE）
+def add_daily_stats(
+    db: Session,
+    day: date,
+    study_time_seconds: int = 0,
+    words_studied: int = 0,
+    correct_count: int = 0,
+    wrong_count: int = 0
+):
+    total_attempts = correct_count + wrong_count
+    stmt = dialect_insert(db, DailyStats).values(
+        date=day,
+        study_time_seconds=study_time_seconds,
+        words_studied=words_studied,
+        correct_count=correct_count,
+        wrong_count=wrong_count,
+        accuracy_rate=(correct_count / total_attempts * 100) if total_attempts > 0 else 0.0
+    )
+    stats = DailyStats.__table__.c
+    new_correct = stats.correct_count + stmt.excluded.correct_count
+    new_total = new_correct + stats.wrong_count + stmt.excluded.wrong_count
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[stats.date],
+        set_={
+            "study_time_seconds": stats.study_time_seconds + stmt.excluded.study_time_seconds,
+            "words_studied": stats.words_studied + stmt.excluded.words_studied,
+            "correct_count": new_correct,
+            "wrong_count": stats.wrong_count + stmt.excluded.wrong_count,
+            "accuracy_rate": case((new_total > 0, new_correct * 100.0 / new_total), else_=0.0),
+        }
+    )
+    db.execute(stmt)
 
 # 日々の統計取得
-@app.get("/api/stats/daily", response_model=List[DailyStatsResponse])
+@router.get("/api/stats/daily", response_model=List[DailyStatsResponse])
 def get_daily_stats(days: int = 30, db: Session = Depends(get_db)):
     start_date = date.today() - timedelta(days=days)
     stats = db.query(DailyStats).filter(DailyStats.date >= start_date).order_by(DailyStats.date).all()
     return stats
 
+# 学習履歴の統計（週・月ごとの集計、直近7日・30日の正答率、連続学習日数、単語帳ごとの内訳）
+# 日付ごとにキャッシュし、ETagを返す（回答が記録されると無効化）
+@router.get("/api/stats/history")
+def get_stats_history(
+    request: Request,
+    bucket: Literal["day", "week", "month"] = "day",
+    notebook_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    today = date.today()
+    return response_cache.respond(
+        request, history_key(notebook_id, bucket, today),
+        lambda: build_history(db, bucket, notebook_id, today)
+    )
+
 # 最新のセッション取得
-@app.get("/api/sessions/latest", response_model=Optional[SessionResponse])
-def get_latest_session(db: Session = Depends(get_db)):
-    session = db.query(StudySession).order_by(StudySession.start_time.desc()).first()
-    return session
+@router.get("/api/sessions/latest", response_model=Optional[SessionResponse])
+async def get_latest_session(db: AsyncSession = Depends(get_async_db)):
+    query = select(StudySession).order_by(StudySession.start_time.desc()).limit(1)
+    return (await db.execute(query)).scalars().first()
+
+# レスポンスキャッシュの統計（ヒット数・ミス数など）
+@router.get("/api/cache/stats")
+def get_cache_stats():
+    return response_cache.stats()
+
+# コネクションプールの状態（貸し出し回数・待ち時間・タイムアウト数など）
+@router.get("/api/db/pool")
+def get_pool_status():
+    return pool_status()
 
-@app.get("/")
+# 保持期間を過ぎた回答の履歴を日ごとの集計にまとめる（python review_log.py でも実行できる）
+@router.post("/api/review-log/rollup")
+def rollup_review_log(retention_days: Optional[int] = None, db: Session = Depends(get_write_db)):
+    if retention_days is not None and retention_days < 0:
+        raise HTTPException(status_code=400, detail="retention_daysは0以上で指定してください")
+    return rollup_reviews(db, retention_days)
+
+# Prometheus形式のメトリクス
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/")
 def root():
     return {"message": "単語帳API"}
 
+
+app = create_app()
@@ -0,0 +1,273 @@
+"""
+リクエストとSQLのメトリクス
+ASGIミドルウェアでルートごとのレイテンシ・レスポンスサイズを、SQLAlchemyのイベントで
+リクエストごとのクエリ数・クエリ時間・取り出した行数・変更した行数を記録し、Prometheusのテキスト形式で出力します。
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import settings
+from database import pool_status
+from log import get_logger
+
+logger = get_logger("slow_query")
+
+# レイテンシのヒストグラムの区切り（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 1リクエストあたりのクエリ数のヒストグラムの区切り（N+1の検出用）
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# スロークエリログに出すパラメータの最大件数（executemanyの場合）
+SLOW_QUERY_MAX_PARAMS = 5
+
+
+class RequestMetrics:
+    """1リクエスト分の計測値（SQLAlchemyのイベントから加算する）"""
+
+    __slots__ = ("query_count", "query_seconds", "rows_returned", "rows_affected")
+
+    def __init__(self):
+        self.query_count = 0
+        self.query_seconds = 0.0
+        self.rows_returned = 0
+        self.rows_affected = 0
+
+
+# 処理中のリクエストの計測値（スレッドプールやrun_syncにもコンテキストごと引き継がれる）
+current_request: contextvars.ContextVar[Optional[RequestMetrics]] = contextvars.ContextVar(
+    "current_request", default=None
+)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.query_seconds = 0.0
+        self.rows_returned = 0
+        self.rows_affected = 0
+        self.response_bytes = 0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+        self.query_latency = Histogram(LATENCY_BUCKETS)
+        self.slow_queries = 0
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float,
+                        response_bytes: int, request_metrics: RequestMetrics):
+        with self._lock:
+            metrics = self._routes.get((method, route, status))
+            if metrics is None:
+                metrics = self._routes[(method, route, status)] = RouteMetrics()
+            metrics.latency.observe(seconds)
+            metrics.queries.observe(request_metrics.query_count)
+            metrics.query_seconds += request_metrics.query_seconds
+            metrics.rows_returned += request_metrics.rows_returned
+            metrics.rows_affected += request_metrics.rows_affected
+            metrics.response_bytes += response_bytes
+
+    def observe_query(self, seconds: float, slow: bool):
+        with self._lock:
+            self.query_latency.observe(seconds)
+            self.slow_queries += int(slow)
+
+    def render(self) -> str:
+        """Prometheusのテキスト形式で出力"""
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histogram(name, labels, hist):
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {hist.count}')
+            lines.append(f"{name}_sum{_braces(labels)} {hist.sum}")
+            lines.append(f"{name}_count{_braces(labels)} {hist.count}")
+
+        with self._lock:
+            routes = sorted(self._routes.items())
+
+            header("http_request_duration_seconds", "histogram", "リクエストの処理時間")
+            for (method, route, status), metrics in routes:
+                histogram("http_request_duration_seconds", _labels(method, route, status), metrics.latency)
+
+            header("http_request_db_queries", "histogram", "1リクエストあたりのSQLクエリ数")
+            for (method, route, status), metrics in routes:
+                histogram("http_request_db_queries", _labels(method, route, status), metrics.queries)
+
+            for name, attr, help_text in (
+                ("http_request_db_seconds_total", "query_seconds", "SQLクエリの合計時間"),
+                ("http_request_db_rows_returned_total", "rows_returned", "SQLの結果から取り出した行数の合計"),
+                ("http_request_db_rows_affected_total", "rows_affected", "INSERT・UPDATE・DELETEで変更した行数の合計"),
+                ("http_response_size_bytes_total", "response_bytes", "レスポンスボディの合計サイズ"),
+            ):
+                header(name, "counter", help_text)
+                for (method, route, status), metrics in routes:
+                    lines.append(f"{name}{_braces(_labels(method, route, status))} {getattr(metrics, attr)}")
+
+            header("db_query_duration_seconds", "histogram", "SQLクエリの実行時間（リクエスト外を含む）")
+            histogram("db_query_duration_seconds", "", self.query_latency)
+            header("db_slow_queries_total", "counter", "スロークエリの件数")
+            lines.append(f"db_slow_queries_total {self.slow_queries}")
+
+        for name, kind, key, help_text in (
+            ("db_pool_checked_out", "gauge", "checked_out", "貸し出し中の接続数"),
+            ("db_pool_overflow", "gauge", "overflow", "プールを超えて作成された接続数"),
+            ("db_pool_checkouts_total", "counter", "checkouts", "接続の貸し出し回数"),
+            ("db_pool_wait_seconds_total", "counter", "wait_seconds_total", "接続の貸し出しを待った合計時間"),
+            ("db_pool_timeouts_total", "counter", "timeouts", "接続の貸し出しのタイムアウト数"),
+        ):
+            header(name, kind, help_text)
+            for engine_name, status in pool_status().items():
+                if key in status:
+                    lines.append(f'{name}{{engine="{engine_name}"}} {status[key]}')
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(method: str, route: str, status: int) -> str:
+    return f'method="{_escape(method)}",route="{_escape(route)}",status="{status}",'
+
+
+def _braces(labels: str) -> str:
+    labels = labels.rstrip(",")
+    return f"{{{labels}}}" if labels else ""
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """ルートごとのレイテンシ・クエリ数・レスポンスサイズを記録するASGIミドルウェア"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_metrics = RequestMetrics()
+        token = current_request.set(request_metrics)
+        status = 500
+        response_bytes = 0
+
+        async def send_wrapper(message):
+            nonlocal status, response_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request.reset(token)
+            # ルーティング後はscopeにルートが設定される（パスパラメータを含まないテンプレートで集計する）
+            route = scope.get("route")
+            registry.observe_request(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                status,
+                time.perf_counter() - start,
+                response_bytes,
+                request_metrics,
+            )
+
+
+class CountingCursor:
+    """取り出した行数をリクエストの計測値に加算するDBAPIカーソルのラッパー（それ以外の操作はそのまま渡す）"""
+
+    def __init__(self, cursor, request_metrics: RequestMetrics):
+        object.__setattr__(self, "_cursor", cursor)
+        object.__setattr__(self, "_request_metrics", request_metrics)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._request_metrics.rows_returned += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._request_metrics.rows_returned += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._request_metrics.rows_returned += len(rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["query_start"].pop()
+    slow = settings.SLOW_QUERY_MS > 0 and seconds * 1000 >= settings.SLOW_QUERY_MS
+    registry.observe_query(seconds, slow)
+
+    request_metrics = current_request.get()
+    if request_metrics is not None:
+        request_metrics.query_count += 1
+        request_metrics.query_seconds += seconds
+        # 行を返す文は、結果を作る前にカーソルを差し替えて取り出した行数を数える
+        if context is not None and cursor.description is not None and context.cursor is cursor:
+            context.cursor = CountingCursor(cursor, request_metrics)
+        # rowcountはSELECTでは取得した行数にならない（sqlite3・aiosqliteでは-1）ため、変更した行数だけを数える
+        # RETURNING付きの文はsqlite3では行を取り出すまで数えられない
+        if context is not None and (context.isinsert or context.isupdate or context.isdelete) and cursor.rowcount > 0:
+            request_metrics.rows_affected += cursor.rowcount
+
+    if slow:
+        if executemany:
+            params = f"{list(parameters[:SLOW_QUERY_MAX_PARAMS])} （{len(parameters)}件）"
+        else:
+            params = parameters
+        logger.warning("スロークエリ %.1fms: %s パラメータ: %s", seconds * 1000, statement, params)
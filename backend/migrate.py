@@ -0,0 +1,649 @@
+"""
+マイグレーション
+スキーマの変更をバージョン順に適用し、適用済みのバージョンを schema_migrations テーブルに記録します。
+接続先は settings.DATABASE_URL（環境変数 DATABASE_URL）です。
+
+    python migrate.py            # 未適用のマイグレーションをすべて適用
+    python migrate.py status     # 適用状況を表示
+
+本番環境ではデプロイ時（Procfileのrelease）に1回だけ実行します。
+開発環境ではアプリの起動時にも実行されます（AUTO_MIGRATE）。
+各マイグレーションは、以前の個別のスクリプトで更新済みのデータベースに対しても安全に実行できます。
+テーブル・カラム・インデックスはマイグレーションを追加した時点の定義をこのファイルに固定し、models.pyのモデルは使いません
+（モデルを変更しても、既存のマイグレーションで作られるスキーマは変わらない）。
+"""
+import sys
+from datetime import datetime
+
+from sqlalchemy import (
+    JSON, BigInteger, Boolean, Column, Date, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table,
+    UniqueConstraint, bindparam, case, func, inspect, insert, select, text, update,
+)
+from sqlalchemy.dialects.postgresql import JSONB
+
+from database import WRITE_EXECUTION_OPTIONS, get_engine
+from importer import word_key
+from log import get_logger, setup_logging
+from models import SHUFFLE_KEY_RANGE, lower_word
+from notebook_settings import load_settings
+from search import create_gram_index, create_search_index, drop_gram_index
+
+logger = get_logger("migrate")
+
+# 複数のプロセスが同時にマイグレーションしないためのPostgreSQLのアドバイザリロックのキー
+ADVISORY_LOCK_KEY = 0x766F6361
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# 最初のバージョン（1）のテーブル。2〜8はこの定義のカラム・インデックスを、以前の個別のスクリプトで作られたテーブルに追加する
+# （DDLに影響しないPythonの既定値（関数）は省略する）
+initial_tables = MetaData()
+
+initial_notebooks = Table(
+    "notebooks",
+    initial_tables,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String, index=True),
+    Column("created_at", DateTime),
+    Column("settings", JSON().with_variant(JSONB(), "postgresql")),
+)
+
+initial_words = Table(
+    "words",
+    initial_tables,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("word", String, index=True),
+    Column("meaning", String),
+    Column("notebook_id", Integer, ForeignKey("notebooks.id"), nullable=False),
+    Column("correct_count", Integer, default=0),
+    Column("wrong_count", Integer, default=0),
+    Column("last_studied", DateTime, nullable=True),
+    Column("mastered", Boolean, default=False),
+    Column("ease", Float, default=2.5),
+    Column("interval_days", Float, default=0.0),
+    Column("repetitions", Integer, default=0),
+    Column("due_at", DateTime),
+    Index("ix_words_notebook_id_id", "notebook_id", "id"),
+    Index("ix_words_notebook_id_due_at", "notebook_id", "due_at"),
+)
+
+initial_notebook_stats = Table(
+    "notebook_stats",
+    initial_tables,
+    Column("notebook_id", Integer, ForeignKey("notebooks.id"), primary_key=True),
+    Column("word_count", Integer, default=0, nullable=False),
+    Column("mastered_count", Integer, default=0, nullable=False),
+    Column("correct_total", Integer, default=0, nullable=False),
+    Column("wrong_total", Integer, default=0, nullable=False),
+    Column("last_studied", DateTime, nullable=True),
+)
+
+Table(
+    "study_sessions",
+    initial_tables,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("start_time", DateTime),
+    Column("end_time", DateTime, nullable=True),
+    Column("correct_count", Integer, default=0),
+    Column("wrong_count", Integer, default=0),
+    Column("words_studied", Integer, default=0),
+    Column("duration_seconds", Integer, nullable=True),
+)
+
+Table(
+    "daily_stats",
+    initial_tables,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("date", Date, unique=True, index=True),
+    Column("study_time_seconds", Integer, default=0),
+    Column("words_studied", Integer, default=0),
+    Column("correct_count", Integer, default=0),
+    Column("wrong_count", Integer, default=0),
+    Column("accuracy_rate", Float, default=0.0),
+)
+
+
+def table_index(table, name):
+    return next(index for index in table.indexes if index.name == name)
+
+
+def drop_index_if_exists(connection, table_name, index_name):
+    """インデックスが存在する場合に削除"""
+    indexes = [idx["name"] for idx in inspect(connection).get_indexes(table_name)]
+    if index_name in indexes:
+        connection.exec_driver_sql(f"DROP INDEX {index_name}")
+        logger.info("%sテーブルの%sインデックスを削除しました", table_name, index_name)
+
+
+def notebook_foreign_key_ondelete(connection, table_name):
+    """テーブルのnotebooks.idへの外部キーのON DELETE（外部キーがなければNone、指定なしは空文字）"""
+    if connection.dialect.name == "sqlite":
+        # SQLiteのリフレクションはON DELETEを返さないため、PRAGMAで調べる
+        for row in connection.exec_driver_sql(f"PRAGMA foreign_key_list({table_name})"):
+            if row[2] == "notebooks":
+                return "" if row[6] == "NO ACTION" else row[6]
+        return None
+    for foreign_key in inspect(connection).get_foreign_keys(table_name):
+        if foreign_key["referred_table"] == "notebooks":
+            return (foreign_key["options"].get("ondelete") or "").upper()
+    return None
+
+
+def rebuild_sqlite_table(connection, table):
+    """
+    SQLiteのテーブルを指定した定義で作り直す（SQLiteでは外部キー制約を変更できないため）
+    インデックスは指定した定義で作り直し、単語帳が存在しない行はコピーしない
+    """
+    table_name = table.name
+    old_name = f"_{table_name}_old"
+    old_indexes = [index["name"] for index in inspect(connection).get_indexes(table_name)]
+    old_columns = {column["name"] for column in inspect(connection).get_columns(table_name)}
+    connection.exec_driver_sql(f"ALTER TABLE {table_name} RENAME TO {old_name}")
+    for index_name in old_indexes:
+        connection.exec_driver_sql(f"DROP INDEX {index_name}")
+    table.create(connection)
+
+    columns = ", ".join(column.name for column in table.columns if column.name in old_columns)
+    orphans = connection.exec_driver_sql(
+        f"SELECT COUNT(*) FROM {old_name} WHERE notebook_id NOT IN (SELECT id FROM notebooks) OR notebook_id IS NULL"
+    ).scalar_one()
+    if orphans:
+        logger.warning("%sテーブルの単語帳が存在しない%d行を削除します", table_name, orphans)
+    connection.exec_driver_sql(
+        f"INSERT INTO {table_name} ({columns}) SELECT {columns} FROM {old_name} "
+        f"WHERE notebook_id IN (SELECT id FROM notebooks)"
+    )
+    connection.exec_driver_sql(f"DROP TABLE {old_name}")
+    logger.info("%sテーブルを作り直しました", table_name)
+
+
+def replace_foreign_key_with_cascade(connection, table_name):
+    """PostgreSQLのnotebooks.idへの外部キー制約をON DELETE CASCADE付きのものに置き換える"""
+    foreign_key = next(
+        (fk for fk in inspect(connection).get_foreign_keys(table_name) if fk["referred_table"] == "notebooks"),
+        None
+    )
+    if foreign_key is not None:
+        connection.exec_driver_sql(f"ALTER TABLE {table_name} DROP CONSTRAINT {foreign_key['name']}")
+    connection.exec_driver_sql(
+        f"ALTER TABLE {table_name} ADD CONSTRAINT {table_name}_notebook_id_fkey FOREIGN KEY (notebook_id) "
+        f"REFERENCES notebooks (id) ON DELETE CASCADE"
+    )
+    logger.info("%sテーブルの外部キーにON DELETE CASCADEを設定しました", table_name)
+
+
+def add_column_if_not_exists(connection, table, column_name):
+    """テーブルの定義にあるカラムがデータベースのテーブルに存在しない場合に追加"""
+    table_name = table.name
+    columns = [col["name"] for col in inspect(connection).get_columns(table_name)]
+    if column_name in columns:
+        return False
+
+    column = table.c[column_name]
+    column_type = column.type.compile(dialect=connection.dialect)
+    default_str = ""
+    if column.default is not None and column.default.is_scalar:
+        value = column.default.arg
+        default_str = f" DEFAULT {str(value).upper() if isinstance(value, bool) else repr(value)}"
+        if not column.nullable:
+            # 既存の行には既定値が入るため、NOT NULLも付けられる
+            default_str += " NOT NULL"
+    connection.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}{default_str}")
+    logger.info("%sテーブルに%sカラムを追加しました", table_name, column_name)
+    return True
+
+
+# --- マイグレーション（追加するときは末尾に新しいバージョンで追加し、既存のものは変更しない） ---
+
+def create_tables(connection):
+    """最初のバージョンのテーブルのうち、存在しないものを作成"""
+    initial_tables.create_all(bind=connection)
+
+
+def add_progress_columns(connection):
+    """学習の進捗のカラム（旧 migrate_db.py）"""
+    for column_name in ("correct_count", "wrong_count", "last_studied", "mastered"):
+        add_column_if_not_exists(connection, initial_words, column_name)
+
+
+def add_word_notebook(connection):
+    """単語の単語帳（旧 migrate_notebook.py）。既存の単語はデフォルトの単語帳に入れる"""
+    if not add_column_if_not_exists(connection, initial_words, "notebook_id"):
+        return
+    if connection.execute(select(func.count()).select_from(initial_words)).scalar_one() == 0:
+        return
+    notebook_id = connection.execute(select(func.min(initial_notebooks.c.id))).scalar()
+    if notebook_id is None:
+        # settingsカラムはまだない場合があるため、テーブルの定義を使わずに作成する
+        connection.execute(
+            text("INSERT INTO notebooks (name, created_at) VALUES (:name, :now)"),
+            {"name": "デフォルト", "now": datetime.now()}
+        )
+        notebook_id = connection.execute(select(func.min(initial_notebooks.c.id))).scalar_one()
+        logger.info("デフォルトの単語帳を作成しました", extra={"notebook_id": notebook_id})
+    connection.execute(
+        update(initial_words).where(initial_words.c.notebook_id.is_(None)).values(notebook_id=notebook_id)
+    )
+
+
+def add_notebook_settings(connection):
+    """単語帳の設定のカラム（旧 migrate_notebook_settings.py。値はnormalize_notebook_settingsで補う）"""
+    add_column_if_not_exists(connection, initial_notebooks, "settings")
+
+
+def add_keyset_index(connection):
+    """
+    単語帳内のキーセットページネーション用複合インデックス
+    （先頭列が同じになるnotebook_id単体のインデックスは不要になる）
+    """
+    table_index(initial_words, "ix_words_notebook_id_id").create(connection, checkfirst=True)
+    drop_index_if_exists(connection, "words", "ix_words_notebook_id")
+
+
+def add_schedule_columns(connection):
+    """間隔反復のスケジュール（既存の単語はすぐに出題対象にする）"""
+    for column_name in ("ease", "interval_days", "repetitions"):
+        add_column_if_not_exists(connection, initial_words, column_name)
+    if add_column_if_not_exists(connection, initial_words, "due_at"):
+        connection.execute(
+            text("UPDATE words SET due_at = COALESCE(last_studied, :now)"),
+            {"now": datetime.now()}
+        )
+    table_index(initial_words, "ix_words_notebook_id_due_at").create(connection, checkfirst=True)
+
+
+def build_notebook_stats(connection):
+    """単語帳ごとの集計（テーブルが空の場合は既存の単語から作成）"""
+    stats, notebooks, words = initial_notebook_stats, initial_notebooks, initial_words
+    if connection.execute(select(func.count()).select_from(stats)).scalar_one() != 0:
+        return
+    aggregate = (
+        select(
+            notebooks.c.id,
+            func.count(words.c.id),
+            func.coalesce(func.sum(case((words.c.mastered, 1), else_=0)), 0),
+            func.coalesce(func.sum(words.c.correct_count), 0),
+            func.coalesce(func.sum(words.c.wrong_count), 0),
+            func.max(words.c.last_studied),
+        )
+        .select_from(notebooks)
+        .outerjoin(words, words.c.notebook_id == notebooks.c.id)
+        .group_by(notebooks.c.id)
+    )
+    connection.execute(
+        insert(stats).from_select(
+            ["notebook_id", "word_count", "mastered_count", "correct_total", "wrong_total", "last_studied"],
+            aggregate,
+        )
+    )
+
+
+def normalize_notebook_settings(connection):
+    """
+    単語帳の設定を辞書としてのJSONに揃える
+    以前はjson.dumps()した文字列をJSON列に保存していたため、二重にエンコードされた行を修正する
+    """
+    if connection.dialect.name == "postgresql":
+        column = next(col for col in inspect(connection).get_columns("notebooks") if col["name"] == "settings")
+        if not isinstance(column["type"], JSONB):
+            connection.exec_driver_sql("ALTER TABLE notebooks ALTER COLUMN settings TYPE JSONB USING settings::jsonb")
+            logger.info("notebooksテーブルのsettingsカラムをJSONBに変更しました")
+        condition = "settings IS NULL OR jsonb_typeof(settings) IN ('string', 'null')"
+    else:
+        condition = "settings IS NULL OR json_type(settings) IN ('text', 'null')"
+
+    rows = connection.execute(
+        select(initial_notebooks.c.id, initial_notebooks.c.settings).where(text(condition))
+    ).all()
+    if not rows:
+        return
+    connection.execute(
+        update(initial_notebooks)
+        .where(initial_notebooks.c.id == bindparam("b_id"))
+        .values(settings=bindparam("b_settings")),
+        [{"b_id": notebook_id, "b_settings": load_settings(raw)} for notebook_id, raw in rows]
+    )
+    logger.info("%d件の単語帳の設定を修正しました", len(rows))
+
+
+def add_search_index(connection):
+    """全文検索インデックス（FTS5やpg_trgmが使えない環境ではLIKE検索にフォールバックする）"""
+    try:
+        with connection.begin_nested():
+            create_search_index(connection)
+    except Exception as e:
+        logger.warning("検索インデックスを作成できませんでした（LIKE検索を使用します）: %s", e)
+
+
+def add_review_log(connection):
+    """回答の履歴と日ごとの集計のテーブル"""
+    metadata = MetaData()
+    review_log = Table(
+        "review_log",
+        metadata,
+        # SQLiteではINTEGER PRIMARY KEYでないと自動採番されないため
+        Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True),
+        Column("word_id", Integer, nullable=False),
+        Column("notebook_id", Integer, nullable=False),
+        Column("session_id", Integer, nullable=True),
+        Column("correct", Boolean, nullable=False),
+        Column("latency_ms", Integer, nullable=True),
+        Column("ts", DateTime, nullable=False),
+        Index("ix_review_log_ts", "ts"),
+        Index("ix_review_log_notebook_id_ts", "notebook_id", "ts"),
+        Index("ix_review_log_word_id_ts", "word_id", "ts"),
+    )
+    review_daily = Table(
+        "review_daily",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("notebook_id", Integer, nullable=False),
+        Column("day", Date, nullable=False),
+        Column("reviews", Integer, nullable=False),
+        Column("correct_count", Integer, nullable=False),
+        Column("wrong_count", Integer, nullable=False),
+        Column("latency_ms_total", BigInteger, nullable=False),
+        Column("latency_count", Integer, nullable=False),
+        UniqueConstraint("notebook_id", "day", name="uq_review_daily_notebook_id_day"),
+    )
+    review_log.create(connection, checkfirst=True)
+    review_daily.create(connection, checkfirst=True)
+
+
+def add_change_versions(connection):
+    """差分同期用の単語帳・単語のバージョンと削除した単語の記録（既存の行はバージョン0）"""
+    metadata = MetaData()
+    notebooks = Table(
+        "notebooks",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("version", Integer, default=0, nullable=False),
+    )
+    # インデックスの作成に使うカラムだけを定義する
+    words = Table(
+        "words",
+        metadata,
+        Column("notebook_id", Integer),
+        Column("version", Integer, default=0, nullable=False),
+        Index("ix_words_notebook_id_version", "notebook_id", "version"),
+    )
+    word_tombstones = Table(
+        "word_tombstones",
+        metadata,
+        Column("notebook_id", Integer, ForeignKey("notebooks.id"), primary_key=True),
+        Column("word_id", Integer, primary_key=True),
+        Column("version", Integer, nullable=False),
+        Column("deleted_at", DateTime, nullable=False),
+        Index("ix_word_tombstones_notebook_id_version", "notebook_id", "version"),
+    )
+    add_column_if_not_exists(connection, notebooks, "version")
+    add_column_if_not_exists(connection, words, "version")
+    table_index(words, "ix_words_notebook_id_version").create(connection, checkfirst=True)
+    word_tombstones.create(connection, checkfirst=True)
+
+
+def add_notebook_cascade(connection):
+    """
+    単語帳を削除したときに単語・集計・削除した単語の記録をデータベース側で削除する（ON DELETE CASCADE）
+    SQLiteではテーブルを作り直し、単語の全文検索のトリガーも作り直す
+    """
+    metadata = MetaData()
+    notebooks = Table(
+        "notebooks",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("deleted_at", DateTime, nullable=True),
+    )
+    # SQLiteで作り直すときの定義（この時点のすべてのカラムとインデックス）
+    words = Table(
+        "words",
+        metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("word", String, index=True),
+        Column("meaning", String),
+        Column("notebook_id", Integer, ForeignKey("notebooks.id", ondelete="CASCADE"), nullable=False),
+        Column("correct_count", Integer),
+        Column("wrong_count", Integer),
+        Column("last_studied", DateTime, nullable=True),
+        Column("mastered", Boolean),
+        Column("ease", Float),
+        Column("interval_days", Float),
+        Column("repetitions", Integer),
+        Column("due_at", DateTime),
+        Column("version", Integer, nullable=False),
+        Index("ix_words_notebook_id_id", "notebook_id", "id"),
+        Index("ix_words_notebook_id_due_at", "notebook_id", "due_at"),
+        Index("ix_words_notebook_id_version", "notebook_id", "version"),
+    )
+    notebook_stats = Table(
+        "notebook_stats",
+        metadata,
+        Column("notebook_id", Integer, ForeignKey("notebooks.id", ondelete="CASCADE"), primary_key=True),
+        Column("word_count", Integer, nullable=False),
+        Column("mastered_count", Integer, nullable=False),
+        Column("correct_total", Integer, nullable=False),
+        Column("wrong_total", Integer, nullable=False),
+        Column("last_studied", DateTime, nullable=True),
+    )
+    word_tombstones = Table(
+        "word_tombstones",
+        metadata,
+        Column("notebook_id", Integer, ForeignKey("notebooks.id", ondelete="CASCADE"), primary_key=True),
+        Column("word_id", Integer, primary_key=True),
+        Column("version", Integer, nullable=False),
+        Column("deleted_at", DateTime, nullable=False),
+        Index("ix_word_tombstones_notebook_id_version", "notebook_id", "version"),
+    )
+
+    add_column_if_not_exists(connection, notebooks, "deleted_at")
+    sqlite = connection.dialect.name == "sqlite"
+    for table in (words, notebook_stats, word_tombstones):
+        if notebook_foreign_key_ondelete(connection, table.name) == "CASCADE":
+            continue
+        if sqlite:
+            rebuild_sqlite_table(connection, table)
+            if table is words and "words_fts" in inspect(connection).get_table_names():
+                # トリガーは元のテーブルと一緒に削除されるため（idは変わらないので索引はそのまま使える）
+                create_search_index(connection)
+        else:
+            replace_foreign_key_with_cascade(connection, table.name)
+
+
+def add_word_key(connection):
+    """
+    重複判定用の正規化した単語と、単語帳内で一意にするインデックス
+    既に重複している単語は、単語帳ごとに最も古い単語だけにキーを付ける
+    """
+    words = Table(
+        "words",
+        MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("notebook_id", Integer),
+        Column("word", String),
+        Column("word_key", String, nullable=True),
+        Index("uq_words_notebook_id_word_key", "notebook_id", "word_key", unique=True),
+    )
+    add_column_if_not_exists(connection, words, "word_key")
+    result = connection.execution_options(yield_per=10000).execute(
+        select(words.c.id, words.c.notebook_id, words.c.word)
+        .where(words.c.word_key.is_(None))
+        .order_by(words.c.notebook_id, words.c.id)
+    )
+    notebook_id = None
+    seen = set()
+    updated = 0
+    for rows in result.partitions():
+        params = []
+        for row in rows:
+            if row.notebook_id != notebook_id:
+                notebook_id, seen = row.notebook_id, set()
+            key = word_key(row.word or "")
+            if key and key not in seen:
+                seen.add(key)
+                params.append({"b_id": row.id, "b_word_key": key})
+        if params:
+            connection.execute(
+                update(words).where(words.c.id == bindparam("b_id")).values(word_key=bindparam("b_word_key")),
+                params
+            )
+            updated += len(params)
+    table_index(words, "uq_words_notebook_id_word_key").create(connection, checkfirst=True)
+    logger.info("%d件の単語に重複判定用のキーを設定しました", updated)
+
+
+def add_shuffle_key(connection):
+    """
+    ランダム順のデッキのキーと、未習得の単語だけを対象にする部分インデックス
+    既存の単語のキーはデータベースの乱数で1文で設定する
+    """
+    unmastered = {"sqlite_where": text("mastered = 0"), "postgresql_where": text("mastered = false")}
+    words = Table(
+        "words",
+        MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("notebook_id", Integer),
+        Column("shuffle_key", Integer),
+        Index("ix_words_notebook_id_shuffle_key", "notebook_id", "shuffle_key", "id"),
+        Index("ix_words_unmastered_notebook_id_id", "notebook_id", "id", **unmastered),
+        Index("ix_words_unmastered_notebook_id_shuffle_key", "notebook_id", "shuffle_key", "id", **unmastered),
+    )
+    add_column_if_not_exists(connection, words, "shuffle_key")
+    if connection.dialect.name == "postgresql":
+        value = f"floor(random() * {SHUFFLE_KEY_RANGE})::integer"
+    else:
+        value = f"abs(random() % {SHUFFLE_KEY_RANGE})"
+    updated = connection.exec_driver_sql(
+        f"UPDATE words SET shuffle_key = {value} WHERE shuffle_key IS NULL"
+    ).rowcount
+    for index in words.indexes:
+        index.create(connection, checkfirst=True)
+    logger.info("%d件の単語にランダム順のキーを設定しました", updated)
+
+
+def add_gram_index(connection):
+    """2文字以下のクエリ用の部分文字列のテーブルと、前方一致のインデックス（17で作り直すため、まだ作成していなければ作らない）"""
+
+
+def rebuild_gram_index_unicode(connection):
+    """SQLiteの部分文字列と前方一致のインデックスをPythonの関数で小文字にして作り直していたもの（17で置き換える）"""
+
+
+def add_word_lower(connection):
+    """
+    Pythonで小文字にした単語のカラムと、それを使う部分文字列のテーブル・前方一致のインデックス
+    15・16で作ったもの（SQLiteのlower()はASCIIのみ、16はアプリが登録した関数を使う）は削除して作り直す
+    部分文字列は単語だけから作る（意味の2文字以下の検索はLIKEで行う）
+    """
+    # 16のトリガー・インデックスはアプリが登録した関数を使うため、カラムを追加する前に削除する
+    drop_gram_index(connection)
+    words = Table(
+        "words",
+        MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("word", String),
+        Column("word_lower", String),
+    )
+    add_column_if_not_exists(connection, words, "word_lower")
+    result = connection.execution_options(yield_per=10000).execute(
+        select(words.c.id, words.c.word).where(words.c.word.is_not(None)).order_by(words.c.id)
+    )
+    updated = 0
+    for rows in result.partitions():
+        connection.execute(
+            update(words).where(words.c.id == bindparam("b_id")).values(word_lower=bindparam("b_word_lower")),
+            [{"b_id": row.id, "b_word_lower": lower_word(row.word)} for row in rows]
+        )
+        updated += len(rows)
+    logger.info("%d件の単語に検索用の小文字の単語を設定しました", updated)
+    create_gram_index(connection)
+
+
+MIGRATIONS = [
+    (1, "create_tables", create_tables),
+    (2, "add_progress_columns", add_progress_columns),
+    (3, "add_word_notebook", add_word_notebook),
+    (4, "add_notebook_settings", add_notebook_settings),
+    (5, "add_keyset_index", add_keyset_index),
+    (6, "add_schedule_columns", add_schedule_columns),
+    (7, "build_notebook_stats", build_notebook_stats),
+    (8, "normalize_notebook_settings", normalize_notebook_settings),
+    (9, "add_search_index", add_search_index),
+    (10, "add_review_log", add_review_log),
+    (11, "add_change_versions", add_change_versions),
+    (12, "add_notebook_cascade", add_notebook_cascade),
+    (13, "add_word_key", add_word_key),
+    (14, "add_shuffle_key", add_shuffle_key),
+    (15, "add_gram_index", add_gram_index),
+    (16, "rebuild_gram_index_unicode", rebuild_gram_index_unicode),
+    (17, "add_word_lower", add_word_lower),
+]
+
+
+def applied_versions(connection):
+    """適用済みのバージョン（schema_migrationsテーブルがなければ作成）"""
+    schema_migrations.create(connection, checkfirst=True)
+    return set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+
+def upgrade(engine=None):
+    """
+    未適用のマイグレーションを順に適用（1つずつ別のトランザクションで実行し、成功したものを記録）
+    適用したバージョンのリストを返す
+    """
+    # SQLiteでは複数のワーカーが同時に起動しても、適用済みの確認から記録までを1つの書き込みロックで行う
+    engine = (engine or get_engine()).execution_options(**WRITE_EXECUTION_OPTIONS)
+    applied = []
+    with engine.connect() as connection:
+        postgresql = connection.dialect.name == "postgresql"
+        if postgresql:
+            connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+            connection.commit()
+        try:
+            for version, name, migration in MIGRATIONS:
+                with connection.begin():
+                    # ロックを待っている間に他のプロセスが適用した場合は飛ばす
+                    if version in applied_versions(connection):
+                        continue
+                    logger.info("マイグレーションを適用します", extra={"version": version, "migration": name})
+                    migration(connection)
+                    connection.execute(
+                        insert(schema_migrations).values(version=version, name=name, applied_at=datetime.now())
+                    )
+                applied.append(version)
+        finally:
+            if postgresql:
+                connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+                connection.commit()
+    return applied
+
+
+def status(engine=None):
+    """(バージョン, 名前, 適用日時) のリストを返す（未適用は適用日時がNone）"""
+    engine = engine or get_engine()
+    with engine.begin() as connection:
+        schema_migrations.create(connection, checkfirst=True)
+        applied_at = dict(connection.execute(select(schema_migrations.c.version, schema_migrations.c.applied_at)).all())
+    return [(version, name, applied_at.get(version)) for version, name, _ in MIGRATIONS]
+
+
+if __name__ == "__main__":
+    setup_logging()
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    if command == "upgrade":
+        logger.info("マイグレーションを開始します")
+        versions = upgrade()
+        logger.info("マイグレーションが完了しました", extra={"applied": versions})
+    elif command == "status":
+        for version, name, applied_at in status():
+            logger.info(
+                "適用済み" if applied_at else "未適用",
+                extra={"version": version, "migration": name, "applied_at": applied_at},
+            )
+    else:
+        sys.exit(f"不明なコマンドです: {command}（upgrade または status）")
@@ -1,7 +1,30 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, Date, ForeignKey, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import BigInteger, Column, Integer, String, DateTime, Boolean, Float, Date, ForeignKey, JSON, Index, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import relationship, validates
 from datetime import datetime, date
+import random
 from database import Base
+from notebook_settings import default_settings
+
+# 単語ごとのランダムな並び順のキーの範囲（0以上この値未満）
+SHUFFLE_KEY_RANGE = 2 ** 31
+
+
+def random_shuffle_key():
+    return random.randrange(SHUFFLE_KEY_RANGE)
+
+
+# 検索用に小文字にした単語（SQLiteのlower()はASCIIの英字しか小文字にしないため、Pythonで小文字にして保存する）
+def lower_word(word):
+    return word.lower() if word is not None else None
+
+
+def default_word_lower(context):
+    return lower_word(context.get_current_parameters().get("word"))
+
+
+# 未習得の単語だけを対象にする部分インデックスの条件（クエリでも同じ式を使うとインデックスが使われる）
+UNMASTERED = {"sqlite_where": text("mastered = 0"), "postgresql_where": text("mastered = false")}
 
 class Notebook(Base):
     __tablename__ = "notebooks"
@@ -9,35 +32,91 @@ class Notebook(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     created_at = Column(DateTime, default=datetime.now)
-    settings = Column(JSON, default=lambda: {
-        "exclude_mastered": False,
-        "default_direction": "word-to-meaning",
-        "default_order": "sequential",
-        "card_colors": {
-            "front": "blue",
-            "back": "light-blue"
-        }
-    })
+    # 設定（辞書のまま保存する。PostgreSQLではJSONB）
+    settings = Column(JSON().with_variant(JSONB(), "postgresql"), default=default_settings)
+    # 単語の変更のたびに1つ進める（差分同期用、changes.pyを参照）
+    version = Column(Integer, default=0, nullable=False)
+    # バックグラウンドで削除中の単語帳は削除を始めた日時（一覧などには表示しない）
+    deleted_at = Column(DateTime, nullable=True)
     
-    # リレーションシップ
-    words = relationship("Word", back_populates="notebook", cascade="all, delete-orphan")
+    # リレーションシップ（子の行はデータベースのON DELETE CASCADEで削除し、読み込まない）
+    words = relationship("Word", back_populates="notebook", cascade="all, delete-orphan", passive_deletes=True)
+    stats = relationship("NotebookStats", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
 
 class Word(Base):
     __tablename__ = "words"
+    __table_args__ = (
+        # 単語帳内のキーセットページネーション用（notebook_id単体の検索もこのインデックスで賄う）
+        Index("ix_words_notebook_id_id", "notebook_id", "id"),
+        # 出題予定の単語を期限順に取得するため
+        Index("ix_words_notebook_id_due_at", "notebook_id", "due_at"),
+        # 単語帳内で指定したバージョンより後に変更された単語を取得するため
+        Index("ix_words_notebook_id_version", "notebook_id", "version"),
+        # 単語帳内で同じ単語を1つにする（word_keyがNULLの行は対象外）
+        Index("uq_words_notebook_id_word_key", "notebook_id", "word_key", unique=True),
+        # デッキ（deck.py）の並び順。ランダム順はshuffle_key順で、未習得のみの場合は部分インデックスを使う
+        Index("ix_words_notebook_id_shuffle_key", "notebook_id", "shuffle_key", "id"),
+        Index("ix_words_unmastered_notebook_id_id", "notebook_id", "id", **UNMASTERED),
+        Index("ix_words_unmastered_notebook_id_shuffle_key", "notebook_id", "shuffle_key", "id", **UNMASTERED),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     word = Column(String, index=True)
+    # 重複判定用に正規化した単語（importer.word_key）。重複を許して追加した単語はNULL
+    word_key = Column(String, nullable=True)
+    # 前方一致と2文字以下の検索に使う小文字にした単語（search.py）。単語を変更するUPDATEでは一緒に更新する
+    word_lower = Column(String, default=default_word_lower)
     meaning = Column(String)
-    notebook_id = Column(Integer, ForeignKey("notebooks.id"), nullable=False, index=True)
+    notebook_id = Column(Integer, ForeignKey("notebooks.id", ondelete="CASCADE"), nullable=False)
     # 学習進捗フィールド
     correct_count = Column(Integer, default=0)
     wrong_count = Column(Integer, default=0)
     last_studied = Column(DateTime, nullable=True)
     mastered = Column(Boolean, default=False)
+    # 間隔反復（SM-2）のスケジュール
+    ease = Column(Float, default=2.5)
+    interval_days = Column(Float, default=0.0)
+    repetitions = Column(Integer, default=0)
+    due_at = Column(DateTime, default=datetime.now)
+    # 最後に変更されたときの単語帳のバージョン
+    version = Column(Integer, default=0, nullable=False)
+    # ランダム順のデッキの並び順（追加時に決める）
+    shuffle_key = Column(Integer, default=random_shuffle_key)
     
     # リレーションシップ
     notebook = relationship("Notebook", back_populates="words")
 
+    @validates("word")
+    def _set_word_lower(self, key, value):
+        self.word_lower = lower_word(value)
+        return value
+
+class WordTombstone(Base):
+    """
+    単語帳から削除（または別の単語帳へ移動）された単語
+    差分同期でクライアントに削除を伝えるため、削除したときの単語帳のバージョンを残す
+    """
+    __tablename__ = "word_tombstones"
+    __table_args__ = (
+        Index("ix_word_tombstones_notebook_id_version", "notebook_id", "version"),
+    )
+
+    notebook_id = Column(Integer, ForeignKey("notebooks.id", ondelete="CASCADE"), primary_key=True)
+    word_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, nullable=False, default=datetime.now)
+
+class NotebookStats(Base):
+    """単語帳ごとの集計（単語の追加・削除・進捗更新のたびに差分で更新）"""
+    __tablename__ = "notebook_stats"
+
+    notebook_id = Column(Integer, ForeignKey("notebooks.id", ondelete="CASCADE"), primary_key=True)
+    word_count = Column(Integer, default=0, nullable=False)
+    mastered_count = Column(Integer, default=0, nullable=False)
+    correct_total = Column(Integer, default=0, nullable=False)
+    wrong_total = Column(Integer, default=0, nullable=False)
+    last_studied = Column(DateTime, nullable=True)
+
 class StudySession(Base):
     __tablename__ = "study_sessions"
 
@@ -60,3 +139,40 @@ class DailyStats(Base):
     wrong_count = Column(Integer, default=0)
     accuracy_rate = Column(Float, default=0.0)
 
+class ReviewLog(Base):
+    """
+    回答ごとの履歴（追記のみ）
+    単語の削除後も履歴を残すため、word_idには外部キーを付けない。古い行はReviewDailyに集約して削除する
+    """
+    __tablename__ = "review_log"
+    __table_args__ = (
+        Index("ix_review_log_ts", "ts"),
+        Index("ix_review_log_notebook_id_ts", "notebook_id", "ts"),
+        Index("ix_review_log_word_id_ts", "word_id", "ts"),
+    )
+
+    # SQLiteではINTEGER PRIMARY KEYでないと自動採番されないため
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    word_id = Column(Integer, nullable=False)
+    notebook_id = Column(Integer, nullable=False)
+    session_id = Column(Integer, nullable=True)
+    correct = Column(Boolean, nullable=False)
+    latency_ms = Column(Integer, nullable=True)
+    ts = Column(DateTime, nullable=False, default=datetime.now)
+
+class ReviewDaily(Base):
+    """回答の履歴を単語帳・日付ごとに集約したもの（review_logの古い行から作成）"""
+    __tablename__ = "review_daily"
+    __table_args__ = (
+        UniqueConstraint("notebook_id", "day", name="uq_review_daily_notebook_id_day"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    notebook_id = Column(Integer, nullable=False)
+    day = Column(Date, nullable=False)
+    reviews = Column(Integer, default=0, nullable=False)
+    correct_count = Column(Integer, default=0, nullable=False)
+    wrong_count = Column(Integer, default=0, nullable=False)
+    # 平均回答時間を求めるため、回答時間の合計と回答時間が記録された件数を持つ
+    latency_ms_total = Column(BigInteger, default=0, nullable=False)
+    latency_count = Column(Integer, default=0, nullable=False)
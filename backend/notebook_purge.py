@@ -0,0 +1,64 @@
+"""
+単語帳のバックグラウンド削除
+単語の多い単語帳は、削除を始めた日時（deleted_at）を記録して一覧などに表示しないようにしてから、
+単語をNOTEBOOK_DELETE_CHUNK_SIZE件ずつ別々のトランザクションで削除し、最後に単語帳の行を削除します
+（集計などの残りの行はON DELETE CASCADEで削除される）。
+1回の削除で書き込みのロックを長時間保持しないため、他の書き込みを待たせません。
+削除は他の書き込みと同じ書き込み用のセッション（WriteSessionLocal）で行い、コミットのたびに接続を返すため、
+待っている書き込みはチャンクの間に順番に実行されます。
+削除の途中でプロセスが終了した場合は、次のコマンドで続きから削除できます。
+
+    python notebook_purge.py
+"""
+from typing import Optional
+
+from sqlalchemy import delete, select
+
+from config import settings
+from database import SessionLocal, WriteSessionLocal, get_engine
+from log import get_logger, setup_logging
+from models import Notebook, Word
+
+logger = get_logger("notebook_purge")
+
+
+def purge_notebook(notebook_id: int, chunk_size: Optional[int] = None) -> int:
+    """単語帳の単語を一定件数ずつ削除してから単語帳を削除し、削除した単語数を返す"""
+    chunk_size = chunk_size or settings.NOTEBOOK_DELETE_CHUNK_SIZE
+    words = Word.__table__
+    deleted = 0
+    get_engine()
+    with WriteSessionLocal() as db:
+        while True:
+            chunk = (
+                select(words.c.id)
+                .where(words.c.notebook_id == notebook_id)
+                .order_by(words.c.id)
+                .limit(chunk_size)
+            )
+            count = db.execute(delete(words).where(words.c.id.in_(chunk))).rowcount
+            db.commit()
+            deleted += count
+            if count < chunk_size:
+                break
+        db.execute(delete(Notebook.__table__).where(Notebook.__table__.c.id == notebook_id))
+        db.commit()
+    logger.info("単語帳を削除しました", extra={"notebook_id": notebook_id, "words": deleted})
+    return deleted
+
+
+def purge_deleted_notebooks(chunk_size: Optional[int] = None) -> int:
+    """削除を始めたまま残っている単語帳をすべて削除し、削除した単語帳の数を返す"""
+    get_engine()
+    with SessionLocal() as db:
+        notebook_ids = db.execute(
+            select(Notebook.id).where(Notebook.deleted_at.is_not(None)).order_by(Notebook.id)
+        ).scalars().all()
+    for notebook_id in notebook_ids:
+        purge_notebook(notebook_id, chunk_size)
+    return len(notebook_ids)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    purge_deleted_notebooks()
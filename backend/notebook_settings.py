@@ -0,0 +1,65 @@
+"""
+単語帳の設定
+設定のスキーマ（Pydantic）と、DBに保存された値の正規化・部分更新を扱います。
+設定は notebooks.settings にJSON（PostgreSQLではJSONB）として1回だけエンコードして保存します。
+"""
+import json
+from typing import Any, Dict, Literal, Optional
+
+from pydantic import BaseModel, ConfigDict, ValidationError
+
+
+class CardColors(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    front: str = "blue"
+    back: str = "light-blue"
+
+
+class NotebookSettings(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    exclude_mastered: bool = False
+    default_direction: Literal["word-to-meaning", "meaning-to-word"] = "word-to-meaning"
+    default_order: Literal["sequential", "random"] = "sequential"
+    card_colors: CardColors = CardColors()
+
+
+def default_settings() -> Dict[str, Any]:
+    return NotebookSettings().model_dump()
+
+
+def load_settings(raw: Optional[Any]) -> Dict[str, Any]:
+    """
+    DBの値を検証済みの設定に変換
+    旧バージョンで二重にエンコードされた文字列や、欠けている項目・不正な値はデフォルトで補う
+    """
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except (json.JSONDecodeError, TypeError):
+            raw = None
+    if not isinstance(raw, dict):
+        return default_settings()
+    try:
+        return NotebookSettings.model_validate(raw).model_dump()
+    except ValidationError:
+        # 不正な項目だけをデフォルトに戻す
+        settings = default_settings()
+        for key, value in raw.items():
+            try:
+                settings = NotebookSettings.model_validate({**settings, key: value}).model_dump()
+            except ValidationError:
+                continue
+        return settings
+
+
+def merge_settings(current: Dict[str, Any], patch: Dict[str, Any]) -> Dict[str, Any]:
+    """部分更新（card_colorsなどのネストした項目もマージ）して検証する（不正な場合はValidationError）"""
+    merged = dict(current)
+    for key, value in patch.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = {**merged[key], **value}
+        else:
+            merged[key] = value
+    return NotebookSettings.model_validate(merged).model_dump()
@@ -0,0 +1,110 @@
+"""
+単語帳ごとの集計
+単語の追加・削除・進捗更新のたびに notebook_stats テーブルを差分で更新し、
+集計値を全単語を走査せずに取得できるようにします。
+"""
+from datetime import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from database import dialect_insert
+from models import Notebook, NotebookStats, Word
+
+STATS_FIELDS = ("word_count", "mastered_count", "correct_total", "wrong_total")
+
+
+def apply_stats_delta(
+    db: Session,
+    notebook_id: int,
+    word_count: int = 0,
+    mastered_count: int = 0,
+    correct_total: int = 0,
+    wrong_total: int = 0,
+    last_studied: Optional[datetime] = None,
+):
+    """集計に差分を加算（行がなければ作成、コミットは呼び出し側で行う）"""
+    if not (word_count or mastered_count or correct_total or wrong_total or last_studied):
+        return
+    stmt = dialect_insert(db, NotebookStats).values(
+        notebook_id=notebook_id,
+        word_count=word_count,
+        mastered_count=mastered_count,
+        correct_total=correct_total,
+        wrong_total=wrong_total,
+        last_studied=last_studied,
+    )
+    stats = NotebookStats.__table__.c
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[stats.notebook_id],
+        set_={
+            **{field: stats[field] + excluded[field] for field in STATS_FIELDS},
+            "last_studied": case(
+                (excluded.last_studied.is_(None), stats.last_studied),
+                (stats.last_studied.is_(None), excluded.last_studied),
+                (excluded.last_studied > stats.last_studied, excluded.last_studied),
+                else_=stats.last_studied,
+            ),
+        },
+    )
+    db.execute(stmt)
+
+
+def reset_stats(db: Session, notebook_id: int):
+    """進捗リセット後の集計（単語数以外を0にする）"""
+    db.execute(
+        update(NotebookStats)
+        .where(NotebookStats.notebook_id == notebook_id)
+        .values(mastered_count=0, correct_total=0, wrong_total=0, last_studied=None)
+    )
+
+
+def recompute_stats(db: Session, notebook_ids: Optional[Iterable[int]] = None):
+    """
+    単語テーブルから集計を作り直す（notebook_idsを省略すると全単語帳）
+    一括更新など差分を求めにくい操作の後に使う
+    """
+    if notebook_ids is not None:
+        notebook_ids = list(set(notebook_ids))
+        if not notebook_ids:
+            return
+
+    aggregate = (
+        select(
+            Notebook.id,
+            func.count(Word.id),
+            func.coalesce(func.sum(case((Word.mastered, 1), else_=0)), 0),
+            func.coalesce(func.sum(Word.correct_count), 0),
+            func.coalesce(func.sum(Word.wrong_count), 0),
+            func.max(Word.last_studied),
+        )
+        .select_from(Notebook)
+        .outerjoin(Word, Word.notebook_id == Notebook.id)
+        .group_by(Notebook.id)
+    )
+    clear = delete(NotebookStats)
+    if notebook_ids is not None:
+        aggregate = aggregate.where(Notebook.id.in_(notebook_ids))
+        clear = clear.where(NotebookStats.notebook_id.in_(notebook_ids))
+
+    db.execute(clear)
+    db.execute(
+        insert(NotebookStats).from_select(
+            ["notebook_id", *STATS_FIELDS, "last_studied"],
+            aggregate,
+        )
+    )
+
+
+def stats_to_dict(notebook_id: int, stats: Optional[NotebookStats]):
+    """レスポンス用の辞書（集計行がない場合は0として扱う）"""
+    values = {field: getattr(stats, field) if stats is not None else 0 for field in STATS_FIELDS}
+    attempts = values["correct_total"] + values["wrong_total"]
+    return {
+        "notebook_id": notebook_id,
+        **values,
+        "accuracy_rate": (values["correct_total"] / attempts * 100) if attempts > 0 else 0.0,
+        "last_studied": stats.last_studied if stats is not None else None,
+    }
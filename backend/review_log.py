@@ -0,0 +1,130 @@
+"""
+回答の履歴
+学習進捗の更新と同じトランザクションで、回答ごとの行をreview_logにまとめてINSERTします。
+保持期間（REVIEW_LOG_RETENTION_DAYS）を過ぎた行は、単語帳・日付ごとの集計（review_daily）に
+まとめてから削除するため、review_logの行数は一定の範囲に収まります。
+
+    python review_log.py                    # 保持期間を過ぎた履歴を集約
+    python review_log.py --retention-days 7
+"""
+import argparse
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import dialect_insert, get_engine
+from log import get_logger, setup_logging
+from models import ReviewDaily, ReviewLog
+from review_stats import invalidate_history
+
+logger = get_logger("review_log")
+
+
+def review_row(word_id: int, notebook_id: int, correct: bool, ts: datetime,
+               session_id: Optional[int] = None, latency_ms: Optional[int] = None) -> dict:
+    """review_logに追加する1行（負の回答時間は記録しない）"""
+    return {
+        "word_id": word_id,
+        "notebook_id": notebook_id,
+        "session_id": session_id,
+        "correct": correct,
+        "latency_ms": latency_ms if latency_ms is not None and latency_ms >= 0 else None,
+        "ts": ts,
+    }
+
+
+def record_reviews(db: Session, rows: Iterable[dict]):
+    """回答の履歴をまとめてINSERT（コミットは呼び出し側で行う）"""
+    rows = list(rows)
+    if rows:
+        db.execute(insert(ReviewLog), rows)
+        invalidate_history(db, {row["notebook_id"] for row in rows})
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def rollup_day(db: Session, day: date) -> int:
+    """1日分の履歴を単語帳ごとに集約してreview_dailyに加算し、集約した行を削除する"""
+    start, end = _day_start(day), _day_start(day + timedelta(days=1))
+    in_day = (ReviewLog.ts >= start) & (ReviewLog.ts < end)
+    aggregates = db.execute(
+        select(
+            ReviewLog.notebook_id,
+            func.count(),
+            func.sum(case((ReviewLog.correct, 1), else_=0)),
+            func.coalesce(func.sum(ReviewLog.latency_ms), 0),
+            func.count(ReviewLog.latency_ms),
+        )
+        .where(in_day)
+        .group_by(ReviewLog.notebook_id)
+    ).all()
+    if not aggregates:
+        return 0
+
+    stmt = dialect_insert(db, ReviewDaily)
+    daily = ReviewDaily.__table__.c
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[daily.notebook_id, daily.day],
+        set_={
+            name: daily[name] + stmt.excluded[name]
+            for name in ("reviews", "correct_count", "wrong_count", "latency_ms_total", "latency_count")
+        },
+    )
+    db.execute(stmt, [
+        {
+            "notebook_id": notebook_id,
+            "day": day,
+            "reviews": reviews,
+            "correct_count": correct,
+            "wrong_count": reviews - correct,
+            "latency_ms_total": latency_total,
+            "latency_count": latency_count,
+        }
+        for notebook_id, reviews, correct, latency_total, latency_count in aggregates
+    ])
+    db.execute(delete(ReviewLog).where(in_day))
+    return sum(row[1] for row in aggregates)
+
+
+def rollup_reviews(db: Session, retention_days: Optional[int] = None, today: Optional[date] = None) -> dict:
+    """
+    保持期間を過ぎた日の履歴を1日ずつ集約する（日ごとにコミットし、長時間ロックを保持しない）
+    履歴のない日は飛ばす
+    """
+    retention_days = settings.REVIEW_LOG_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = _day_start((today or date.today()) - timedelta(days=retention_days))
+
+    days = 0
+    rows = 0
+    since = None
+    while True:
+        query = select(func.min(ReviewLog.ts)).where(ReviewLog.ts < cutoff)
+        if since is not None:
+            query = query.where(ReviewLog.ts >= since)
+        oldest = db.execute(query).scalar()
+        if oldest is None:
+            break
+        day = oldest.date()
+        rows += rollup_day(db, day)
+        db.commit()
+        days += 1
+        since = _day_start(day + timedelta(days=1))
+
+    if days:
+        logger.info("回答の履歴を集約しました", extra={"days": days, "rows": rows, "before": cutoff.date()})
+    return {"rolled_up_days": days, "rolled_up_rows": rows, "before": cutoff.date()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="保持期間を過ぎた回答の履歴を日ごとの集計にまとめる")
+    parser.add_argument("--retention-days", type=int, default=None,
+                        help=f"履歴として残す日数（デフォルト: REVIEW_LOG_RETENTION_DAYS={settings.REVIEW_LOG_RETENTION_DAYS}）")
+    args = parser.parse_args()
+    setup_logging()
+    with Session(get_engine()) as db:
+        rollup_reviews(db, args.retention_days)
@@ -0,0 +1,195 @@
+"""
+学習履歴の統計
+回答の履歴（日ごとの集計review_dailyと、まだ集約していないreview_log）から、
+週・月ごとの集計、直近7日・30日の正答率、連続学習日数、単語帳ごとの内訳をSQLで計算します。
+結果は日付ごとにキャッシュし、回答が記録されたときに無効化します。
+"""
+from datetime import date, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import Date, Integer, case, cast, func, literal_column, select, union_all
+from sqlalchemy.orm import Session
+
+from cache import invalidate_on_commit
+from models import Notebook, ReviewDaily, ReviewLog
+
+# 集計の単位
+BUCKETS = ("day", "week", "month")
+
+# 移動平均の日数
+ROLLING_WINDOWS = (7, 30)
+
+
+def history_key(notebook_id: Optional[int], bucket: str, day: date) -> str:
+    scope = "all" if notebook_id is None else notebook_id
+    return f"stats-history:{scope}:{bucket}:{day.isoformat()}"
+
+
+def invalidate_history(db: Session, notebook_ids: Iterable[int]):
+    """回答を記録したトランザクションのコミット後に、今日の統計のキャッシュを無効化する"""
+    today = date.today()
+    keys = [history_key(notebook_id, bucket, today) for notebook_id in (None, *set(notebook_ids)) for bucket in BUCKETS]
+    invalidate_on_commit(db, *keys)
+
+
+def _log_day(dialect: str, ts):
+    if dialect == "postgresql":
+        return cast(ts, Date)
+    return func.date(ts, type_=Date)
+
+
+def _day_number(dialect: str, day):
+    """日付を連続した整数に変換（RANGEのウィンドウ、連続日数の計算用）"""
+    if dialect == "postgresql":
+        return day - literal_column("DATE '1970-01-01'", Date)
+    return cast(func.julianday(day), Integer)
+
+
+def _bucket_start(dialect: str, day, bucket: str):
+    """週（月曜始まり）・月の初日"""
+    if bucket == "day":
+        return day
+    if dialect == "postgresql":
+        # SELECTとGROUP BYで同じ式になるよう、単位はバインドパラメータではなくリテラルにする
+        return cast(func.date_trunc(literal_column(f"'{bucket}'"), day), Date)
+    if bucket == "week":
+        return func.date(day, "weekday 0", "-6 days", type_=Date)
+    return func.date(day, "start of month", type_=Date)
+
+
+def _accuracy(correct, reviews):
+    return correct * 100.0 / func.nullif(reviews, 0)
+
+
+def _source(dialect: str, notebook_id: Optional[int]):
+    """単語帳・日付ごとの回答数（集約済みの日と、まだ履歴のままの日を合わせる）"""
+    log_day = _log_day(dialect, ReviewLog.ts)
+    rolled_up = select(
+        ReviewDaily.notebook_id,
+        ReviewDaily.day.label("day"),
+        ReviewDaily.reviews.label("reviews"),
+        ReviewDaily.correct_count.label("correct"),
+    )
+    recent = select(
+        ReviewLog.notebook_id,
+        log_day.label("day"),
+        func.count().label("reviews"),
+        func.sum(case((ReviewLog.correct, 1), else_=0)).label("correct"),
+    ).group_by(ReviewLog.notebook_id, log_day)
+    if notebook_id is not None:
+        rolled_up = rolled_up.where(ReviewDaily.notebook_id == notebook_id)
+        recent = recent.where(ReviewLog.notebook_id == notebook_id)
+    return union_all(rolled_up, recent).subquery("source")
+
+
+def _totals(reviews, correct) -> dict:
+    reviews, correct = int(reviews), int(correct)
+    return {
+        "reviews": reviews,
+        "correct": correct,
+        "wrong": reviews - correct,
+        "accuracy": correct * 100.0 / reviews if reviews else 0.0,
+    }
+
+
+def build_history(db: Session, bucket: str = "day", notebook_id: Optional[int] = None,
+                  today: Optional[date] = None) -> dict:
+    """
+    統計を1つのクエリで計算する
+    単語帳・日付ごとの行に、日・期間・単語帳ごとの合計と直近N日の正答率をウィンドウ関数で付け、
+    Pythonでは行の重複を除いて並べるだけにする（行数は単語帳数×学習した日数）
+    """
+    dialect = db.get_bind().dialect.name
+    today = today or date.today()
+    source = _source(dialect, notebook_id)
+
+    # 集約済みの日にも後から履歴が追加されることがあるため、単語帳・日付ごとにまとめ直す
+    cells = (
+        select(
+            source.c.notebook_id,
+            source.c.day,
+            func.sum(source.c.reviews).label("reviews"),
+            func.sum(source.c.correct).label("correct"),
+        )
+        .group_by(source.c.notebook_id, source.c.day)
+        .subquery("cells")
+    )
+    day_number = _day_number(dialect, cells.c.day)
+    start = _bucket_start(dialect, cells.c.day, bucket)
+
+    def totals(name, **window):
+        return [
+            func.sum(cells.c.reviews).over(**window).label(f"{name}_reviews"),
+            func.sum(cells.c.correct).over(**window).label(f"{name}_correct"),
+        ]
+
+    # 直近N日（回答のない日を含む暦日）の正答率。RANGEの範囲にはその日までのすべての単語帳の行が入る
+    rolling_columns = []
+    for days in ROLLING_WINDOWS:
+        window = {"order_by": day_number, "range_": (-(days - 1), 0)}
+        rolling_columns.append(
+            _accuracy(func.sum(cells.c.correct).over(**window), func.sum(cells.c.reviews).over(**window))
+            .label(f"accuracy_{days}d")
+        )
+    rows = db.execute(
+        select(
+            cells.c.notebook_id,
+            Notebook.name,
+            cells.c.day,
+            start.label("start"),
+            *totals("day", partition_by=cells.c.day),
+            *totals("bucket", partition_by=start),
+            *totals("notebook", partition_by=cells.c.notebook_id),
+            *rolling_columns,
+            # 連続学習日数（日番号から学習した日の順位を引いた値が同じ日は連続している）
+            (day_number - func.dense_rank().over(order_by=day_number)).label("island"),
+        )
+        .outerjoin(Notebook, Notebook.id == cells.c.notebook_id)
+        .order_by(cells.c.day, cells.c.notebook_id)
+    ).all()
+
+    by_day, buckets, notebooks, streaks = {}, {}, {}, {}
+    for row in rows:
+        if row.day not in by_day:
+            by_day[row.day] = row
+            streak = streaks.setdefault(row.island, {"start": row.day, "days": 0})
+            streak["end"] = row.day
+            streak["days"] += 1
+        buckets.setdefault(row.start, row)
+        notebooks.setdefault(row.notebook_id, row)
+
+    longest = max(streaks.values(), key=lambda streak: (streak["days"], streak["end"]), default=None)
+    # 今日まだ学習していなくても、昨日まで続いていれば継続中とみなす
+    current = next((streak for streak in streaks.values() if streak["end"] >= today - timedelta(days=1)), None)
+
+    history = {
+        "bucket": bucket,
+        "notebook_id": notebook_id,
+        "date": today,
+        "buckets": [
+            {"start": bucket_start, **_totals(row.bucket_reviews, row.bucket_correct)}
+            for bucket_start, row in buckets.items()
+        ],
+        "rolling": [
+            {
+                "day": day,
+                "reviews": int(row.day_reviews),
+                **{f"accuracy_{days}d": getattr(row, f"accuracy_{days}d") for days in ROLLING_WINDOWS},
+            }
+            for day, row in by_day.items()
+        ],
+        "streak": {
+            "current": current["days"] if current else 0,
+            "longest": longest["days"] if longest else 0,
+            "longest_start": longest["start"] if longest else None,
+            "longest_end": longest["end"] if longest else None,
+        },
+    }
+
+    # 単語帳ごとの内訳（全単語帳の場合のみ。削除済みの単語帳はnameがNone）
+    if notebook_id is None:
+        history["notebooks"] = [
+            {"notebook_id": row.notebook_id, "name": row.name, **_totals(row.notebook_reviews, row.notebook_correct)}
+            for row in sorted(notebooks.values(), key=lambda row: (-row.notebook_reviews, row.notebook_id))
+        ]
+    return history
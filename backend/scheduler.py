@@ -0,0 +1,59 @@
+"""
+間隔反復（SM-2）による出題スケジュール
+回答の正誤から次回の出題日時（due_at）を計算します。
+"""
+from datetime import datetime, timedelta
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+
+# 正解・不正解をSM-2の回答品質（0〜5）に対応付ける
+CORRECT_QUALITY = 4
+WRONG_QUALITY = 2
+
+# 不正解だった単語を再出題するまでの時間
+RELEARN_DELAY = timedelta(minutes=10)
+
+
+def initial_state(now: datetime):
+    """新規・リセット後の単語のスケジュール"""
+    return {
+        "ease": DEFAULT_EASE,
+        "interval_days": 0.0,
+        "repetitions": 0,
+        "due_at": now,
+    }
+
+
+def schedule(ease, interval_days, repetitions, correct: bool, now: datetime):
+    """
+    現在のスケジュールと回答結果から次のスケジュールを計算
+    未設定（NULL）の値は初期値として扱う
+    """
+    ease = ease if ease is not None else DEFAULT_EASE
+    interval_days = interval_days or 0.0
+    repetitions = repetitions or 0
+
+    quality = CORRECT_QUALITY if correct else WRONG_QUALITY
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+
+    if not correct:
+        return {
+            "ease": ease,
+            "interval_days": 0.0,
+            "repetitions": 0,
+            "due_at": now + RELEARN_DELAY,
+        }
+
+    if repetitions == 0:
+        interval_days = 1.0
+    elif repetitions == 1:
+        interval_days = 6.0
+    else:
+        interval_days = interval_days * ease
+    return {
+        "ease": ease,
+        "interval_days": interval_days,
+        "repetitions": repetitions + 1,
+        "due_at": now + timedelta(days=interval_days),
+    }
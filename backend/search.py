@@ -0,0 +1,388 @@
+"""
+単語検索
+SQLiteではFTS5（trigramトークナイザ）の仮想テーブル、PostgreSQLではpg_trgmのGINインデックスを使い、
+単語・意味の部分一致検索（日本語を含む）をインデックス経由で行います。
+trigramが使えない2文字以下のクエリ（入力途中の検索や2文字の漢語など）は、単語の1文字・2文字の
+部分文字列（word_grams、トリガーで更新）と、意味のLIKE（単語のid順に一致するまで読む）で検索します。
+前方一致と部分文字列は、Pythonで小文字にして保存した単語（words.word_lower）から作ります。
+どちらもインデックスの順に必要な件数だけ読むため、一致する単語が多くても全件を並べ替えません。
+トリガー・インデックスはデータベースの組み込みの関数だけを使うため、sqlite3のCLIなど外部の接続からも書き込めます。
+部分文字列のトリガーの分だけ単語の追加・変更は重くなります（README.mdのベンチマークを参照）。
+"""
+import base64
+import json
+
+from sqlalchemy import and_, column, func, inspect, null, or_, select, table, text, tuple_
+from sqlalchemy.orm import Session
+
+from log import get_logger
+from models import Word, Notebook
+
+logger = get_logger("search")
+
+# trigramインデックスが使える最短のクエリ長
+TRIGRAM_MIN_LENGTH = 3
+
+# word_gramsに取り込む単語の先頭からの文字数
+# これより長い単語は、後ろの部分が2文字以下のクエリでは見つからない（意味は長さによらずLIKEで検索する）
+GRAM_INDEX_MAX_CHARS = 256
+
+# 検索結果の区分（前方一致、部分一致の順に並べる）
+PREFIX_TIER = 0
+CONTAINS_TIER = 1
+
+# 前方一致の範囲の上限（クエリの後ろに付けると、クエリで始まるどの文字列よりも大きくなる）
+PREFIX_END = "\U0010ffff"
+
+# 1ページあたりの件数（デフォルト・上限）
+SEARCH_DEFAULT_LIMIT = 50
+SEARCH_MAX_LIMIT = 200
+
+# 総件数を数える上限（これ以上は推定値として扱う）
+SEARCH_COUNT_CAP = 1000
+
+# インデックスが利用可能かどうか（None: 未確認。最初の検索時にデータベースを調べる）
+_index_ready = None
+_gram_index_ready = None
+
+words_fts = table("words_fts", column("rowid"))
+word_grams = table("word_grams", column("gram"), column("word_id"))
+
+SQLITE_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS words_fts USING fts5(
+        word, meaning, content='words', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS words_fts_ai AFTER INSERT ON words BEGIN
+        INSERT INTO words_fts(rowid, word, meaning) VALUES (new.id, new.word, new.meaning);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS words_fts_ad AFTER DELETE ON words BEGIN
+        INSERT INTO words_fts(words_fts, rowid, word, meaning) VALUES ('delete', old.id, old.word, old.meaning);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS words_fts_au AFTER UPDATE OF word, meaning ON words BEGIN
+        INSERT INTO words_fts(words_fts, rowid, word, meaning) VALUES ('delete', old.id, old.word, old.meaning);
+        INSERT INTO words_fts(rowid, word, meaning) VALUES (new.id, new.word, new.meaning);
+    END
+    """,
+]
+
+POSTGRES_TRGM_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_words_word_trgm ON words USING gin (word gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_words_meaning_trgm ON words USING gin (meaning gin_trgm_ops)",
+]
+
+
+def _sqlite_grams(row: str, source: str = "search_positions") -> str:
+    """
+    行（new・old・words）の小文字にした単語の1文字・2文字の部分文字列を重複なしで返すSELECT（空白を含むものは除く）
+    外側の文のON CONFLICTがトリガー内のINSERT OR IGNOREより優先されるため、重複はSELECTで除く
+    """
+    value = f"{row}.word_lower"
+    return " UNION ".join([
+        f"SELECT substr({value}, n, 1) AS gram, {row}.id AS word_id FROM {source} "
+        f"WHERE n <= length({value}) AND substr({value}, n, 1) <> ' '",
+        f"SELECT substr({value}, n, 2), {row}.id FROM {source} "
+        f"WHERE n < length({value}) AND instr(substr({value}, n, 2), ' ') = 0",
+    ])
+
+
+# SQLiteのトリガーでは再帰CTEを使えないため、文字の位置は search_positions テーブルから取る
+SQLITE_GRAM_DDL = [
+    "CREATE TABLE IF NOT EXISTS search_positions (n INTEGER PRIMARY KEY)",
+    f"""
+    WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < {GRAM_INDEX_MAX_CHARS})
+    INSERT OR IGNORE INTO search_positions (n) SELECT n FROM seq
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS word_grams (
+        gram TEXT NOT NULL, word_id INTEGER NOT NULL, PRIMARY KEY (gram, word_id)
+    ) WITHOUT ROWID
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS word_grams_ai AFTER INSERT ON words BEGIN
+        INSERT INTO word_grams (gram, word_id) {_sqlite_grams("new")};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS word_grams_ad AFTER DELETE ON words BEGIN
+        DELETE FROM word_grams WHERE word_id = old.id AND gram IN (SELECT gram FROM ({_sqlite_grams("old")}));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS word_grams_au AFTER UPDATE OF word_lower ON words
+    WHEN old.word_lower IS NOT new.word_lower BEGIN
+        DELETE FROM word_grams WHERE word_id = old.id AND gram IN (SELECT gram FROM ({_sqlite_grams("old")}));
+        INSERT INTO word_grams (gram, word_id) {_sqlite_grams("new")};
+    END
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_words_word_lower ON words (word_lower, id)",
+]
+
+SQLITE_GRAM_BACKFILL = (
+    f"INSERT OR IGNORE INTO word_grams (gram, word_id) {_sqlite_grams('words', 'words JOIN search_positions')}"
+)
+
+POSTGRES_GRAM_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS word_grams (
+        gram TEXT NOT NULL, word_id INTEGER NOT NULL, PRIMARY KEY (gram, word_id)
+    )
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION word_grams_of(v TEXT) RETURNS SETOF TEXT
+    LANGUAGE sql IMMUTABLE AS $$
+        SELECT DISTINCT substr(v, n, k)
+        FROM generate_series(1, least(length(v), {GRAM_INDEX_MAX_CHARS})) AS n,
+             generate_series(1, 2) AS k
+        WHERE n + k - 1 <= length(v) AND position(' ' in substr(v, n, k)) = 0
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION word_grams_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM word_grams
+            WHERE word_id = OLD.id AND gram IN (SELECT word_grams_of(OLD.word_lower));
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO word_grams (gram, word_id)
+            SELECT word_grams_of(NEW.word_lower), NEW.id ON CONFLICT DO NOTHING;
+        END IF;
+        RETURN NULL;
+    END
+    $$
+    """,
+    "DROP TRIGGER IF EXISTS word_grams_sync ON words",
+    """
+    CREATE TRIGGER word_grams_sync AFTER INSERT OR DELETE OR UPDATE OF word_lower ON words
+    FOR EACH ROW EXECUTE FUNCTION word_grams_sync()
+    """,
+    # 前方一致の範囲検索と並び順をバイト順にする（照合順序に依存させない）
+    'CREATE INDEX IF NOT EXISTS ix_words_word_lower ON words ((word_lower COLLATE "C"), id)',
+]
+
+POSTGRES_GRAM_BACKFILL = """
+    INSERT INTO word_grams (gram, word_id) SELECT word_grams_of(word_lower), id FROM words ON CONFLICT DO NOTHING
+"""
+
+
+def create_search_index(connection):
+    """検索インデックスを作成（既に存在する場合は何もしない。マイグレーションから呼び出す）"""
+    global _index_ready
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        created = "words_fts" not in inspect(connection).get_table_names()
+        for ddl in SQLITE_FTS_DDL:
+            connection.execute(text(ddl))
+        if created:
+            # 既存の単語をインデックスに取り込む
+            connection.execute(text("INSERT INTO words_fts(words_fts) VALUES ('rebuild')"))
+    elif dialect == "postgresql":
+        for ddl in POSTGRES_TRGM_DDL:
+            connection.execute(text(ddl))
+    # 作成したトランザクションがロールバックされる場合もあるため、次の検索時に確認し直す
+    _index_ready = None
+
+
+def search_index_ready(db: Session) -> bool:
+    """
+    検索インデックスが使えるかどうか（結果はプロセス内でキャッシュ）
+    FTS5やpg_trgmが使えない環境ではマイグレーションでインデックスが作られず、LIKE検索にフォールバックする
+    """
+    global _index_ready
+    if _index_ready is None:
+        dialect = db.get_bind().dialect.name
+        if dialect == "sqlite":
+            statement = text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'words_fts'")
+        elif dialect == "postgresql":
+            statement = text("SELECT 1 FROM pg_indexes WHERE indexname = 'ix_words_word_trgm'")
+        else:
+            _index_ready = False
+            return False
+        _index_ready = db.execute(statement).first() is not None
+        if not _index_ready:
+            logger.warning("検索インデックスがありません（LIKE検索を使用します）")
+    return _index_ready
+
+
+def create_gram_index(connection):
+    """
+    2文字以下のクエリ用の部分文字列のテーブルと前方一致のインデックスを作成
+    （既に存在する場合は何もしない。マイグレーションから呼び出す）
+    """
+    global _gram_index_ready
+    dialect = connection.dialect.name
+    if dialect not in ("sqlite", "postgresql"):
+        return
+    created = "word_grams" not in inspect(connection).get_table_names()
+    for ddl in SQLITE_GRAM_DDL if dialect == "sqlite" else POSTGRES_GRAM_DDL:
+        connection.execute(text(ddl))
+    if created:
+        # 既存の単語を取り込む
+        backfill = SQLITE_GRAM_BACKFILL if dialect == "sqlite" else POSTGRES_GRAM_BACKFILL
+        rows = connection.execute(text(backfill)).rowcount
+        logger.info("%d件の部分文字列を検索用に取り込みました", rows)
+    _gram_index_ready = None
+
+
+def drop_gram_index(connection):
+    """部分文字列のテーブル・トリガーと前方一致のインデックスを削除（作り直す前にマイグレーションから呼び出す）"""
+    global _gram_index_ready
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        statements = [f"DROP TRIGGER IF EXISTS {name}" for name in ("word_grams_ai", "word_grams_ad", "word_grams_au")]
+    elif dialect == "postgresql":
+        statements = [
+            "DROP TRIGGER IF EXISTS word_grams_sync ON words",
+            "DROP FUNCTION IF EXISTS word_grams_sync()",
+            "DROP FUNCTION IF EXISTS word_grams_of(TEXT, TEXT)",
+            "DROP FUNCTION IF EXISTS word_grams_of(TEXT)",
+        ]
+    else:
+        return
+    statements += ["DROP INDEX IF EXISTS ix_words_word_lower", "DROP TABLE IF EXISTS word_grams"]
+    for statement in statements:
+        connection.execute(text(statement))
+    _gram_index_ready = None
+
+
+def gram_index_ready(db: Session) -> bool:
+    """2文字以下のクエリ用のテーブルが使えるかどうか（結果はプロセス内でキャッシュ）"""
+    global _gram_index_ready
+    if _gram_index_ready is None:
+        _gram_index_ready = db.get_bind().dialect.name in ("sqlite", "postgresql") and (
+            "word_grams" in inspect(db.connection()).get_table_names()
+        )
+    return _gram_index_ready
+
+
+def _escape_like(q: str) -> str:
+    return q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fts_phrase(q: str) -> str:
+    """FTS5のフレーズクエリとしてエスケープ"""
+    return '"' + q.replace('"', '""') + '"'
+
+
+def _word_key(dialect: str):
+    """前方一致の判定と並び順に使う、小文字にした単語（PostgreSQLではバイト順で比較する）"""
+    return Word.word_lower.collate("C") if dialect == "postgresql" else Word.word_lower
+
+
+def _prefix_condition(key, q: str):
+    return and_(key >= q, key < q + PREFIX_END)
+
+
+def _prefix_query(db: Session, q: str, after, limit: int):
+    """単語が前方一致する単語を (単語, id) 順に取得（完全一致が先頭になる）"""
+    key = _word_key(db.get_bind().dialect.name)
+    query = (
+        select(Word, Notebook.name, key.label("key"))
+        .join(Notebook, (Notebook.id == Word.notebook_id) & Notebook.deleted_at.is_(None))
+    )
+    if after is None:
+        query = query.where(_prefix_condition(key, q))
+    else:
+        # インデックスの範囲の下限をカーソルの単語にする（深いページでも先頭から読み飛ばさない）
+        query = query.where(key >= after[0], key < q + PREFIX_END, tuple_(key, Word.id) > tuple_(*after))
+    return query.order_by(key, Word.id).limit(limit)
+
+
+def _contains_query(db: Session, q: str, after_id, limit: int):
+    """単語・意味に部分一致する（単語が前方一致しない）単語をid順に取得"""
+    dialect = db.get_bind().dialect.name
+    key = _word_key(dialect)
+    not_prefix = or_(Word.word_lower.is_(None), ~_prefix_condition(key, q))
+    pattern = f"%{_escape_like(q)}%"
+    if len(q) < TRIGRAM_MIN_LENGTH and not any(c.isspace() for c in q) and gram_index_ready(db):
+        # 単語は1文字・2文字の部分文字列、意味はLIKEで、単語のid順に一致するまで読む
+        word_id = Word.id
+        query = select(Word, Notebook.name, null().label("key")).where(
+            Word.id.in_(select(word_grams.c.word_id).where(word_grams.c.gram == q))
+            | Word.meaning.ilike(pattern, escape="\\")
+        )
+    elif len(q) >= TRIGRAM_MIN_LENGTH and dialect == "sqlite" and search_index_ready(db):
+        # FTS5の一致をrowid順に読み、必要な件数に達したところで止める
+        word_id = words_fts.c.rowid
+        query = (
+            select(Word, Notebook.name, null().label("key"))
+            .select_from(words_fts)
+            .join(Word, Word.id == word_id)
+            .where(text("words_fts MATCH :match").bindparams(match=_fts_phrase(q)))
+        )
+    else:
+        # PostgreSQLではpg_trgmのインデックスを使う
+        word_id = Word.id
+        query = select(Word, Notebook.name, null().label("key")).where(
+            Word.word.ilike(pattern, escape="\\") | Word.meaning.ilike(pattern, escape="\\")
+        )
+    query = query.join(Notebook, (Notebook.id == Word.notebook_id) & Notebook.deleted_at.is_(None)).where(not_prefix)
+    if after_id is not None:
+        query = query.where(word_id > after_id)
+    return query.order_by(word_id).limit(limit)
+
+
+def clamp_limit(limit: int) -> int:
+    """ページサイズを1〜SEARCH_MAX_LIMITに収める"""
+    return max(1, min(limit, SEARCH_MAX_LIMIT))
+
+
+def encode_cursor(tier: int, key, word_id: int) -> str:
+    """(区分, 単語, id) をURLセーフな不透明カーソルに変換"""
+    raw = json.dumps([tier, key, word_id], separators=(",", ":"), ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """カーソルを (区分, 単語, id) に戻す（不正な場合はValueError）"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        tier, key, word_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if tier not in (PREFIX_TIER, CONTAINS_TIER) or (tier == PREFIX_TIER and not isinstance(key, str)):
+            raise ValueError("invalid cursor")
+        return tier, key, int(word_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("invalid cursor") from e
+
+
+def search_words(db: Session, q: str, limit: int = SEARCH_DEFAULT_LIMIT, after=None):
+    """
+    (Word, 単語帳名, 区分, 単語) のリストを返す
+    単語が前方一致するもの（単語順）、部分一致するもの（id順）の順に並べる。
+    並び順は単語とidだけで決まるため、ページの間に単語が変更されても同じ単語を2回返さない。
+    afterに (区分, 単語, id) を渡すと、その次の行から取得する（キーセットページネーション）
+    """
+    tier, key, after_id = after if after is not None else (PREFIX_TIER, None, None)
+    q = q.lower()
+    rows = []
+    if tier == PREFIX_TIER:
+        prefix_after = (key, after_id) if after is not None else None
+        rows = [
+            (word, name, PREFIX_TIER, word_key)
+            for word, name, word_key in db.execute(_prefix_query(db, q, prefix_after, limit)).all()
+        ]
+        after_id = None
+    if len(rows) < limit:
+        rows += [
+            (word, name, CONTAINS_TIER, None)
+            for word, name, _ in db.execute(_contains_query(db, q, after_id, limit - len(rows))).all()
+        ]
+    return rows
+
+
+def count_matches(db: Session, q: str, cap: int = SEARCH_COUNT_CAP) -> int:
+    """一致件数を数える（cap件で打ち切り）"""
+    q = q.lower()
+    total = 0
+    for query in (_prefix_query(db, q, None, cap), _contains_query(db, q, None, cap)):
+        limited = query.with_only_columns(Word.id).subquery()
+        total += db.execute(select(func.count()).select_from(limited)).scalar_one()
+    return min(total, cap)
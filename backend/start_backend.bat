@@ -4,6 +4,9 @@ cd /d "%~dp0"
 echo Installing dependencies...
 py -m pip install -r requirements.txt
 echo.
+echo Migrating database...
+py migrate.py
+echo.
 echo Starting backend server on http://localhost:8000
 echo Press Ctrl+C to stop the server
 echo.
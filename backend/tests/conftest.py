@@ -0,0 +1,36 @@
+"""
+テスト用の設定
+アプリのモジュールは設定を読み込み時に確定するため、インポートする前に一時ファイルのSQLiteを指定する
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+_tmp_dir = tempfile.mkdtemp(prefix="vocadeck-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp_dir}/test.db"
+os.environ["CACHE_BACKEND"] = "memory"
+os.environ["AUTO_MIGRATE"] = "true"
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from main import app
+
+    # lifespanでマイグレーションを適用する
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def notebook_id(client):
+    response = client.post("/api/notebooks", json={"name": "テスト"})
+    assert response.status_code == 200
+    return response.json()["id"]
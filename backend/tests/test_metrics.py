@@ -0,0 +1,25 @@
+"""/metrics のSQLの計測値"""
+import re
+
+
+def route_counter(client, name, method, route):
+    text = client.get("/metrics").text
+    pattern = rf'^{name}\{{method="{method}",route="{re.escape(route)}",status="200"\}} (\d+)$'
+    return sum(int(value) for value in re.findall(pattern, text, re.MULTILINE))
+
+
+def test_rows_returned_counts_fetched_rows(client, notebook_id):
+    for i in range(3):
+        client.post("/api/words", json={"notebook_id": notebook_id, "word": f"metric{i}", "meaning": "計測"})
+    before = route_counter(client, "http_request_db_rows_returned_total", "GET", "/api/words")
+    response = client.get("/api/words", params={"notebook_id": notebook_id})
+    assert response.status_code == 200
+    after = route_counter(client, "http_request_db_rows_returned_total", "GET", "/api/words")
+    # 単語3行（と単語帳の確認などの行）
+    assert after - before >= 3
+
+
+def test_rows_affected_counts_changed_rows(client, notebook_id):
+    before = route_counter(client, "http_request_db_rows_affected_total", "POST", "/api/words")
+    client.post("/api/words", json={"notebook_id": notebook_id, "word": "affected", "meaning": "計測"})
+    assert route_counter(client, "http_request_db_rows_affected_total", "POST", "/api/words") > before
@@ -0,0 +1,13 @@
+"""マイグレーションで作ったスキーマとモデルの比較（モデルを変更したらマイグレーションも追加する）"""
+from sqlalchemy import inspect
+
+from database import Base, get_engine
+
+
+def test_migrations_create_model_schema(client):
+    inspector = inspect(get_engine())
+    for table in Base.metadata.sorted_tables:
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        assert columns == {column.name for column in table.columns}, table.name
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        assert {index.name for index in table.indexes} <= indexes, table.name
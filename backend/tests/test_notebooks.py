@@ -0,0 +1,22 @@
+"""単語帳一覧のキャッシュと集計"""
+
+
+def listed(response, notebook_id):
+    assert response.status_code == 200
+    return next(notebook for notebook in response.json() if notebook["id"] == notebook_id)
+
+
+def test_cached_list_does_not_serve_stale_stats(client, notebook_id):
+    first = client.get("/api/notebooks")
+    etag = first.headers["etag"]
+    assert listed(first, notebook_id)["stats"] is None
+
+    word = client.post("/api/words", json={"notebook_id": notebook_id, "word": "dog", "meaning": "犬"}).json()
+    assert client.put(f"/api/words/{word['id']}/progress", json={"correct": True}).status_code == 200
+
+    # 回答しても一覧のキャッシュは無効化されないが、集計を含まないため古い値を返すことはない
+    assert client.get("/api/notebooks", headers={"If-None-Match": etag}).status_code == 304
+    stats = listed(client.get("/api/notebooks", params={"include_stats": "true"}), notebook_id)["stats"]
+    assert stats["word_count"] == 1
+    assert stats["correct_total"] == 1
+    assert stats["accuracy_rate"] == 100.0
@@ -0,0 +1,55 @@
+"""単語検索（小文字にした単語の前方一致・2文字以下の検索）"""
+import sqlite3
+
+from config import settings
+
+
+def search_ids(client, q):
+    response = client.get("/api/words/search", params={"q": q, "limit": 200})
+    assert response.status_code == 200
+    return [item["id"] for item in response.json()]
+
+
+def add_word(client, notebook_id, word, meaning):
+    response = client.post("/api/words", json={"notebook_id": notebook_id, "word": word, "meaning": meaning})
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def test_non_ascii_case_insensitive(client, notebook_id):
+    word_id = add_word(client, notebook_id, "Ñandú", "レア")
+    for q in ("ñ", "ÑA", "ñandú", "dú"):
+        assert word_id in search_ids(client, q)
+
+
+def test_short_query_matches_meaning(client, notebook_id):
+    word_id = add_word(client, notebook_id, "zzq", "鳳凰の尾")
+    assert word_id in search_ids(client, "鳳凰")
+    assert word_id in search_ids(client, "尾")
+
+
+def test_renamed_word_is_reindexed(client, notebook_id):
+    word_id = add_word(client, notebook_id, "Übung", "練習")
+    response = client.post("/api/words/batch", json={"notebook_id": notebook_id, "operations": [
+        {"op": "update", "id": word_id, "word": "Öl"},
+    ]})
+    assert response.status_code == 200
+    assert word_id in search_ids(client, "ö")
+    assert word_id not in search_ids(client, "üb")
+
+    response = client.post(
+        "/api/words/import", json={"notebook_id": notebook_id, "text": "- ÖL: 油", "mode": "update"}
+    )
+    assert response.json()["updated_count"] == 1
+    assert word_id in search_ids(client, "öl")
+
+
+def test_plain_connection_can_write(client, notebook_id):
+    # トリガー・インデックスはアプリが登録した関数を使わない
+    path = settings.DATABASE_URL.removeprefix("sqlite:///")
+    with sqlite3.connect(path) as connection:
+        connection.execute(
+            "INSERT INTO words (word, word_lower, meaning, notebook_id, version) VALUES ('Qoph', 'qoph', 'x', ?, 0)",
+            (notebook_id,)
+        )
+    assert search_ids(client, "qo")
@@ -0,0 +1,29 @@
+"""学習履歴の統計"""
+
+
+def answer(client, notebook_id, word, correct):
+    created = client.post("/api/words", json={"notebook_id": notebook_id, "word": word, "meaning": "意味"}).json()
+    assert client.put(f"/api/words/{created['id']}/progress", json={"correct": correct}).status_code == 200
+
+
+def test_history_totals_per_day_and_notebook(client, notebook_id):
+    other = client.post("/api/notebooks", json={"name": "もう1つ"}).json()["id"]
+    before = client.get("/api/stats/history").json()
+    answer(client, notebook_id, "red", True)
+    answer(client, notebook_id, "blue", False)
+    answer(client, other, "green", True)
+
+    # 回答を記録するとキャッシュは無効化される
+    history = client.get("/api/stats/history", params={"bucket": "week"}).json()
+    today = history["rolling"][-1]
+    reviews_before = before["rolling"][-1]["reviews"] if before["rolling"] else 0
+    assert today["reviews"] == reviews_before + 3
+    assert history["streak"]["current"] == 1
+    assert sum(bucket["reviews"] for bucket in history["buckets"]) == sum(row["reviews"] for row in history["rolling"])
+    notebooks = {row["notebook_id"]: row for row in history["notebooks"]}
+    assert (notebooks[notebook_id]["reviews"], notebooks[notebook_id]["correct"]) == (2, 1)
+    assert (notebooks[other]["reviews"], notebooks[other]["correct"]) == (1, 1)
+
+    single = client.get("/api/stats/history", params={"notebook_id": other}).json()
+    assert [row["reviews"] for row in single["rolling"]] == [1]
+    assert "notebooks" not in single
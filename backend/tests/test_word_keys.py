@@ -0,0 +1,76 @@
+"""単語を削除・移動・変更したときの重複判定のキー（word_key）の付け直し"""
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database import get_engine
+from models import Word
+
+
+def notebook_words(notebook_id):
+    with Session(get_engine()) as db:
+        return db.execute(
+            select(Word.word, Word.meaning, Word.word_key).where(Word.notebook_id == notebook_id).order_by(Word.id)
+        ).all()
+
+
+def add_word(client, notebook_id, word, meaning):
+    response = client.post("/api/words", json={"notebook_id": notebook_id, "word": word, "meaning": meaning})
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def import_text(client, notebook_id, text, mode):
+    response = client.post("/api/words/import", json={"notebook_id": notebook_id, "text": text, "mode": mode})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_delete_then_import_skip(client, notebook_id):
+    first = add_word(client, notebook_id, "cat", "1")
+    add_word(client, notebook_id, "Cat", "2")
+    assert client.delete(f"/api/words/{first}").status_code == 200
+    assert notebook_words(notebook_id) == [("Cat", "2", "cat")]
+
+    result = import_text(client, notebook_id, "- cat: 3", "skip")
+    assert result["added_count"] == 0
+    assert result["duplicate_count"] == 1
+    assert notebook_words(notebook_id) == [("Cat", "2", "cat")]
+
+
+def test_delete_then_import_update(client, notebook_id):
+    first = add_word(client, notebook_id, "cat", "1")
+    add_word(client, notebook_id, "Cat", "2")
+    add_word(client, notebook_id, "ＣＡＴ", "3")
+    assert client.delete(f"/api/words/{first}").status_code == 200
+
+    result = import_text(client, notebook_id, "- CAT: 4", "update")
+    assert result["added_count"] == 0
+    assert result["updated_count"] == 1
+    # 残っているうち最も古い単語がキーを受け継ぐ
+    assert notebook_words(notebook_id) == [("CAT", "4", "cat"), ("ＣＡＴ", "3", None)]
+
+
+def test_batch_delete_and_rename(client, notebook_id):
+    first = add_word(client, notebook_id, "dog", "1")
+    add_word(client, notebook_id, "Dog", "2")
+    second = add_word(client, notebook_id, "bird", "3")
+    add_word(client, notebook_id, "BIRD", "4")
+    response = client.post("/api/words/batch", json={"notebook_id": notebook_id, "operations": [
+        {"op": "delete", "id": first},
+        {"op": "update", "id": second, "word": "fish"},
+    ]})
+    assert response.status_code == 200
+    assert all(result["ok"] for result in response.json()["results"])
+    assert notebook_words(notebook_id) == [("Dog", "2", "dog"), ("fish", "3", "fish"), ("BIRD", "4", "bird")]
+
+
+def test_move_frees_key_in_source(client, notebook_id):
+    target_id = client.post("/api/notebooks", json={"name": "移動先"}).json()["id"]
+    first = add_word(client, notebook_id, "cat", "1")
+    add_word(client, notebook_id, "CAT", "2")
+    response = client.post("/api/words/bulk-update", json={
+        "word_ids": [first], "action": "move", "target_notebook_id": target_id
+    })
+    assert response.status_code == 200
+    assert notebook_words(notebook_id) == [("CAT", "2", "cat")]
+    assert notebook_words(target_id) == [("cat", "1", "cat")]
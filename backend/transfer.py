@@ -0,0 +1,321 @@
+"""
+単語帳のエクスポート・インポート（CSV / JSONL / Parquet）
+エクスポートはサーバー側カーソル（yield_per）で一定件数ずつ読み出しながら書き出すため、
+単語帳の大きさにかかわらずメモリ使用量は一定です。
+インポートは一定件数ごとにまとめてINSERT（executemany）し、単語帳に既にある単語はmodeに従って扱います。
+Parquetにはpyarrowが必要です（インストールされていない場合はParquetのみ使えません）。
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, get_engine
+from importer import IMPORT_BATCH_SIZE, SAMPLE_LIMIT, ImportResult, insert_words
+from models import Word
+from scheduler import initial_state
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# エクスポートで1回に読み出す件数（Parquetでは1つの行グループになる）
+EXPORT_BATCH_SIZE = 5000
+
+# エクスポート・インポートする列（idと単語帳は含めず、インポート先で割り当てる）
+COLUMNS = (
+    "word", "meaning",
+    "correct_count", "wrong_count", "last_studied", "mastered",
+    "ease", "interval_days", "repetitions", "due_at",
+)
+
+# 形式ごとの (Content-Type, 拡張子)
+FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "jsonl": ("application/x-ndjson", ".jsonl"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+
+
+def parquet_available() -> bool:
+    return pq is not None
+
+
+def _parquet_schema():
+    return pa.schema([
+        ("word", pa.string()),
+        ("meaning", pa.string()),
+        ("correct_count", pa.int64()),
+        ("wrong_count", pa.int64()),
+        ("last_studied", pa.timestamp("us")),
+        ("mastered", pa.bool_()),
+        ("ease", pa.float64()),
+        ("interval_days", pa.float64()),
+        ("repetitions", pa.int64()),
+        ("due_at", pa.timestamp("us")),
+    ])
+
+
+# --- エクスポート ---
+
+def iter_word_batches(notebook_id: int, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[list]:
+    """単語帳の単語をid順にbatch_size件ずつ返す（ストリーミング中だけ接続を使う）"""
+    get_engine()
+    with SessionLocal() as db:
+        result = db.execute(
+            select(*(Word.__table__.c[name] for name in COLUMNS))
+            .where(Word.notebook_id == notebook_id)
+            .order_by(Word.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for partition in result.partitions():
+            yield partition
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _csv_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return _isoformat(value)
+
+
+def write_csv(batches: Iterable[list]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for rows in batches:
+        for row in rows:
+            writer.writerow([_csv_cell(value) for value in row])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def write_jsonl(batches: Iterable[list]) -> Iterator[bytes]:
+    for rows in batches:
+        yield "".join(
+            json.dumps(dict(zip(COLUMNS, map(_isoformat, row))), ensure_ascii=False) + "\n"
+            for row in rows
+        ).encode("utf-8")
+
+
+class _ChunkSink:
+    """ParquetWriterの書き込み先（書き込まれたバイト列を順に取り出す）"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def write_parquet(batches: Iterable[list]) -> Iterator[bytes]:
+    schema = _parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in batches:
+            columns = list(zip(*rows)) if rows else [[] for _ in COLUMNS]
+            writer.write_batch(pa.record_batch([list(values) for values in columns], schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "parquet": write_parquet}
+
+
+def export_notebook(notebook_id: int, format: str) -> Iterator[bytes]:
+    """単語帳を指定した形式のバイト列として少しずつ返す"""
+    return WRITERS[format](iter_word_batches(notebook_id))
+
+
+# --- インポート ---
+
+def read_csv(file) -> Iterator:
+    """CSVの行を辞書として返す（BOM付きのUTF-8にも対応）"""
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        yield from csv.DictReader(text)
+    finally:
+        # 元のファイルは呼び出し側でクローズするため、ラッパーからは切り離す
+        text.detach()
+
+
+def read_jsonl(file) -> Iterator:
+    """JSONLの行を辞書として返す（不正な行はValueError）"""
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", errors="replace")
+    try:
+        for line in text:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield ValueError("JSONとして読み込めません")
+                continue
+            yield record if isinstance(record, dict) else ValueError("オブジェクトではありません")
+    finally:
+        text.detach()
+
+
+def read_parquet(file, batch_size: int = IMPORT_BATCH_SIZE) -> Iterator:
+    """Parquetの行を辞書として返す（行グループ単位で読み込む）"""
+    parquet_file = pq.ParquetFile(file)
+    columns = [name for name in COLUMNS if name in parquet_file.schema_arrow.names]
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield from batch.to_pylist()
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl, "parquet": read_parquet}
+
+
+def _blank(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _parse_int(value, default: int) -> int:
+    if _blank(value):
+        return default
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError
+    number = int(value)
+    if number < 0:
+        raise ValueError
+    return number
+
+
+def _parse_float(value, default: float) -> float:
+    return default if _blank(value) else float(value)
+
+
+def _parse_bool(value) -> bool:
+    if _blank(value):
+        return False
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return value != 0
+    lowered = str(value).strip().lower()
+    if lowered in ("true", "1", "yes"):
+        return True
+    if lowered in ("false", "0", "no"):
+        return False
+    raise ValueError
+
+
+def _parse_datetime(value, default):
+    if _blank(value):
+        return default
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    return datetime.fromisoformat(str(value).strip()).replace(tzinfo=None)
+
+
+def parse_record(record: dict, notebook_id: int, now: datetime) -> dict:
+    """1行分の値を検証してINSERTするパラメータに変換（不正な値はValueErrorでスキップ理由を返す）"""
+    word_text = record.get("word")
+    meaning_text = record.get("meaning")
+    if not isinstance(word_text, str) or not isinstance(meaning_text, str) \
+            or not word_text.strip() or not meaning_text.strip():
+        raise ValueError("空の単語または意味")
+
+    schedule = initial_state(now)
+    values = {"word": word_text.strip(), "meaning": meaning_text.strip(), "notebook_id": notebook_id}
+    parsers = {
+        "correct_count": lambda value: _parse_int(value, 0),
+        "wrong_count": lambda value: _parse_int(value, 0),
+        "last_studied": lambda value: _parse_datetime(value, None),
+        "mastered": _parse_bool,
+        "ease": lambda value: _parse_float(value, schedule["ease"]),
+        "interval_days": lambda value: _parse_float(value, schedule["interval_days"]),
+        "repetitions": lambda value: _parse_int(value, schedule["repetitions"]),
+        "due_at": lambda value: _parse_datetime(value, schedule["due_at"]),
+    }
+    for name, parse in parsers.items():
+        try:
+            values[name] = parse(record.get(name))
+        except (TypeError, ValueError):
+            raise ValueError(f"{name}の値が不正")
+    return values
+
+
+def import_records(
+    db: Session,
+    notebook_id: int,
+    records: Iterable,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    commit_each_batch: bool = False,
+    on_progress: Optional[Callable[[ImportResult], None]] = None,
+    mode: str = "skip",
+) -> ImportResult:
+    """
+    READERSが返す行を検証してbatch_size件ごとにINSERTする
+    commit_each_batch=Trueの場合はバッチごとにコミットする（長時間ロックを保持しない）
+    modeは単語帳に同じ単語がある場合の扱い（importer.IMPORT_MODES。updateでは進捗も上書きする）
+    """
+    result = ImportResult()
+    batch = []
+    now = datetime.now()
+
+    def flush():
+        if batch:
+            result.add_batch(*insert_words(db, notebook_id, batch, mode))
+            batch.clear()
+        if commit_each_batch:
+            db.commit()
+        if on_progress is not None:
+            on_progress(result)
+
+    for row_num, record in enumerate(records, 1):
+        result.processed_lines = row_num
+        try:
+            if isinstance(record, ValueError):
+                raise record
+            values = parse_record(record, notebook_id, now)
+        except ValueError as e:
+            result.skipped_count += 1
+            if len(result.skipped_sample) < SAMPLE_LIMIT:
+                result.skipped_sample.append({"line": row_num, "reason": str(e)})
+            continue
+
+        batch.append(values)
+        if len(batch) >= batch_size:
+            flush()
+
+    flush()
+    return result
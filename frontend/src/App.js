@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import WordForm from './components/WordForm';
 import WordList from './components/WordList';
 import FlashCard from './components/FlashCard';
@@ -15,6 +15,16 @@ import ImportWords from './components/ImportWords';
 import { API_URL } from './config';
 import './App.css';
 
+// 差分（変更された単語・削除された単語のID）を単語リストに反映（id順を保つ）
+const mergeChanges = (words, changes) => {
+  const changed = new Map(changes.words.map((w) => [w.id, w]));
+  const deleted = new Set(changes.deleted);
+  const merged = words
+    .filter((w) => !deleted.has(w.id) && !changed.has(w.id))
+    .concat(changes.words);
+  return merged.sort((a, b) => a.id - b.id);
+};
+
 function App() {
   const [words, setWords] = useState([]);
   const [editingWord, setEditingWord] = useState(null);
@@ -62,20 +72,34 @@ function App() {
     }
   };
 
-  // 単語一覧を取得（単語帳IDでフィルタリング）
+  // 単語帳ごとに取得済みの単語とバージョン（差分同期用）
+  const syncedNotebooks = useRef({});
+
+  // 単語一覧を取得（前回取得したバージョンからの差分のみ）
   const fetchWords = async () => {
     if (!selectedNotebookId) {
       setWords([]);
       setLoading(false);
       return;
     }
+    const notebookId = selectedNotebookId;
+    const synced = syncedNotebooks.current[notebookId];
     try {
-      const response = await fetch(`${API_URL}/api/words?notebook_id=${selectedNotebookId}`);
+      const response = await fetch(
+        `${API_URL}/api/notebooks/${notebookId}/changes?since=${synced ? synced.version : 0}`,
+        { headers: synced ? { 'If-None-Match': `"v${synced.version}"` } : {} }
+      );
+      if (response.status === 304) {
+        setWords(synced.words);
+        return;
+      }
       if (!response.ok) {
         throw new Error(`サーバーエラー: ${response.status}`);
       }
-      const data = await response.json();
-      setWords(data);
+      const changes = await response.json();
+      const merged = changes.full || !synced ? changes.words : mergeChanges(synced.words, changes);
+      syncedNotebooks.current[notebookId] = { version: changes.version, words: merged };
+      setWords(merged);
     } catch (error) {
       console.error('単語の取得に失敗しました:', error);
       alert('バックエンドサーバーに接続できません。バックエンドが起動しているか確認してください。\n\n起動方法:\n1. ターミナルで backend フォルダに移動\n2. uvicorn main:app --reload を実行');
@@ -88,6 +88,7 @@ function ImportWords({ notebookId, onImportComplete }) {
         const result = await response.json();
         showMessage(
           `${result.added_count}件の単語を追加しました` +
+          (result.duplicate_count > 0 ? `（登録済みの${result.duplicate_count}件は追加しませんでした）` : '') +
           (result.skipped_count > 0 ? `（${result.skipped_count}件スキップ）` : ''),
           'success'
         );